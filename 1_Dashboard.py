@@ -2,10 +2,15 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from scripts import processador
+from scripts import processador, painel_diagnostico, series_precos, snapshot_historico, gestao_dados
 
 st.set_page_config(page_title="SIO | Dashboard de Análise", layout="wide")
 
+# --- Painel de Diagnóstico (oculto: acessível por ?diagnostico=1) ---
+if st.query_params.get("diagnostico") == "1":
+    painel_diagnostico.exibir()
+    st.stop()
+
 # --- Lógica do Botão de Limpeza ---
 if 'confirmando_limpeza' not in st.session_state:
     st.session_state.confirmando_limpeza = False
@@ -20,7 +25,6 @@ def executar_limpeza_geral():
     """Chama a nova função de limpeza completa do processador."""
     if processador.limpar_banco_de_dados_completo():
         st.success("Limpeza geral do banco de dados concluída! A aplicação será recarregada.")
-        st.cache_data.clear() # Limpa o cache do Streamlit
     else:
         st.error("Ocorreu um erro ao tentar limpar o banco de dados.")
     
@@ -41,8 +45,9 @@ with st.expander("Opções de Gerenciamento de Dados"):
     )
     if st.session_state.confirmando_limpeza:
         st.warning(
-            "**ATENÇÃO: AÇÃO IRREVERSÍVEL!** Você tem certeza que deseja apagar **TODOS** os dados do sistema? "
-            "Isso inclui todos os orçamentos, a base de custos, todos os mapeamentos e observações."
+            "**ATENÇÃO!** Você tem certeza que deseja apagar **TODOS** os dados do sistema? "
+            "Isso inclui todos os orçamentos, a base de custos, todos os mapeamentos e observações. "
+            "Um backup é criado antes e pode ser restaurado abaixo."
         )
         col1, col2 = st.columns(2)
         with col1:
@@ -50,19 +55,95 @@ with st.expander("Opções de Gerenciamento de Dados"):
         with col2:
             st.button("Cancelar", on_click=desativar_confirmacao, use_container_width=True)
 
+    st.divider()
+    st.markdown(f"**Backups** (os {gestao_dados.MAX_BACKUPS} mais recentes são mantidos)")
+    if st.button("Criar backup agora", use_container_width=True):
+        with st.spinner("Copiando o banco de dados..."):
+            caminho_backup = gestao_dados.criar_backup("manual")
+        st.success(f"Backup criado: {caminho_backup.name}" if caminho_backup else "Ainda não há banco de dados para copiar.")
+    backups = gestao_dados.listar_backups()
+    if backups:
+        st.dataframe(
+            pd.DataFrame(backups),
+            column_config={
+                "arquivo": "Arquivo",
+                "criado_em": st.column_config.DatetimeColumn("Criado em", format="D/MM/YYYY HH:mm:ss"),
+                "motivo": "Motivo",
+                "tamanho_mb": st.column_config.NumberColumn("Tamanho", format="%.1f MB"),
+            },
+            hide_index=True, use_container_width=True
+        )
+        backup_escolhido = st.selectbox("Backup para restaurar:", options=[b["arquivo"] for b in backups])
+        if st.checkbox("Confirmo que quero substituir os dados atuais por este backup (o estado atual também é salvo em backup)."):
+            if st.button("Restaurar backup", type="primary", use_container_width=True):
+                try:
+                    with st.spinner("Restaurando..."):
+                        gestao_dados.restaurar_backup(backup_escolhido)
+                    st.session_state.mensagem_backup = f"Banco restaurado a partir de {backup_escolhido}."
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+    if 'mensagem_backup' in st.session_state:
+        st.success(st.session_state.pop('mensagem_backup'))
+
+    st.divider()
+    st.markdown("**Arquivo de obras antigas**")
+    st.caption(
+        "Obras sem importações desde a data de corte saem da base do dia a dia e vão para o banco de arquivo "
+        "em data/archive/. Continuam nos resumos (margens, visão consolidada) e podem ser incluídas na pesquisa abaixo."
+    )
+    data_corte = st.date_input("Arquivar obras sem importações desde:", value=pd.Timestamp.today() - pd.DateOffset(years=2), format="DD/MM/YYYY")
+    obras_para_arquivar = processador.consultar_obras_para_arquivar(data_corte)
+    if obras_para_arquivar.empty:
+        st.caption("Nenhuma obra a arquivar com esta data de corte.")
+    else:
+        st.caption(f"{len(obras_para_arquivar)} obra(s), {int(obras_para_arquivar['linhas'].sum())} linha(s) a arquivar.")
+        if st.button("Arquivar obras antigas", use_container_width=True):
+            try:
+                with st.spinner("Arquivando..."):
+                    arquivadas = processador.arquivar_obras_antigas(data_corte)
+                st.session_state.mensagem_arquivo = f"{sum(arquivadas.values())} obra(s) arquivada(s)."
+                st.rerun()
+            except Exception as e:
+                st.error(f"Não foi possível arquivar as obras (nada foi alterado): {e}")
+    if 'mensagem_arquivo' in st.session_state:
+        st.success(st.session_state.pop('mensagem_arquivo'))
+    arquivos = processador.consultar_arquivos()
+    if not arquivos.empty:
+        st.caption(f"Banco de arquivo: {processador.tamanho_arquivo_mb():.1f} MB")
+        st.dataframe(
+            arquivos,
+            column_config={
+                "ano": st.column_config.NumberColumn("Ano", format="%d"),
+                "obras": "Obras",
+                "linhas": "Linhas",
+            },
+            hide_index=True, use_container_width=True
+        )
+
 # --- Carregamento de Dados ---
-@st.cache_data
-def carregar_dados_mapeados():
-    """Carrega os itens já com as colunas de mapeamento e cliente."""
-    return processador.consultar_itens_com_mapeamento()
+@st.cache_data(max_entries=1)
+def carregar_historico_completo(versoes: tuple):
+    return processador.consultar_itens_com_mapeamento(historico_completo=True)
 
-df_completo = carregar_dados_mapeados()
+# O histórico vem do snapshot Arrow compartilhado entre as sessões (ver scripts/snapshot_historico.py).
+# O frame não é copiado nem alterado no lugar: os filtros abaixo sempre criam novos frames.
+# Com obras arquivadas, a pesquisa pode incluí-las (consulta à base quente e ao arquivo).
+if processador.consultar_arquivos().empty or not st.toggle("Incluir obras arquivadas"):
+    df_completo = snapshot_historico.carregar_historico()
+else:
+    df_completo = carregar_historico_completo(processador.versoes_dados("itens_orcamento", "mapa_itens", "arquivo_obras"))
 
 # A verificação agora acontece depois que o botão já foi desenhado
 if df_completo.empty:
     st.info("ℹ️ Nenhum dado encontrado no banco. Comece importando orçamentos ou uma base de custos na página 'Assistente de Importação'.")
     st.stop()
 
+# Linhas marcadas na importação como preço atípico (ver página 'Revisão de Preços').
+num_atipicos = int((df_completo['preco_atipico'] == processador.PRECO_ATIPICO).sum()) if 'preco_atipico' in df_completo.columns else 0
+if num_atipicos and st.toggle(f"Ignorar {num_atipicos} linha(s) com preço atípico ainda não revisado", value=True):
+    df_completo = df_completo[df_completo['preco_atipico'] != processador.PRECO_ATIPICO]
+
 # --- O restante do Dashboard (só aparece se houver dados) ---
 st.header("Pesquisa e Filtros")
 termo_pesquisa = st.text_input(
@@ -75,7 +156,7 @@ if termo_pesquisa:
     filtro_item_padrao = df_completo['item_padrao'].str.contains(termo_pesquisa, case=False, na=False)
     df_pesquisa = df_completo[filtro_descricao | filtro_item_padrao]
 else:
-    df_pesquisa = df_completo.copy()
+    df_pesquisa = df_completo
 
 lista_itens_padrao = df_pesquisa['item_padrao'].dropna().unique().tolist()
 lista_itens_padrao.sort()
@@ -88,14 +169,15 @@ item_padrao_selecionado = st.selectbox(
 )
 
 if item_padrao_selecionado == OPCAO_TODOS:
-    df_final = df_pesquisa.copy()
+    df_final = df_pesquisa
 else:
     df_final = df_pesquisa[df_pesquisa['item_padrao'] == item_padrao_selecionado]
 
 if item_padrao_selecionado != OPCAO_TODOS and not df_final.empty:
     st.subheader(f"Histórico de Preço para: {item_padrao_selecionado}")
     
-    df_final['obra_cliente'] = df_final['nome_obra'] + " (" + df_final['nome_cliente'].fillna('N/A') + ")"
+    # Obra e cliente vêm como categorias do histórico compacto: converte para texto antes de concatenar.
+    df_final['obra_cliente'] = df_final['nome_obra'].astype(str) + " (" + df_final['nome_cliente'].astype(object).fillna('N/A').astype(str) + ")"
     
     max_valor = df_final['valor_unitario'].max()
     range_y_max = max_valor * 1.20
@@ -113,6 +195,19 @@ if item_padrao_selecionado != OPCAO_TODOS and not df_final.empty:
     fig.update_layout(uniformtext_minsize=8, uniformtext_mode='hide')
     st.plotly_chart(fig, use_container_width=True)
 
+    # Evolução no tempo: preços pela data de importação e a mediana móvel
+    janela_meses = st.radio("Janela da mediana móvel (meses):", options=series_precos.JANELAS_MESES,
+                            index=len(series_precos.JANELAS_MESES) - 1, horizontal=True)
+    df_tempo = series_precos.medianas_moveis(df_final['item_padrao'].astype(object), df_final['importado_em'],
+                                             df_final['valor_unitario'], janela_meses)
+    if not df_tempo.empty:
+        fig_tempo = px.scatter(df_tempo, x='data', y='valor', title="Evolução do Valor Unitário",
+                               labels={'data': 'Importado em', 'valor': 'Valor Unitário (R$)'})
+        fig_tempo.add_scatter(x=df_tempo['data'], y=df_tempo['mediana_movel'], mode='lines', line_shape='hv',
+                              name=f"Mediana móvel ({janela_meses} meses)")
+        st.plotly_chart(fig_tempo, use_container_width=True)
+        st.caption(f"Preço atual (mediana dos últimos {janela_meses} meses): R$ {df_tempo['mediana_movel'].iloc[-1]:,.2f}")
+
 st.header("Itens da Seleção")
 df_para_exibicao = df_final.copy()
 
@@ -166,4 +261,48 @@ else:
 labels = ["Preço Médio", "Mediana", "Preço Mínimo", "Preço Máximo", "Nº de Registros"]
 cols = st.columns(5)
 for col, label, value in zip(cols, labels, metric_values):
-    col.metric(label=label, value=value)
\ No newline at end of file
+    col.metric(label=label, value=value)
+
+# --- Visão Consolidada (cubo grupo × obra × cliente × mês) ---
+st.header("Visão Consolidada")
+st.markdown("Totais pré-calculados por grupo, obra, cliente e mês. Escolha a dimensão e filtre para detalhar.")
+
+DIMENSOES_CONSOLIDADAS = {"Grupo": "nome_grupo", "Obra": "nome_obra", "Cliente": "nome_cliente", "Mês": "mes"}
+
+@st.cache_data(max_entries=32)
+def carregar_cubo(dimensoes: tuple, filtros: tuple, versoes: tuple):
+    return processador.consultar_cubo(dimensoes, dict(filtros))
+
+versoes_cubo = processador.versoes_dados(*processador.FONTES_CUBO)
+dimensao_rotulo = st.radio("Consolidar por:", options=list(DIMENSOES_CONSOLIDADAS), horizontal=True)
+dimensao = DIMENSOES_CONSOLIDADAS[dimensao_rotulo]
+
+filtros_cubo = {}
+colunas_filtro = st.columns(len(DIMENSOES_CONSOLIDADAS) - 1)
+for coluna, (rotulo, outra) in zip(colunas_filtro, [(r, d) for r, d in DIMENSOES_CONSOLIDADAS.items() if d != dimensao]):
+    # As opções de cada filtro já respeitam os filtros escolhidos à esquerda (drill-down).
+    opcoes = carregar_cubo((outra,), tuple(filtros_cubo.items()), versoes_cubo)[outra].tolist()
+    escolhido = coluna.selectbox(f"{rotulo}:", options=["Todos"] + opcoes, key=f"filtro_cubo_{outra}")
+    if escolhido != "Todos":
+        filtros_cubo[outra] = escolhido
+
+df_cubo = carregar_cubo((dimensao,), tuple(filtros_cubo.items()), versoes_cubo)
+if df_cubo.empty:
+    st.write("Nenhum dado para os filtros escolhidos.")
+else:
+    st.dataframe(
+        df_cubo,
+        column_config={
+            dimensao: st.column_config.TextColumn(dimensao_rotulo, width="large"),
+            "linhas": st.column_config.NumberColumn("Linhas"),
+            "quantidade": st.column_config.NumberColumn("Quantidade", format="%.2f"),
+            "receita": st.column_config.NumberColumn("Receita", format="R$ %.2f"),
+            "preco_min": st.column_config.NumberColumn("Menor Preço Unit.", format="R$ %.2f"),
+            "preco_max": st.column_config.NumberColumn("Maior Preço Unit.", format="R$ %.2f"),
+        },
+        hide_index=True, use_container_width=True
+    )
+    if dimensao == "mes":
+        st.line_chart(df_cubo.set_index("mes")["receita"])
+    else:
+        st.bar_chart(df_cubo.nlargest(20, "receita").set_index(dimensao)["receita"], horizontal=True)
@@ -1,26 +1,8 @@
 # pages/2_Assistente_de_Importação.py
 import streamlit as st
 import pandas as pd
-from scripts import processador
-import time
-import unicodedata
-from fuzzywuzzy import process, fuzz
-import re
-
-# FUNÇÃO DE LIMPEZA CENTRALIZADA: Usada para cabeçalhos e valores
-def limpar_texto(texto):
-    """Remove acentos, caracteres especiais, converte para minúsculas e padroniza espaços."""
-    if not isinstance(texto, str):
-        return ""
-    # Converte para minúsculas e normaliza acentos
-    texto_normalizado = unicodedata.normalize('NFKD', texto.lower())
-    # Remove caracteres de acentuação
-    texto_sem_acentos = ''.join(c for c in texto_normalizado if not unicodedata.combining(c))
-    # Remove caracteres especiais, mantendo apenas letras, números e espaços
-    texto_limpo = re.sub(r'[^a-z0-9\s]', ' ', texto_sem_acentos)
-    # Normaliza espaços (remove múltiplos espaços, espaços no início/fim)
-    texto_final = " ".join(texto_limpo.split())
-    return texto_final if texto_final else ""
+from scripts import processador, tarefas, cache_planilhas, reconhecedor_custos
+from scripts.normalizacao import limpar_texto
 
 st.set_page_config(page_title="SIO | Assistente de Importação", layout="wide")
 st.title(" 🚀 Assistente de Importação e Mapeamento")
@@ -31,11 +13,188 @@ def inicializar_estado_importacao():
     keys_to_clear = [
         'df_import', 'file_name', 'nome_obra', 'nome_cliente', 
         'itens_novos', 'opcoes_padrao', 'decisoes', 'observacao_inicial',
-        'tipo_importacao', 'mapeamento_grupos', 'df_custos'
+        'tipo_importacao', 'mapeamento_grupos', 'df_custos',
+        'sugestoes', 'opcoes_padrao_limpas', 'pagina_mapeamento',
+        'job_importacao', 'job_classificacao', 'job_custos', 'classificacao_aplicada',
+        'hash_arquivo', 'importacao_anterior', 'resumo_custos'
     ]
     for key in keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
+    _limpar_widgets_mapeamento()
+
+# --- Acompanhamento das tarefas em segundo plano ---
+@st.fragment(run_every=1)
+def _progresso_da_tarefa(id_job):
+    tarefa = tarefas.consultar_tarefa(id_job)
+    if tarefa is None or tarefa['status'] not in tarefas.STATUS_ATIVOS:
+        st.rerun()  # Tarefa terminou: recarrega a página inteira para exibir o resultado
+    total_lotes = tarefa['total_lotes'] or 1
+    st.progress(
+        min(float(tarefa['progresso'] or 0), 1.0),
+        text=f"Lote {tarefa['ultimo_lote']} de {total_lotes} — {tarefa['itens_processados']} itens processados"
+    )
+
+def painel_da_tarefa(chave_estado, titulo):
+    """
+    Acompanha a tarefa cujo id está em st.session_state[chave_estado]. Enquanto ela roda,
+    mostra o progresso e interrompe o restante da página. Retorna a tarefa já finalizada
+    (concluída ou com erro), ou None se não houver tarefa.
+    """
+    id_job = st.session_state.get(chave_estado)
+    if not id_job:
+        return None
+    tarefa = tarefas.consultar_tarefa(id_job)
+    if tarefa is None:
+        del st.session_state[chave_estado]
+        return None
+    if tarefa['status'] in tarefas.STATUS_ATIVOS:
+        st.subheader(titulo)
+        st.caption("Você pode atualizar ou fechar esta página: a tarefa continua rodando no servidor.")
+        _progresso_da_tarefa(id_job)
+        st.stop()
+    return tarefa
+
+def finalizar_tarefa_de_gravacao(tarefa, mensagem_sucesso):
+    """Exibe o resultado de uma tarefa que gravou dados e oferece iniciar uma nova importação."""
+    if tarefa['status'] == tarefas.STATUS_CONCLUIDO:
+        st.success(mensagem_sucesso)
+        # Os caches das outras páginas se renovam sozinhos: a gravação incrementou as versões dos dados.
+        if not st.session_state.get(f"concluido_job_{tarefa['id_job']}"):
+            st.session_state[f"concluido_job_{tarefa['id_job']}"] = True
+            st.balloons()
+    else:
+        st.error(f"Ocorreu um erro ao salvar os dados: {tarefa['erro']}")
+    st.button("Iniciar nova importação", on_click=inicializar_estado_importacao, type="primary")
+    st.stop()
+
+# Tarefas que ficaram pela metade (ex.: servidor reiniciado) continuam do último lote gravado.
+tarefas.retomar_tarefas_interrompidas()
+
+# --- Revisão paginada do mapeamento de itens novos ---
+ITENS_POR_PAGINA = 25
+LIMITE_OPCOES_BUSCA = 30
+SCORE_MINIMO_SUGESTAO = 80
+OPCAO_ESCOLHA = "-- Escolha um item --"
+ACOES_MAPEAMENTO = ["Associar a um Item Padrão existente", "Criar um novo Item Padrão"]
+
+def _limpar_widgets_mapeamento(indices=None):
+    """Remove o estado dos widgets de revisão para que sejam recriados a partir de 'decisoes'."""
+    prefixos = ("acao_", "select_", "input_", "busca_")
+    for key in list(st.session_state.keys()):
+        if isinstance(key, str) and key.startswith(prefixos) and key.rsplit("_", 1)[1].isdigit():
+            if indices is None or int(key.rsplit("_", 1)[1]) in indices:
+                del st.session_state[key]
+
+def _decisao_padrao(desc):
+    """Decisão inicial de um item: associa à sugestão se ela for confiável, senão cria um novo."""
+    candidatos = st.session_state.sugestoes.get(desc, [])
+    if candidatos and candidatos[0][1] >= SCORE_MINIMO_SUGESTAO:
+        return {"acao": "associar", "valor": candidatos[0][0]}
+    return {"acao": "criar", "valor": desc.strip().capitalize()}
+
+def _filtrar_opcoes(termo, limite=LIMITE_OPCOES_BUSCA):
+    """Typeahead: devolve os itens padrão que contêm todas as palavras digitadas."""
+    palavras = limpar_texto(termo).split()
+    encontrados = []
+    for opcao, opcao_limpa in zip(st.session_state.opcoes_padrao, st.session_state.opcoes_padrao_limpas):
+        if all(p in opcao_limpa for p in palavras):
+            encontrados.append(opcao)
+            if len(encontrados) >= limite:
+                break
+    return encontrados
+
+def _atualizar_acao(i, desc):
+    if st.session_state[f"acao_{i}"] == ACOES_MAPEAMENTO[0]:
+        candidatos = st.session_state.sugestoes.get(desc, [])
+        valor = candidatos[0][0] if candidatos and candidatos[0][1] >= SCORE_MINIMO_SUGESTAO else None
+        st.session_state.decisoes[desc] = {"acao": "associar", "valor": valor}
+    else:
+        st.session_state.decisoes[desc] = {"acao": "criar", "valor": desc.strip().capitalize()}
+    for prefixo in ("select_", "input_", "busca_"):
+        st.session_state.pop(f"{prefixo}{i}", None)
+
+def _atualizar_selecao(i, desc):
+    item = st.session_state[f"select_{i}"]
+    st.session_state.decisoes[desc] = {"acao": "associar", "valor": item if item != OPCAO_ESCOLHA else None}
+
+def _atualizar_novo_item(i, desc):
+    st.session_state.decisoes[desc] = {"acao": "criar", "valor": st.session_state[f"input_{i}"]}
+
+def _aplicar_em_lote(indices, acao):
+    """Ações em lote: aceitar as sugestões ou criar itens novos para os índices informados."""
+    for i in indices:
+        desc = st.session_state.itens_novos[i]
+        candidatos = st.session_state.sugestoes.get(desc, [])
+        if acao == "aceitar" and candidatos and candidatos[0][1] >= SCORE_MINIMO_SUGESTAO:
+            st.session_state.decisoes[desc] = {"acao": "associar", "valor": candidatos[0][0]}
+        elif acao == "criar":
+            st.session_state.decisoes[desc] = {"acao": "criar", "valor": desc.strip().capitalize()}
+    _limpar_widgets_mapeamento(set(indices))
+
+def _renderizar_item_mapeamento(i, desc):
+    decisao = st.session_state.decisoes[desc]
+    candidatos = st.session_state.sugestoes.get(desc, [])
+    with st.container(border=True):
+        st.markdown(f"**Item novo:** `{desc}`")
+        acao = st.radio(
+            "O que você deseja fazer?", ACOES_MAPEAMENTO, key=f"acao_{i}", horizontal=True,
+            index=0 if decisao["acao"] == "associar" else 1, on_change=_atualizar_acao, args=(i, desc)
+        )
+        if acao == ACOES_MAPEAMENTO[0]:
+            if candidatos and candidatos[0][1] >= SCORE_MINIMO_SUGESTAO:
+                st.info(f"💡 Sugestão ({candidatos[0][1]}%): Correspondência com **'{candidatos[0][0]}'**.")
+            termo = st.text_input("Buscar Item Padrão:", key=f"busca_{i}", placeholder="Digite parte do nome para filtrar...")
+            # Opções enxutas: a escolha atual + resultados da busca (ou os melhores candidatos pré-calculados).
+            opcoes = _filtrar_opcoes(termo) if termo else [c[0] for c in candidatos]
+            if decisao["valor"] and decisao["valor"] not in opcoes:
+                opcoes = [decisao["valor"]] + opcoes
+            opcoes = [OPCAO_ESCOLHA] + opcoes
+            if f"select_{i}" in st.session_state and st.session_state[f"select_{i}"] not in opcoes:
+                del st.session_state[f"select_{i}"]
+            st.selectbox(
+                "Selecione o Item Padrão", options=opcoes, key=f"select_{i}",
+                index=opcoes.index(decisao["valor"]) if decisao["valor"] in opcoes else 0,
+                on_change=_atualizar_selecao, args=(i, desc)
+            )
+        else:
+            st.text_input(
+                "Digite o nome do novo Item Padrão:", value=decisao["valor"] or "", key=f"input_{i}",
+                on_change=_atualizar_novo_item, args=(i, desc)
+            )
+
+@st.fragment
+def revisar_mapeamento_paginado():
+    """Grade de revisão paginada: apenas os itens da página atual são desenhados a cada interação."""
+    itens_novos = st.session_state.itens_novos
+    total_paginas = max(1, -(-len(itens_novos) // ITENS_POR_PAGINA))
+    pendentes = sum(1 for d in st.session_state.decisoes.values() if not (d.get('valor') and d.get('valor').strip()))
+    st.info(f"Encontramos {len(itens_novos)} itens que precisam ser padronizados. Pendentes de decisão: {pendentes}.")
+
+    col_pagina, col_lote1, col_lote2, col_lote3 = st.columns([1, 1, 1, 1])
+    with col_pagina:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key="pagina_mapeamento")
+    inicio = (pagina - 1) * ITENS_POR_PAGINA
+    indices_pagina = list(range(inicio, min(inicio + ITENS_POR_PAGINA, len(itens_novos))))
+    with col_lote1:
+        st.button("Aceitar sugestões desta página", on_click=_aplicar_em_lote, args=(indices_pagina, "aceitar"), use_container_width=True)
+    with col_lote2:
+        st.button("Aceitar todas as sugestões", on_click=_aplicar_em_lote, args=(list(range(len(itens_novos))), "aceitar"), use_container_width=True)
+    with col_lote3:
+        st.button("Criar novos itens nesta página", on_click=_aplicar_em_lote, args=(indices_pagina, "criar"), use_container_width=True)
+    st.caption(f"Página {pagina} de {total_paginas}.")
+
+    for i in indices_pagina:
+        _renderizar_item_mapeamento(i, itens_novos[i])
+
+with st.expander("Tarefas em segundo plano"):
+    tarefas_recentes = tarefas.consultar_tarefas_recentes()
+    if tarefas_recentes:
+        st.dataframe(pd.DataFrame(tarefas_recentes), hide_index=True, use_container_width=True, column_config={
+            "progresso": st.column_config.ProgressColumn("Progresso", min_value=0.0, max_value=1.0)
+        })
+    else:
+        st.caption("Nenhuma tarefa registrada.")
 
 # --- 1. Upload do Arquivo ---
 st.subheader("1. Envie o arquivo da planilha")
@@ -60,20 +219,42 @@ if uploaded_file:
     # --- FLUXO PARA PREÇO DE VENDA (ORÇAMENTO) - CÓDIGO ORIGINAL INALTERADO ---
     # =========================================================================
     if tipo_importacao == "Preço de Venda (Orçamento de Obra)":
+        tarefa_importacao = painel_da_tarefa('job_importacao', "Salvando orçamento em segundo plano...")
+        if tarefa_importacao:
+            finalizar_tarefa_de_gravacao(
+                tarefa_importacao,
+                f"Sucesso! {tarefa_importacao['itens_salvos']} novos registros foram salvos para a obra "
+                f"'{tarefa_importacao['parametros'].get('nome_obra')}'. O mapeamento também foi salvo."
+            )
+
         if 'df_import' not in st.session_state:
             try:
-                df_bruto = processador.ler_orcamento(uploaded_file)
-                st.session_state.df_import = processador.preparar_dataframe(df_bruto)
+                # Reenvios do mesmo arquivo reaproveitam a leitura guardada no cache (chave: SHA-256).
+                st.session_state.df_import, st.session_state.hash_arquivo = cache_planilhas.ler_orcamento_com_cache(uploaded_file.getvalue())
+                st.session_state.importacao_anterior = processador.consultar_importacao_por_hash(st.session_state.hash_arquivo)
                 st.session_state.file_name = uploaded_file.name
                 descricoes_mapeadas = processador.consultar_descricoes_mapeadas()
                 descricoes_unicas_upload = st.session_state.df_import['descricao'].unique()
                 st.session_state.itens_novos = [d for d in descricoes_unicas_upload if d not in descricoes_mapeadas]
                 st.session_state.opcoes_padrao = processador.consultar_itens_padrao()
-                st.session_state.decisoes = {}
+                st.session_state.opcoes_padrao_limpas = [limpar_texto(o) for o in st.session_state.opcoes_padrao]
+                # Sugestões calculadas uma única vez, em lote, para todos os itens novos.
+                st.session_state.sugestoes = processador.sugerir_correspondencias_em_lote(
+                    st.session_state.itens_novos, st.session_state.opcoes_padrao
+                )
+                st.session_state.decisoes = {desc: _decisao_padrao(desc) for desc in st.session_state.itens_novos}
             except Exception as e:
                 st.error(f"Ocorreu um erro ao ler e preparar a planilha de orçamento: {e}")
                 st.stop()
 
+        importacao_anterior = st.session_state.get('importacao_anterior')
+        if importacao_anterior:
+            st.warning(
+                f"⚠️ Este arquivo já foi importado como a obra **'{importacao_anterior['nome_obra']}'** "
+                f"({importacao_anterior['num_itens']} itens, arquivo '{importacao_anterior['arquivo_original']}'). "
+                "Salvar novamente não duplicará as linhas já gravadas."
+            )
+
         st.subheader("A. Defina os Dados da Obra")
         col1, col2 = st.columns(2)
         with col1:
@@ -90,31 +271,7 @@ if uploaded_file:
         if not st.session_state.get('itens_novos', []):
             st.success("✅ Boa notícia! Todos os itens desta planilha já possuem um mapeamento padrão no sistema.")
         else:
-            st.info(f"Encontramos {len(st.session_state.itens_novos)} itens que precisam ser padronizados.")
-            for i, desc in enumerate(st.session_state.itens_novos):
-                with st.container(border=True):
-                    st.markdown(f"**Item novo:** `{desc}`")
-                    sugestao, index_sugerido = None, 0
-                    if st.session_state.opcoes_padrao:
-                        melhor_match = processador.encontrar_melhor_correspondencia(desc, st.session_state.opcoes_padrao)
-                        if melhor_match and melhor_match[1] >= 80:
-                            sugestao = melhor_match[0]
-                            index_sugerido = st.session_state.opcoes_padrao.index(sugestao) + 1
-                    
-                    acao = st.radio(
-                        "O que você deseja fazer?", 
-                        ["Associar a um Item Padrão existente", "Criar um novo Item Padrão"],
-                        key=f"acao_{i}", horizontal=True, index=0 if sugestao else 1
-                    )
-
-                    if acao == "Associar a um Item Padrão existente":
-                        if sugestao: st.info(f"💡 Sugestão ({melhor_match[1]}%): Correspondência com **'{sugestao}'**.")
-                        opcoes_selectbox = ["-- Escolha um item --"] + st.session_state.opcoes_padrao
-                        item_associado = st.selectbox("Selecione o Item Padrão", options=opcoes_selectbox, key=f"select_{i}", index=index_sugerido)
-                        st.session_state.decisoes[desc] = {"acao": "associar", "valor": item_associado if item_associado != "-- Escolha um item --" else None}
-                    else:
-                        novo_item_padrao = st.text_input("Digite o nome do novo Item Padrão:", value=desc.strip().capitalize(), key=f"input_{i}")
-                        st.session_state.decisoes[desc] = {"acao": "criar", "valor": novo_item_padrao}
+            revisar_mapeamento_paginado()
 
         st.subheader("C. Adicionar Observação Inicial (Opcional)")
         observacao_inicial = st.text_area(
@@ -123,35 +280,28 @@ if uploaded_file:
         st.markdown("---")
 
         if st.button("Concluir Mapeamento e Salvar Orçamento", type="primary", use_container_width=True):
-            with st.spinner("Processando e salvando..."):
-                nome_cliente = st.session_state.get('nome_cliente', '').strip()
-                nome_obra = st.session_state.get('nome_obra', '').strip()
-                if not nome_cliente or not nome_obra:
-                    st.error("Os campos 'Nome do Cliente' e 'Nome para este orçamento' são obrigatórios.")
-                    st.stop()
-                
-                mapeamento_completo = all(d.get('valor') and d.get('valor').strip() for d in st.session_state.get('decisoes', {}).values())
-                if not mapeamento_completo:
-                    st.error("Existem decisões de mapeamento pendentes. Por favor, complete todos os mapeamentos.")
-                    st.stop()
-                
-                for desc, decisao in st.session_state.decisoes.items():
-                    processador.salvar_mapeamento(desc, decisao['valor'])
-                
-                novos_itens = processador.salvar_na_base(
-                    df=st.session_state.df_import, 
-                    nome_obra=nome_obra,
-                    nome_arquivo_original=st.session_state.file_name, 
-                    nome_cliente=nome_cliente
-                )
-                if observacao_inicial and observacao_inicial.strip():
-                    processador.salvar_observacao(nome_obra=nome_obra, texto_observacao=observacao_inicial)
-                
-                st.success(f"Sucesso! {novos_itens} novos registros foram salvos para a obra '{nome_obra}'. O mapeamento também foi salvo.")
-                st.cache_data.clear()
-                time.sleep(4)
-                inicializar_estado_importacao()
-                st.rerun()
+            nome_cliente = st.session_state.get('nome_cliente', '').strip()
+            nome_obra = st.session_state.get('nome_obra', '').strip()
+            if not nome_cliente or not nome_obra:
+                st.error("Os campos 'Nome do Cliente' e 'Nome para este orçamento' são obrigatórios.")
+                st.stop()
+            
+            mapeamento_completo = all(d.get('valor') and d.get('valor').strip() for d in st.session_state.get('decisoes', {}).values())
+            if not mapeamento_completo:
+                st.error("Existem decisões de mapeamento pendentes. Por favor, complete todos os mapeamentos.")
+                st.stop()
+            
+            st.session_state.job_importacao = tarefas.submeter_tarefa(
+                "importar_orcamento",
+                parametros={
+                    'nome_obra': nome_obra, 'nome_cliente': nome_cliente,
+                    'arquivo_original': st.session_state.file_name, 'hash_arquivo': st.session_state.hash_arquivo,
+                    'decisoes': st.session_state.decisoes, 'observacao': observacao_inicial
+                },
+                payload=st.session_state.df_import,
+                descricao=f"Orçamento '{nome_obra}' ({st.session_state.file_name})"
+            )
+            st.rerun()
 
     # =========================================================================
     # --- FLUXO PARA BASE DE CUSTOS (LÓGICA CORRIGIDA E APRIMORADA) ---
@@ -159,7 +309,21 @@ if uploaded_file:
     elif tipo_importacao == "Base de Custos":
         st.header("Importando Base de Custos")
 
-        limpar_base = st.checkbox("Apagar base de custos e mapeamentos existentes antes de importar")
+        tarefa_custos = painel_da_tarefa('job_custos', "Salvando base de custos em segundo plano...")
+        if tarefa_custos:
+            resultado_custos = tarefa_custos['resultado']
+            if 'novos' in resultado_custos:
+                mensagem_custos = (f"Base de custos atualizada: {resultado_custos['novos']} itens novos, {resultado_custos['alterados']} alterados, "
+                                   f"{resultado_custos.get('removidos', 0)} removidos e {resultado_custos['inalterados']} sem alteração.")
+            else:
+                mensagem_custos = f"Sucesso! {tarefa_custos['itens_salvos']} itens de custo foram salvos."
+            finalizar_tarefa_de_gravacao(tarefa_custos, mensagem_custos)
+
+        limpar_base = st.checkbox(
+            "Apagar base de custos e mapeamentos existentes antes de importar",
+            help="Sem esta opção, a importação compara a planilha com a base atual e grava só os itens novos ou alterados, "
+                 "mantendo os mapeamentos manuais."
+        )
         st.info("O sistema tentará reconhecer o grupo da planilha. Para itens sem grupo ou não reconhecidos, a IA fará uma sugestão.")
 
         if 'df_custos' not in st.session_state:
@@ -167,40 +331,15 @@ if uploaded_file:
                 df_bruto = pd.read_excel(uploaded_file)
                 st.write("**Debug**: Colunas lidas da planilha:", list(df_bruto.columns))  # Log de depuração
 
-                # Dicionário robusto para reconhecer vários nomes de colunas possíveis
-                mapa_colunas = {
-                    'item': 'item_padrao_nome', 'descricao': 'item_padrao_nome', 'descrição': 'item_padrao_nome',
-                    'unidade de medida': 'unidade_de_medida', 'unidade': 'unidade_de_medida', 'unid': 'unidade_de_medida',
-                    'custo material': 'custo_material', 'custo m.o.': 'custo_mao_de_obra',
-                    'homem hora profissional': 'homem_hora_profissional', 'homem hora ajudante': 'homem_hora_ajudante',
-                    'codigo composicao': 'codigo_composicao', 'n manual': 'numero_manual', 'nº manual': 'numero_manual',
-                    'peso item': 'peso_item', 
-                    'grupo': 'grupo', 'grupo de servico': 'grupo', 'grupo composicao': 'grupo', 'grupo composição': 'grupo'
-                }
-
-                # Limpar cabeçalhos da planilha
-                colunas_limpas = {col: limpar_texto(col) for col in df_bruto.columns}
-                # Mapear cabeçalhos limpos para os nomes internos
-                colunas_mapeadas = {}
-                for col, col_limpa in colunas_limpas.items():
-                    for chave, valor in mapa_colunas.items():
-                        if col_limpa == limpar_texto(chave):
-                            colunas_mapeadas[col] = valor
-                            break
-                    else:
-                        colunas_mapeadas[col] = col  # Mantém o nome original se não houver correspondência
-
-                df_renomeado = df_bruto.rename(columns=colunas_mapeadas)
+                # Cabeçalhos e valores de 'grupo' são normalizados de uma vez (aliases pré-calculados)
+                df_renomeado = reconhecedor_custos.preparar_base_custos(df_bruto)
                 st.write("**Debug**: Colunas após mapeamento:", list(df_renomeado.columns))  # Log de depuração
 
                 if 'item_padrao_nome' not in df_renomeado.columns:
                     st.error("Erro Crítico: A coluna 'ITEM' (ou similar) não foi encontrada na sua planilha.")
                     st.stop()
 
-                # Limpar valores da coluna 'grupo' para evitar problemas com espaços ou caracteres invisíveis
                 if 'grupo' in df_renomeado.columns:
-                    df_renomeado['grupo'] = df_renomeado['grupo'].apply(lambda x: limpar_texto(str(x)) if pd.notna(x) else '')
-                    df_renomeado['grupo'] = df_renomeado['grupo'].replace('', pd.NA)
                     st.write("**Debug**: Primeiros valores da coluna 'grupo' (após limpeza):", df_renomeado['grupo'].head().tolist())  # Log de depuração
 
                 st.session_state.df_custos = df_renomeado
@@ -211,12 +350,32 @@ if uploaded_file:
 
         grupos_e_descricoes = processador.obter_grupos_e_descricoes()
         lista_grupos = sorted(list(grupos_e_descricoes.keys()))
-        grupos_limpos_map = {limpar_texto(g): g for g in lista_grupos}
-        lista_grupos_limpos = list(grupos_limpos_map.keys())
-        st.write("**Debug**: Grupos disponíveis no sistema (limpos):", lista_grupos_limpos)  # Log de depuração
+        st.write("**Debug**: Grupos disponíveis no sistema (limpos):", [limpar_texto(g) for g in lista_grupos])  # Log de depuração
 
         df_custos = st.session_state.df_custos
         has_grupo_column = 'grupo' in df_custos.columns
+        # Cada grupo distinto da planilha é comparado uma única vez com os grupos do sistema.
+        if has_grupo_column:
+            reconhecimento = reconhecedor_custos.reconhecer_grupos(df_custos['grupo'], lista_grupos)
+        else:
+            reconhecimento = pd.DataFrame({'grupo_reconhecido': None, 'score': 0}, index=df_custos.index)
+
+        # Itens cujo grupo não veio (ou não foi reconhecido) na planilha são classificados
+        # pela IA em uma tarefa de segundo plano, antes de montar o formulário.
+        if 'job_classificacao' not in st.session_state:
+            sem_grupo = df_custos.loc[reconhecimento['grupo_reconhecido'].isna(), 'item_padrao_nome'].astype(str)
+            itens_para_ia = [item for item in dict.fromkeys(sem_grupo) if not st.session_state.mapeamento_grupos.get(item)]
+            st.session_state.job_classificacao = tarefas.submeter_tarefa(
+                "classificar_grupos", parametros={}, payload=itens_para_ia,
+                descricao=f"Classificação por IA de {len(itens_para_ia)} itens de custo"
+            ) if itens_para_ia else None
+
+        tarefa_classificacao = painel_da_tarefa('job_classificacao', "A IA está sugerindo grupos para os itens sem grupo reconhecido...")
+        if tarefa_classificacao and not st.session_state.get('classificacao_aplicada'):
+            if tarefa_classificacao['status'] == tarefas.STATUS_ERRO:
+                st.warning(f"A classificação por IA falhou ({tarefa_classificacao['erro']}). Selecione os grupos manualmente.")
+            st.session_state.mapeamento_grupos.update({item: grupo for item, grupo in tarefa_classificacao['resultado'].items() if grupo})
+            st.session_state.classificacao_aplicada = True
 
         with st.form(key='form_mapeamento_grupos'):
             total_itens = len(df_custos)
@@ -226,29 +385,22 @@ if uploaded_file:
                 item_nome = str(row.get('item_padrao_nome', ''))
                 st.markdown(f"--- \n**Serviço:** `{item_nome}`")
 
-                grupo_final = None
+                grupo_final = reconhecimento.at[index, 'grupo_reconhecido']
+                score = reconhecimento.at[index, 'score']
 
-                if has_grupo_column and pd.notna(row.get('grupo')) and row.get('grupo').strip():
-                    grupo_planilha = str(row.get('grupo')).strip()
-                    grupo_planilha_limpo = limpar_texto(grupo_planilha)
-                    st.write(f"**Debug**: Grupo lido da planilha (limpo): `{grupo_planilha_limpo}`")  # Log de depuração
-                    melhor_match = process.extractOne(grupo_planilha_limpo, lista_grupos_limpos, scorer=fuzz.ratio)
+                if has_grupo_column and pd.notna(row.get('grupo')):
+                    grupo_planilha = row.get('grupo')
+                    st.write(f"**Debug**: Grupo lido da planilha (limpo): `{grupo_planilha}`")  # Log de depuração
 
-                    if melhor_match and melhor_match[1] >= 85:  # Reduzido de 90% para 85%
-                        grupo_final = grupos_limpos_map[melhor_match[0]]
-                        st.success(f"Grupo reconhecido da planilha: **{grupo_final}** (Similaridade: {melhor_match[1]}%)")
-                        st.write(f"**Debug**: Grupo correspondente encontrado: `{grupo_final}` (Similaridade: {melhor_match[1]}%)")  # Log de depuração
+                    if grupo_final:
+                        st.success(f"Grupo reconhecido da planilha: **{grupo_final}** (Similaridade: {score}%)")
+                        st.write(f"**Debug**: Grupo correspondente encontrado: `{grupo_final}` (Similaridade: {score}%)")  # Log de depuração
                         st.session_state.mapeamento_grupos[item_nome] = grupo_final
                     else:
-                        st.warning(f"O grupo '{grupo_planilha}' da planilha não foi reconhecido com alta confiança (Similaridade: {melhor_match[1] if melhor_match else 0}%). Usando IA para sugestão.")
-                        st.write(f"**Debug**: Motivo da não correspondência: Similaridade baixa ({melhor_match[1] if melhor_match else 0}%)")  # Log de depuração
+                        st.warning(f"O grupo '{grupo_planilha}' da planilha não foi reconhecido com alta confiança (Similaridade: {score}%). Usando IA para sugestão.")
+                        st.write(f"**Debug**: Motivo da não correspondência: Similaridade baixa ({score}%)")  # Log de depuração
 
                 if not grupo_final:
-                    if item_nome not in st.session_state.mapeamento_grupos or not st.session_state.mapeamento_grupos.get(item_nome):
-                        with st.spinner(f"Item {index+1}/{total_itens}: Consultando IA para sugestão..."):
-                            sugestao_ia = processador.sugerir_grupo_para_item(item_nome, grupos_e_descricoes)
-                            st.session_state.mapeamento_grupos[item_nome] = sugestao_ia
-                            st.write(f"**Debug**: Sugestão da IA para '{item_nome}': `{sugestao_ia}`")  # Log de depuração
                     sugestao_atual = st.session_state.mapeamento_grupos.get(item_nome)
                     if sugestao_atual:
                         st.info(f"Sugestão da IA: **{sugestao_atual}**")
@@ -267,15 +419,41 @@ if uploaded_file:
             st.markdown("---")
             submitted = st.form_submit_button("Concluir Mapeamento e Salvar Base de Custos", type="primary")
             if submitted:
-                with st.spinner("Processando e salvando..."):
-                    try:
-                        st.write("**Debug**: Mapeamento final de grupos:", st.session_state.mapeamento_grupos)  # Log de depuração
-                        processador.salvar_custo_em_lote(df_custos=st.session_state.df_custos, mapeamento_grupos=st.session_state.mapeamento_grupos, limpar_base_existente=limpar_base)
-                        st.success(f"Sucesso! {len(st.session_state.df_custos)} itens de custo foram salvos.")
-                        st.balloons()
-                        st.cache_data.clear()
-                        time.sleep(4)
-                        inicializar_estado_importacao()
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Ocorreu um erro ao salvar os dados: {e}")
\ No newline at end of file
+                st.write("**Debug**: Mapeamento final de grupos:", st.session_state.mapeamento_grupos)  # Log de depuração
+                if limpar_base:
+                    st.session_state.job_custos = tarefas.submeter_tarefa(
+                        "salvar_custos",
+                        parametros={'mapeamento_grupos': st.session_state.mapeamento_grupos, 'limpar_base_existente': True},
+                        payload=st.session_state.df_custos,
+                        descricao=f"Base de custos ({len(st.session_state.df_custos)} itens)"
+                    )
+                    st.rerun()
+                # Sem apagar a base: primeiro o resumo do que muda, depois a confirmação.
+                st.session_state.resumo_custos = processador.comparar_base_custos(st.session_state.df_custos, st.session_state.mapeamento_grupos)
+
+        resumo_custos = st.session_state.get('resumo_custos')
+        if resumo_custos and not limpar_base:
+            st.subheader("Resumo das alterações na base de custos")
+            colunas_resumo = st.columns(4)
+            rotulos_resumo = {"novos": "Novos", "alterados": "Alterados", "inalterados": "Sem alteração", "ausentes": "Ausentes da planilha"}
+            for coluna, (chave, rotulo) in zip(colunas_resumo, rotulos_resumo.items()):
+                coluna.metric(rotulo, len(resumo_custos[chave]))
+            for chave in ("novos", "alterados", "ausentes"):
+                if resumo_custos[chave]:
+                    with st.expander(f"{rotulos_resumo[chave]} ({len(resumo_custos[chave])})"):
+                        st.dataframe(pd.DataFrame({"Item": resumo_custos[chave]}), hide_index=True, use_container_width=True)
+            remover_ausentes = bool(resumo_custos["ausentes"]) and st.checkbox(
+                f"Remover da base de custos os {len(resumo_custos['ausentes'])} itens ausentes da planilha (os mapeamentos são mantidos)"
+            )
+            if not (resumo_custos["novos"] or resumo_custos["alterados"] or remover_ausentes):
+                st.info("Nada a gravar: a planilha não traz mudanças em relação à base atual.")
+            elif st.button("Aplicar alterações", type="primary", use_container_width=True):
+                st.session_state.job_custos = tarefas.submeter_tarefa(
+                    "salvar_custos",
+                    parametros={'mapeamento_grupos': st.session_state.mapeamento_grupos, 'incremental': True,
+                                'remover_ausentes': remover_ausentes},
+                    payload=st.session_state.df_custos,
+                    descricao=f"Base de custos ({len(st.session_state.df_custos)} itens, incremental)"
+                )
+                del st.session_state.resumo_custos
+                st.rerun()
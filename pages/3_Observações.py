@@ -8,34 +8,48 @@ st.set_page_config(page_title="SIO | Observações", layout="wide")
 st.title("📖 Observações das Obras")
 st.markdown("Consulte, adicione ou edite anotações e o contexto de cada obra.")
 
-# --- Carregar Dados ---
-lista_obras = processador.consultar_nomes_de_obras_unicas()
-
-if not lista_obras:
-    st.warning("Nenhuma obra foi encontrada no banco de dados. Importe um orçamento primeiro.")
-    st.stop()
+OBRAS_POR_PAGINA = 20
 
 # --- Barra de Pesquisa ---
 termo_pesquisa = st.text_input(
     "Pesquisar por nome da obra:",
-    placeholder="Digite para filtrar as obras abaixo..."
+    placeholder="Digite para filtrar as obras abaixo...",
+    on_change=lambda: st.session_state.update(pagina_observacoes=1)
+)
+
+# --- Carregar Dados (uma única consulta por página) ---
+pagina_atual = st.session_state.get('pagina_observacoes', 1)
+obras_da_pagina, total_obras = processador.consultar_observacoes_agrupadas(
+    termo_pesquisa, limit=OBRAS_POR_PAGINA, offset=(pagina_atual - 1) * OBRAS_POR_PAGINA
 )
 
-# --- Filtrar Obras ---
-if termo_pesquisa:
-    obras_filtradas = [obra for obra in lista_obras if termo_pesquisa.lower() in obra.lower()]
-else:
-    obras_filtradas = lista_obras
+if not obras_da_pagina and pagina_atual > 1:
+    # A página guardada ficou fora do intervalo (ex.: filtro mudou); volta para a primeira.
+    st.session_state.pagina_observacoes = 1
+    st.rerun()
+
+if total_obras == 0:
+    if termo_pesquisa:
+        st.info(f"Nenhuma obra encontrada com o termo '{termo_pesquisa}'.")
+    else:
+        st.warning("Nenhuma obra foi encontrada no banco de dados. Importe um orçamento primeiro.")
+    st.stop()
 
-if not obras_filtradas:
-    st.info(f"Nenhuma obra encontrada com o termo '{termo_pesquisa}'.")
+# --- Paginação ---
+total_paginas = max(1, -(-total_obras // OBRAS_POR_PAGINA))
+col_info, col_pagina = st.columns([3, 1])
+with col_info:
+    st.caption(f"{total_obras} obra(s) encontrada(s). Exibindo página {pagina_atual} de {total_paginas}.")
+with col_pagina:
+    st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key="pagina_observacoes")
 
 # --- Loop para exibir os "Cards" de cada obra ---
-for obra in obras_filtradas:
+for obra_info in obras_da_pagina:
+    obra = obra_info['nome_obra']
     with st.container(border=True):
         st.subheader(obra)
         
-        observacoes = processador.consultar_observacoes_por_obra(obra)
+        observacoes = obra_info['observacoes']
         
         if not observacoes:
             st.info("Esta obra ainda não possui observações salvas.")
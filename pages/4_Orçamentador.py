@@ -2,7 +2,8 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from scripts import processador
+from scripts import processador, exportador
+from datetime import datetime
 import io
 import time
 
@@ -46,8 +47,8 @@ inicializar_session_state()
 
 
 # --- Carregar Dados ---
-@st.cache_data
-def carregar_dados_orcamentador():
+@st.cache_data(max_entries=2)
+def carregar_dados_orcamentador(versoes: tuple):
     return processador.consultar_itens_por_grupo()
 
 # --- Estrutura de Abas ---
@@ -65,7 +66,7 @@ with tab1:
     st.info("Selecione os serviços e defina as quantidades para compor os custos de Material e Mão de Obra.")
     
     with st.container(border=True):
-        dados_orcamento = carregar_dados_orcamentador()
+        dados_orcamento = carregar_dados_orcamentador(processador.versoes_dados("base_custos", "mapa_itens", "grupos_servico"))
         grupos_disponiveis = ["Todos"] + sorted(list(dados_orcamento.keys()))
 
         col1, col2 = st.columns([1, 3])
@@ -77,17 +78,19 @@ with tab1:
 
         if st.button("Adicionar Serviços Selecionados", type="primary", use_container_width=True):
             novos_itens_para_adicionar, servicos_com_falha = [], []
-            for servico in servicos_selecionados:
-                if servico not in st.session_state.orcamento_df["Item Padrão"].values:
-                    custo_info = processador.consultar_custo_por_item(servico)
-                    if custo_info:
-                        novos_itens_para_adicionar.append({
-                            "Item Padrão": servico, "Unidade": custo_info.get("unidade_de_medida", "N/D"),
-                            "Quantidade": 1.0, "Custo Unit. Material": custo_info.get("custo_material", 0),
-                            "Custo Unit. M.O.": custo_info.get("custo_mao_de_obra", 0),
-                        })
-                    else:
-                        servicos_com_falha.append(servico)
+            servicos_novos = [s for s in servicos_selecionados if s not in st.session_state.orcamento_df["Item Padrão"].values]
+            # Custos vigentes de todos os serviços em uma consulta.
+            custos_vigentes = processador.custos_em(servicos_novos).set_index("item_padrao_nome")
+            for servico in servicos_novos:
+                if servico in custos_vigentes.index:
+                    custo_info = custos_vigentes.loc[servico]
+                    novos_itens_para_adicionar.append({
+                        "Item Padrão": servico, "Unidade": custo_info["unidade_de_medida"] or "N/D",
+                        "Quantidade": 1.0, "Custo Unit. Material": custo_info["custo_material"],
+                        "Custo Unit. M.O.": custo_info["custo_mao_de_obra"],
+                    })
+                else:
+                    servicos_com_falha.append(servico)
             if novos_itens_para_adicionar:
                 novos_itens_df = pd.DataFrame(novos_itens_para_adicionar)
                 st.session_state.orcamento_df = pd.concat([st.session_state.orcamento_df, novos_itens_df], ignore_index=True)
@@ -344,12 +347,24 @@ with tab3:
     st.subheader("Exportar Orçamento")
     
     if df_editado_pv is not None and not df_editado_pv.empty:
+        formato_export = st.radio("Formato do arquivo:", ["Excel (.xlsx)", "CSV", "Parquet"], horizontal=True, key="formato_export")
+        df_itens_export = df_editado_pv.rename(columns={"Item Padrão": "descricao", "Unidade": "unidade", "Quantidade": "quantidade", "PV Unitário Final": "valor_unitario"})
         output = io.BytesIO()
-        df_export = df_editado_pv.rename(columns={"Item Padrão": "Descrição", "Unidade": "Unidade de Medida", "PV Unitário Final": "Preço Unitário", "PV Total Final Item": "Preço Total"})
-        df_export.insert(0, "Item", np.arange(1, len(df_export) + 1))
-        df_export = df_export[["Item", "Descrição", "Unidade de Medida", "Quantidade", "Preço Unitário", "Preço Total"]]
-        
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df_export.to_excel(writer, index=False, sheet_name='Orçamento')
-        
-        st.download_button(label="📥 Baixar Orçamento em Excel", data=output.getvalue(), file_name="orcamento_final.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
\ No newline at end of file
+
+        if formato_export == "Excel (.xlsx)":
+            df_bdi_export = pd.DataFrame({
+                'Componente': ["Administração Central e Local (%)", "Custo Financeiro (%)", "Margem de Incerteza (%)", "Tributos (%)", "Lucro (%)", "Custo Direto (R$)", "Preço de Venda (R$)", "Lucro Bruto (R$)"],
+                'Mão de Obra': [float(st.session_state.get(chaves_mo[k], 0)) for k in ['ac', 'cf', 'mi', 'tributos', 'lucro']] + [st.session_state.get('custo_total_mo', 0), pv_mo, lucro_mo],
+                'Material': [float(st.session_state.get(chaves_mat[k], 0)) for k in ['ac', 'cf', 'mi', 'tributos', 'lucro']] + [st.session_state.get('custo_total_material', 0), pv_mat, lucro_mat],
+            })
+            observacoes_export = [{'data_criacao': datetime.now().strftime('%d/%m/%Y %H:%M'), 'texto_observacao': observacao_input}] if observacao_input and observacao_input.strip() else []
+            exportador.exportar_excel(output, exportador.linhas_do_dataframe(df_itens_export), df_bdi=df_bdi_export, df_simulacao=sim_df, observacoes=observacoes_export)
+            nome_arquivo, mime = "orcamento_final.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        elif formato_export == "CSV":
+            exportador.exportar_tabular(output, exportador.linhas_do_dataframe(df_itens_export), "csv")
+            nome_arquivo, mime = "orcamento_final.csv", "text/csv"
+        else:
+            exportador.exportar_tabular(output, exportador.linhas_do_dataframe(df_itens_export), "parquet")
+            nome_arquivo, mime = "orcamento_final.parquet", "application/octet-stream"
+
+        st.download_button(label="📥 Baixar Orçamento", data=output.getvalue(), file_name=nome_arquivo, mime=mime, use_container_width=True)
\ No newline at end of file
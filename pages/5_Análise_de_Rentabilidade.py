@@ -10,11 +10,29 @@ st.title("📊 Análise de Rentabilidade de Serviços")
 st.markdown("Analise a relação entre o custo cadastrado e o preço de venda médio praticado.")
 
 # --- Carregar e Cachear Dados ---
-@st.cache_data
-def carregar_dados():
-    return processador.consultar_dados_rentabilidade()
+@st.cache_data(max_entries=2)
+def carregar_dados(versoes: tuple, historico_completo: bool):
+    return processador.consultar_dados_rentabilidade(historico_completo=historico_completo)
 
-df_rentabilidade = carregar_dados()
+# Preço de venda de referência: a média é sensível a poucas linhas erradas; mediana,
+# média aparada e percentis não.
+METRICAS_PRECO = {
+    "Mediana": "preco_venda_mediana",
+    "Média": "preco_venda_medio",
+    "Média aparada (10%)": "preco_venda_media_aparada",
+    "Média ponderada pela quantidade": "preco_venda_media_ponderada",
+    "P10": "preco_venda_p10",
+    "P25": "preco_venda_p25",
+    "P75": "preco_venda_p75",
+    "P90": "preco_venda_p90",
+    "Atual (mediana dos últimos 12 meses)": "preco_venda_atual_12m",
+    "Atual (mediana dos últimos 6 meses)": "preco_venda_atual_6m",
+}
+
+# Obras arquivadas (ver Dashboard) entram nas estatísticas de venda, inclusive nos preços atuais, só se pedido.
+incluir_arquivadas = not processador.consultar_arquivos().empty and st.toggle("Incluir obras arquivadas")
+df_rentabilidade = carregar_dados(processador.versoes_dados("base_custos", "historico_custos", "itens_orcamento", "mapa_itens", "grupos_servico", "indice_precos", "arquivo_obras"),
+                                  incluir_arquivadas)
 
 if df_rentabilidade.empty:
     st.warning("Nenhum dado de rentabilidade para analisar. Verifique se sua Base de Custos e seu Histórico de Vendas estão preenchidos.")
@@ -26,7 +44,7 @@ st.subheader("Filtros e Pesquisa")
 # Obter lista de grupos únicos para o filtro
 lista_grupos = ["Todos"] + sorted(df_rentabilidade['nome_grupo'].unique().tolist())
 
-col1, col2 = st.columns([1, 2])
+col1, col2, col3 = st.columns([1, 2, 1])
 with col1:
     grupo_selecionado = st.selectbox(
         "Filtrar por Grupo de Serviço:",
@@ -37,6 +55,12 @@ with col2:
         "Pesquisar por nome do serviço:",
         placeholder="Digite para filtrar os itens abaixo..."
     )
+with col3:
+    metrica_preco = st.selectbox(
+        "Preço de venda de referência:",
+        options=list(METRICAS_PRECO),
+        help="Estatística dos preços praticados usada na margem e no gráfico."
+    )
 
 # Aplicar filtros
 df_filtrado = df_rentabilidade.copy()
@@ -46,20 +70,44 @@ if grupo_selecionado != "Todos":
 if termo_pesquisa:
     df_filtrado = df_filtrado[df_filtrado['item_padrao'].str.contains(termo_pesquisa, case=False, na=False)]
 
+# Margem recalculada sobre a estatística escolhida
+coluna_preco = METRICAS_PRECO[metrica_preco]
+if coluna_preco.startswith("preco_venda_atual_") and st.toggle(
+        "Corrigir o preço atual pelo índice de preços", value=True,
+        help="Leva cada preço da janela ao nível do mês mais recente do índice antes de calcular a mediana."):
+    coluna_preco += "_corrigido"
+df_filtrado['preco_referencia'] = df_filtrado[coluna_preco]
+df_filtrado['margem_bruta_rs'] = df_filtrado['preco_referencia'] - df_filtrado['custo_total_unitario']
+df_filtrado['margem_bruta_perc'] = (df_filtrado['margem_bruta_rs'] / df_filtrado['preco_referencia'].replace(0, float('nan'))).fillna(0) * 100
+mostrar_estatisticas = st.toggle("Mostrar todas as estatísticas de preço")
+
 # --- Tabela de Dados ---
 st.subheader("Dados Consolidados de Custo vs. Preço")
 
+colunas_exibidas = ['item_padrao', 'nome_grupo', 'unidade_de_medida', 'custo_total_unitario', 'preco_referencia',
+                    'num_orcamentos', 'margem_bruta_rs', 'margem_bruta_perc', 'custo_medio_na_venda', 'margem_na_venda_perc']
+if mostrar_estatisticas:
+    colunas_exibidas += [coluna for coluna in METRICAS_PRECO.values()] + ['tendencia_anual_perc']
+
 st.dataframe(
     df_filtrado,
+    column_order=colunas_exibidas,
     column_config={
         "item_padrao": st.column_config.TextColumn("Serviço Padrão", width="large"),
         "nome_grupo": st.column_config.TextColumn("Grupo"),
         "unidade_de_medida": st.column_config.TextColumn("Un."),
         "custo_total_unitario": st.column_config.NumberColumn("Custo Unitário", format="R$ %.2f"),
-        "preco_venda_medio": st.column_config.NumberColumn("Preço Médio Venda", format="R$ %.2f"),
+        "preco_referencia": st.column_config.NumberColumn(f"Preço Venda ({metrica_preco})", format="R$ %.2f"),
+        **{coluna: st.column_config.NumberColumn(rotulo, format="R$ %.2f") for rotulo, coluna in METRICAS_PRECO.items()},
+        "tendencia_anual_perc": st.column_config.NumberColumn("Tendência (%/ano)", format="%.1f%%",
+                                                              help="Variação anual do preço (corrigido) nos últimos 12 meses."),
         "num_orcamentos": st.column_config.NumberColumn("Nº Orçamentos", help="Número de orçamentos em que este item aparece."),
         "margem_bruta_rs": st.column_config.NumberColumn("Margem (R$)", format="R$ %.2f"),
-        "margem_bruta_perc": st.column_config.NumberColumn("Margem (%)", format="%.2f%%")
+        "margem_bruta_perc": st.column_config.NumberColumn("Margem (%)", format="%.2f%%"),
+        "custo_medio_na_venda": st.column_config.NumberColumn("Custo na Venda", format="R$ %.2f",
+                                                              help="Média do custo vigente na data de cada venda."),
+        "margem_na_venda_perc": st.column_config.NumberColumn("Margem na Venda (%)", format="%.2f%%",
+                                                              help="Cada venda comparada ao custo vigente quando foi feita, ponderada pela quantidade.")
     },
     use_container_width=True,
     hide_index=True
@@ -75,8 +123,8 @@ if not df_filtrado.empty:
     fig = px.bar(
         df_grafico,
         x='item_padrao',
-        y=['custo_total_unitario', 'preco_venda_medio'],
-        title='Comparativo de Custo Unitário vs. Preço de Venda Médio',
+        y=['custo_total_unitario', 'preco_referencia'],
+        title=f'Comparativo de Custo Unitário vs. Preço de Venda ({metrica_preco})',
         labels={
             'item_padrao': 'Serviço',
             'value': 'Valor (R$)',
@@ -88,4 +136,69 @@ if not df_filtrado.empty:
     fig.update_traces(textangle=0, textposition="outside")
     st.plotly_chart(fig, use_container_width=True)
 else:
-    st.info("Nenhum serviço encontrado para os filtros aplicados.")
\ No newline at end of file
+    st.info("Nenhum serviço encontrado para os filtros aplicados.")
+
+# --- Margem por Obra ---
+st.subheader("Margem por Obra (Custo da Base vs. Preço Vendido)")
+st.caption("Cada linha vendida é custeada pelo custo do seu Item Padrão vigente na data da venda; a margem considera só as linhas com custo cadastrado.")
+
+@st.cache_data(max_entries=2)
+def carregar_margens(versoes: tuple):
+    return processador.consultar_margem_por_obra(), processador.consultar_margem_por_grupo()
+
+@st.cache_data(max_entries=8)
+def carregar_margens_da_obra(nome_obra: str, versoes: tuple):
+    return processador.consultar_margem_por_grupo(nome_obra), processador.consultar_margem_itens_da_obra(nome_obra)
+
+versoes_margem = processador.versoes_dados(*processador.FONTES_FATO_MARGEM)
+df_margem_obras, df_margem_grupos = carregar_margens(versoes_margem)
+formato_margem = {
+    "nome_obra": st.column_config.TextColumn("Obra", width="large"),
+    "nome_cliente": st.column_config.TextColumn("Cliente"),
+    "nome_grupo": st.column_config.TextColumn("Grupo", width="large"),
+    "item_padrao": st.column_config.TextColumn("Serviço Padrão", width="large"),
+    "receita": st.column_config.NumberColumn("Receita", format="R$ %.2f"),
+    "receita_com_custo": st.column_config.NumberColumn("Receita c/ Custo", format="R$ %.2f",
+                                                       help="Receita das linhas cujo item tem custo cadastrado."),
+    "custo": st.column_config.NumberColumn("Custo", format="R$ %.2f"),
+    "margem": st.column_config.NumberColumn("Margem (R$)", format="R$ %.2f"),
+    "margem_perc": st.column_config.NumberColumn("Margem (%)", format="%.2f%%"),
+}
+
+if df_margem_obras.empty:
+    st.info("Nenhuma obra com itens mapeados para calcular a margem.")
+else:
+    aba_obras, aba_grupos = st.tabs(["Por Obra", "Por Grupo"])
+    with aba_obras:
+        st.dataframe(df_margem_obras, column_config=formato_margem, hide_index=True, use_container_width=True)
+        obra_detalhe = st.selectbox("Detalhar obra:", options=df_margem_obras['nome_obra'].tolist())
+        if obra_detalhe:
+            grupos_obra, itens_obra = carregar_margens_da_obra(obra_detalhe, versoes_margem)
+            st.dataframe(grupos_obra, column_config=formato_margem, hide_index=True, use_container_width=True)
+            with st.expander("Itens da obra"):
+                st.dataframe(itens_obra.drop(columns=['nome_obra', 'nome_cliente']), column_config=formato_margem,
+                             hide_index=True, use_container_width=True)
+    with aba_grupos:
+        st.dataframe(df_margem_grupos, column_config=formato_margem, hide_index=True, use_container_width=True)
+
+# --- Índice de Preços ---
+if 'mensagem_indice_precos' in st.session_state:
+    st.success(st.session_state.pop('mensagem_indice_precos'))
+
+with st.expander("Índice de preços para correção (ex.: INCC)"):
+    st.caption("Um valor por mês (AAAA-MM). Os preços atuais corrigidos usam o mês mais recente como referência.")
+    df_indice = st.data_editor(
+        processador.consultar_indice_precos(), num_rows="dynamic", hide_index=True,
+        column_config={
+            "mes": st.column_config.TextColumn("Mês (AAAA-MM)", required=True),
+            "valor": st.column_config.NumberColumn("Valor do índice", min_value=0.0, format="%.4f", required=True),
+        },
+        key="editor_indice_precos"
+    )
+    if st.button("Salvar índice"):
+        try:
+            total = processador.salvar_indice_precos(df_indice)
+            st.session_state.mensagem_indice_precos = f"Índice salvo com {total} meses."
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
@@ -0,0 +1,125 @@
+# pages/6_Padronização_de_Itens.py
+import streamlit as st
+import pandas as pd
+from scripts import tarefas, agrupamento_descricoes
+
+# --- Configuração da Página ---
+st.set_page_config(page_title="SIO | Padronização de Itens", layout="wide")
+st.title("🧩 Padronização de Itens")
+st.markdown(
+    "Agrupe as descrições do histórico que ainda não têm Item Padrão. Descrições quase iguais "
+    "(acentos, maiúsculas, pequenos erros de digitação) são reunidas e recebem um Item Padrão sugerido."
+)
+
+GRUPOS_POR_PAGINA = 50
+
+# Tarefas que ficaram pela metade (ex.: servidor reiniciado) continuam do último lote gravado.
+tarefas.retomar_tarefas_interrompidas()
+
+@st.fragment(run_every=1)
+def _aguardar_agrupamento(id_job):
+    tarefa = tarefas.consultar_tarefa(id_job)
+    if tarefa is None or tarefa['status'] not in tarefas.STATUS_ATIVOS:
+        st.rerun()  # Tarefa terminou: recarrega a página inteira para exibir os grupos
+    st.info("Agrupando descrições em segundo plano... você pode atualizar ou fechar esta página.")
+
+# --- Disparo do Agrupamento ---
+col_score, col_botao = st.columns([2, 1])
+with col_score:
+    score_minimo = st.slider(
+        "Similaridade mínima para unir duas descrições (%)", min_value=80, max_value=100,
+        value=agrupamento_descricoes.SCORE_MINIMO,
+        help="Valores mais altos juntam apenas variações de escrita; valores mais baixos arriscam juntar serviços diferentes."
+    )
+with col_botao:
+    st.write("")
+    if st.button("Procurar descrições parecidas", type="primary", use_container_width=True):
+        st.session_state.job_agrupamento = tarefas.submeter_tarefa(
+            "agrupar_descricoes", parametros={'score_minimo': score_minimo}, payload=None,
+            descricao="Agrupamento de descrições sem mapeamento"
+        )
+        st.session_state.grupos_aplicados = set()
+
+id_job = st.session_state.get('job_agrupamento')
+if not id_job:
+    st.stop()
+tarefa = tarefas.consultar_tarefa(id_job)
+if tarefa is None:
+    del st.session_state['job_agrupamento']
+    st.stop()
+if tarefa['status'] in tarefas.STATUS_ATIVOS:
+    _aguardar_agrupamento(id_job)
+    st.stop()
+if tarefa['status'] == tarefas.STATUS_ERRO:
+    st.error(f"Ocorreu um erro ao agrupar as descrições: {tarefa['erro']}")
+    st.stop()
+
+# --- Revisão dos Grupos Propostos ---
+if 'mensagem_agrupamento' in st.session_state:
+    st.success(st.session_state.pop('mensagem_agrupamento'))
+aplicados = st.session_state.setdefault('grupos_aplicados', set())
+grupos = [g for g in tarefa['resultado'].get('grupos', []) if g['id_grupo'] not in aplicados]
+if not grupos:
+    st.success("Nenhum grupo pendente de aprovação. Rode o agrupamento novamente após novas importações.")
+    st.stop()
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Grupos propostos", len(grupos))
+col2.metric("Descrições agrupadas", sum(len(g['descricoes']) for g in grupos))
+col3.metric("Associados a itens existentes", sum(g['origem'] == 'existente' for g in grupos))
+
+termo_pesquisa = st.text_input(
+    "Pesquisar nos grupos:", placeholder="Filtre por qualquer descrição do grupo...",
+    on_change=lambda: st.session_state.update(pagina_agrupamento=1)
+)
+if termo_pesquisa:
+    termo = termo_pesquisa.lower()
+    grupos = [g for g in grupos if any(termo in d.lower() for d in g['descricoes'])]
+
+total_paginas = max(1, -(-len(grupos) // GRUPOS_POR_PAGINA))
+if st.session_state.get('pagina_agrupamento', 1) > total_paginas:
+    # Grupos aprovados saem da lista; a página guardada pode ter deixado de existir.
+    st.session_state.pagina_agrupamento = total_paginas
+col_info, col_pagina = st.columns([3, 1])
+with col_pagina:
+    pagina_atual = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key="pagina_agrupamento")
+with col_info:
+    st.caption(f"{len(grupos)} grupos — página {pagina_atual} de {total_paginas}")
+grupos_da_pagina = grupos[(pagina_atual - 1) * GRUPOS_POR_PAGINA:pagina_atual * GRUPOS_POR_PAGINA]
+
+marcar_todos = st.checkbox("Marcar todos os grupos desta página")
+df_revisao = pd.DataFrame([{
+    'aprovar': marcar_todos,
+    'item_padrao_sugerido': g['item_padrao_sugerido'],
+    'origem': "Item existente" if g['origem'] == 'existente' else "Novo item",
+    'num_descricoes': len(g['descricoes']),
+    'ocorrencias': g['ocorrencias'],
+    'descricoes': " | ".join(g['descricoes']),
+} for g in grupos_da_pagina], index=[g['id_grupo'] for g in grupos_da_pagina])
+
+df_editado = st.data_editor(
+    df_revisao,
+    column_config={
+        "aprovar": st.column_config.CheckboxColumn("Aprovar"),
+        "item_padrao_sugerido": st.column_config.TextColumn("Item Padrão", width="large", required=True),
+        "origem": st.column_config.TextColumn("Origem"),
+        "num_descricoes": st.column_config.NumberColumn("Nº Descrições"),
+        "ocorrencias": st.column_config.NumberColumn("Ocorrências", help="Quantas vezes as descrições do grupo aparecem nos orçamentos."),
+        "descricoes": st.column_config.TextColumn("Descrições do Grupo", width="large"),
+    },
+    disabled=["origem", "num_descricoes", "ocorrencias", "descricoes"],
+    hide_index=True, use_container_width=True,
+    key=f"editor_agrupamento_{id_job}_{len(aplicados)}_{pagina_atual}_{marcar_todos}_{termo_pesquisa}"
+)
+
+selecionados = df_editado[df_editado['aprovar']]
+if st.button(f"Aprovar {len(selecionados)} grupo(s) selecionado(s)", type="primary", disabled=selecionados.empty):
+    por_id = {g['id_grupo']: g for g in grupos_da_pagina}
+    aprovados = [
+        {**por_id[id_grupo], 'item_padrao_sugerido': str(linha['item_padrao_sugerido']).strip()}
+        for id_grupo, linha in selecionados.iterrows()
+    ]
+    total = agrupamento_descricoes.aplicar_agrupamentos(aprovados)
+    aplicados.update(g['id_grupo'] for g in aprovados)
+    st.session_state.mensagem_agrupamento = f"{total} descrições foram mapeadas para {len(aprovados)} Itens Padrão."
+    st.rerun()
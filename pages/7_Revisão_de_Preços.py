@@ -0,0 +1,67 @@
+# pages/7_Revisão_de_Preços.py
+import streamlit as st
+from scripts import processador, estatistica_precos
+
+# --- Configuração da Página ---
+st.set_page_config(page_title="SIO | Revisão de Preços", layout="wide")
+st.title("🔎 Revisão de Preços Atípicos")
+st.markdown(
+    "Linhas importadas cujo valor unitário foge muito do histórico do seu Item Padrão "
+    "(ex.: unidade trocada ou separador decimal errado). Enquanto não forem revisadas, "
+    "ficam fora das médias do Dashboard e da Análise de Rentabilidade."
+)
+
+ACAO_MANTER = "Revisar depois"
+ACAO_CONFIRMAR = "Preço correto"
+ACAO_EXCLUIR = "Excluir linha"
+
+if 'mensagem_revisao_precos' in st.session_state:
+    st.success(st.session_state.pop('mensagem_revisao_precos'))
+
+with st.expander("Reavaliar todo o histórico"):
+    st.caption(
+        f"Marca as linhas com escore robusto acima de {estatistica_precos.LIMITE_ESCORE_ROBUSTO} "
+        f"(itens com pelo menos {estatistica_precos.MIN_AMOSTRAS} preços no histórico). "
+        "Linhas já confirmadas como corretas não são marcadas de novo."
+    )
+    if st.button("Reavaliar histórico"):
+        with st.spinner("Analisando o histórico..."):
+            total = processador.reavaliar_precos_do_historico()
+        st.session_state.mensagem_revisao_precos = f"{total} linha(s) marcadas com preço atípico."
+        st.rerun()
+
+df_atipicos = processador.consultar_precos_atipicos()
+if df_atipicos.empty:
+    st.info("Nenhuma linha com preço atípico aguardando revisão.")
+    st.stop()
+
+col1, col2 = st.columns(2)
+col1.metric("Linhas para revisar", len(df_atipicos))
+col2.metric("Itens Padrão afetados", df_atipicos['item_padrao'].nunique())
+
+df_atipicos.insert(0, "acao", ACAO_MANTER)
+df_editado = st.data_editor(
+    df_atipicos.set_index('id'),
+    column_config={
+        "acao": st.column_config.SelectboxColumn("Ação", options=[ACAO_MANTER, ACAO_CONFIRMAR, ACAO_EXCLUIR], required=True),
+        "item_padrao": st.column_config.Column("Item Padrão", width="large"),
+        "descricao": st.column_config.Column("Descrição Original", width="large"),
+        "nome_obra": "Obra", "nome_cliente": "Cliente", "arquivo_original": "Arquivo",
+        "valor_unitario": st.column_config.NumberColumn("Valor Unitário", format="R$ %.2f"),
+        "mediana": st.column_config.NumberColumn("Mediana do Item", format="R$ %.2f"),
+        "amostras": st.column_config.NumberColumn("Preços no Histórico"),
+        "razao": st.column_config.NumberColumn("Valor / Mediana", format="%.2fx"),
+    },
+    column_order=["acao", "item_padrao", "descricao", "valor_unitario", "mediana", "razao", "amostras",
+                  "unidade", "quantidade", "nome_obra", "nome_cliente", "arquivo_original"],
+    disabled=df_atipicos.columns.drop(["acao", "id"]),
+    hide_index=True, use_container_width=True, key=f"editor_precos_{len(df_atipicos)}"
+)
+
+confirmar = df_editado.index[df_editado['acao'] == ACAO_CONFIRMAR].tolist()
+excluir = df_editado.index[df_editado['acao'] == ACAO_EXCLUIR].tolist()
+if st.button(f"Aplicar revisão ({len(confirmar)} confirmadas, {len(excluir)} excluídas)", type="primary",
+             disabled=not confirmar and not excluir):
+    processador.revisar_precos_atipicos(confirmar=confirmar, excluir=excluir)
+    st.session_state.mensagem_revisao_precos = f"{len(confirmar)} linha(s) confirmadas e {len(excluir)} excluídas."
+    st.rerun()
@@ -0,0 +1,221 @@
+# scripts/agrupamento_descricoes.py
+import argparse
+import re
+import sys
+import zlib
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from scripts import processador
+from scripts.normalizacao import normalizar_para_busca
+
+# --- Agrupamento de Descrições Quase Duplicadas ----------------------------- #
+# Agrupa as descrições do histórico que ainda não têm item padrão. Comparar todas
+# contra todas é O(n²); em vez disso, cada descrição recebe uma assinatura MinHash
+# dos seus trigramas de caracteres e só as que caem no mesmo balde LSH (bandas da
+# assinatura) são comparadas com o RapidFuzz. Os pares confirmados são unidos com
+# union-find, e cada grupo recebe um item padrão sugerido para aprovação em lote.
+NUM_PERMUTACOES = 64
+LINHAS_POR_BANDA = 4          # 16 bandas de 4 linhas: pares com Jaccard acima de ~0,5 viram candidatos
+TAMANHO_SHINGLE = 3
+SCORE_MINIMO = 92             # fuzz.token_sort_ratio para confirmar que duas descrições são o mesmo serviço
+SCORE_MINIMO_PALAVRA = 80     # fuzz.ratio para considerar uma palavra um erro de digitação de outra
+SCORE_ITEM_EXISTENTE = 90     # acima disso o grupo é associado a um item padrão já cadastrado
+MAX_BALDE = 64                # baldes maiores são comparados em estrela (todos contra o primeiro)
+TAMANHO_BLOCO = 2048
+
+_RE_NUMEROS = re.compile(r"\d+")
+PALAVRAS_IGNORADAS = {"a", "o", "e", "de", "da", "do", "das", "dos", "em", "com", "c", "p", "para"}
+
+_gerador = np.random.default_rng(20240601)
+_COEF_A = _gerador.integers(1, 2**63, size=NUM_PERMUTACOES, dtype=np.uint64) | np.uint64(1)
+_COEF_B = _gerador.integers(0, 2**63, size=NUM_PERMUTACOES, dtype=np.uint64)
+
+
+def _shingles(texto: str) -> np.ndarray:
+    """Hashes (CRC32) dos trigramas distintos do texto normalizado."""
+    texto = f" {texto} "
+    if len(texto) <= TAMANHO_SHINGLE:
+        partes = {texto}
+    else:
+        partes = {texto[i:i + TAMANHO_SHINGLE] for i in range(len(texto) - TAMANHO_SHINGLE + 1)}
+    return np.fromiter((zlib.crc32(p.encode("utf-8")) for p in partes), dtype=np.uint64, count=len(partes))
+
+def calcular_assinaturas(textos: list) -> np.ndarray:
+    """
+    Assinaturas MinHash (n x NUM_PERMUTACOES, uint32). Cada permutação é um hash
+    multiplicativo a*h + b (mod 2^64), do qual se guardam os 32 bits altos.
+    """
+    assinaturas = np.empty((len(textos), NUM_PERMUTACOES), dtype=np.uint32)
+    for inicio in range(0, len(textos), TAMANHO_BLOCO):
+        hashes = [_shingles(t) for t in textos[inicio:inicio + TAMANHO_BLOCO]]
+        tamanhos = np.fromiter((len(h) for h in hashes), dtype=np.int64, count=len(hashes))
+        inicios = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+        todos = np.concatenate(hashes)
+        with np.errstate(over="ignore"):
+            permutados = (_COEF_A[:, None] * todos[None, :] + _COEF_B[:, None]) >> np.uint64(32)
+        assinaturas[inicio:inicio + len(hashes)] = np.minimum.reduceat(permutados, inicios, axis=1).T
+    return assinaturas
+
+def pares_candidatos(assinaturas: np.ndarray) -> np.ndarray:
+    """Pares (i, j), i < j, que coincidem em pelo menos uma banda da assinatura."""
+    n = len(assinaturas)
+    blocos = []
+    for banda in range(NUM_PERMUTACOES // LINHAS_POR_BANDA):
+        fatia = np.ascontiguousarray(assinaturas[:, banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA])
+        _, baldes = np.unique(fatia.view(np.dtype((np.void, fatia.dtype.itemsize * LINHAS_POR_BANDA))).ravel(), return_inverse=True)
+        ordem = np.argsort(baldes, kind="stable")
+        limites = np.flatnonzero(np.diff(baldes[ordem])) + 1
+        for membros in np.split(ordem, limites):
+            if len(membros) < 2:
+                continue
+            if len(membros) > MAX_BALDE:
+                blocos.append(np.column_stack((np.full(len(membros) - 1, membros[0]), membros[1:])))
+            else:
+                a, b = np.triu_indices(len(membros), k=1)
+                blocos.append(np.column_stack((membros[a], membros[b])))
+    if not blocos:
+        return np.empty((0, 2), dtype=np.int64)
+    pares = np.concatenate(blocos).astype(np.int64)
+    pares.sort(axis=1)
+    # Um par pode coincidir em várias bandas: remove as repetições codificando (i, j) em um só inteiro.
+    codigos = np.unique(pares[:, 0] * n + pares[:, 1])
+    return np.column_stack((codigos // n, codigos % n))
+
+def _numeros(texto: str) -> tuple:
+    # Medidas e quantidades (60x60, 14cm, 2 demãos) distinguem serviços: só são unidos textos com os mesmos números.
+    return tuple(sorted(_RE_NUMEROS.findall(texto)))
+
+def _palavras(texto: str) -> frozenset:
+    return frozenset(p for p in texto.split() if p not in PALAVRAS_IGNORADAS)
+
+def _palavras_compativeis(palavras_a: frozenset, palavras_b: frozenset) -> bool:
+    """
+    Cada palavra que só aparece em um dos textos precisa ser um erro de digitação de
+    alguma palavra do outro (ex.: 'alvenria'/'alvenaria'). Assim 'interno'/'externo'
+    ou 'parede'/'teto' não unem serviços diferentes, mesmo com score alto no texto todo.
+    """
+    for sobra, outro in ((palavras_a - palavras_b, palavras_b), (palavras_b - palavras_a, palavras_a)):
+        for palavra in sobra:
+            if not outro or process.extractOne(palavra, outro, scorer=fuzz.ratio, score_cutoff=SCORE_MINIMO_PALAVRA) is None:
+                return False
+    return True
+
+def _raiz(pais: np.ndarray, i: int) -> int:
+    while pais[i] != i:
+        pais[i] = pais[pais[i]]
+        i = pais[i]
+    return i
+
+def agrupar_textos(textos: list, score_minimo: int = SCORE_MINIMO) -> np.ndarray:
+    """
+    Rótulo de grupo para cada texto (já normalizado). Textos sem nenhum par
+    confirmado ficam sozinhos no próprio grupo. Como a união é transitiva, o limiar
+    é alto: variações de escrita se juntam, serviços vizinhos não.
+    """
+    pais = np.arange(len(textos))
+    if len(textos) < 2:
+        return pais
+    pares = pares_candidatos(calcular_assinaturas(textos))
+    # Filtro barato antes do RapidFuzz: os números dos dois textos precisam ser os mesmos.
+    codigos_numeros, _ = pd.factorize(pd.Series([_numeros(t) for t in textos]))
+    pares = pares[codigos_numeros[pares[:, 0]] == codigos_numeros[pares[:, 1]]]
+    if len(pares):
+        scores = process.cpdist([textos[i] for i in pares[:, 0]], [textos[j] for j in pares[:, 1]],
+                                scorer=fuzz.token_sort_ratio, workers=-1)
+        palavras = [_palavras(t) for t in textos]
+        for i, j in pares[scores >= score_minimo]:
+            if not _palavras_compativeis(palavras[i], palavras[j]):
+                continue
+            raiz_i, raiz_j = _raiz(pais, i), _raiz(pais, j)
+            if raiz_i != raiz_j:
+                pais[max(raiz_i, raiz_j)] = min(raiz_i, raiz_j)
+    return np.array([_raiz(pais, i) for i in range(len(textos))])
+
+def agrupar_descricoes(df_descricoes: pd.DataFrame, itens_padrao: list = None, score_minimo: int = SCORE_MINIMO) -> list:
+    """
+    Recebe um DataFrame com 'descricao' e 'ocorrencias' e devolve os grupos com mais de
+    uma descrição, do mais frequente para o menos frequente:
+    [{'id_grupo', 'item_padrao_sugerido', 'origem' ('existente'|'nova'), 'score_item_existente',
+      'descricoes', 'ocorrencias'}, ...]
+    O nome sugerido é o item padrão já cadastrado mais parecido (se passar de
+    SCORE_ITEM_EXISTENTE) ou, senão, a descrição mais frequente do grupo.
+    """
+    if df_descricoes.empty:
+        return []
+    df = df_descricoes[['descricao', 'ocorrencias']].copy()
+    df['texto'] = [normalizar_para_busca(d) for d in df['descricao']]
+    df = df[df['texto'].str.strip() != ""].reset_index(drop=True)
+    df['rotulo'] = agrupar_textos(df['texto'].tolist(), score_minimo)
+
+    tamanhos = df['rotulo'].map(df['rotulo'].value_counts())
+    df = df[tamanhos > 1]
+    if df.empty:
+        return []
+    # A descrição canônica é a mais frequente; empates ficam com a mais curta.
+    df = df.assign(comprimento=df['descricao'].str.len()).sort_values(
+        ['rotulo', 'ocorrencias', 'comprimento', 'descricao'], ascending=[True, False, True, True]
+    )
+    grupos = []
+    for rotulo, membros in df.groupby('rotulo', sort=False):
+        grupos.append({
+            'item_padrao_sugerido': membros['descricao'].iloc[0], 'texto': membros['texto'].iloc[0],
+            'origem': 'nova', 'score_item_existente': 0,
+            'descricoes': membros['descricao'].tolist(), 'ocorrencias': int(membros['ocorrencias'].sum()),
+        })
+
+    if itens_padrao:
+        opcoes = [normalizar_para_busca(i) for i in itens_padrao]
+        matriz = process.cdist([g['texto'] for g in grupos], opcoes, scorer=fuzz.token_sort_ratio, workers=-1)
+        melhores = matriz.argmax(axis=1)
+        for grupo, j, score in zip(grupos, melhores, matriz[np.arange(len(grupos)), melhores]):
+            if score >= SCORE_ITEM_EXISTENTE:
+                grupo.update(item_padrao_sugerido=itens_padrao[j], origem='existente', score_item_existente=int(round(score)))
+
+    grupos.sort(key=lambda g: (-g['ocorrencias'], g['item_padrao_sugerido']))
+    for numero, grupo in enumerate(grupos, start=1):
+        del grupo['texto']
+        grupo['id_grupo'] = numero
+    return grupos
+
+def propor_agrupamentos(score_minimo: int = SCORE_MINIMO) -> list:
+    """Agrupa todas as descrições sem mapeamento da base."""
+    return agrupar_descricoes(
+        processador.consultar_descricoes_sem_mapeamento(), processador.consultar_itens_padrao(), score_minimo
+    )
+
+def aplicar_agrupamentos(grupos: list) -> int:
+    """Mapeia todas as descrições de cada grupo aprovado para o seu 'item_padrao_sugerido'."""
+    mapeamentos = {
+        descricao: grupo['item_padrao_sugerido']
+        for grupo in grupos if grupo.get('item_padrao_sugerido')
+        for descricao in grupo['descricoes']
+    }
+    return processador.salvar_mapeamentos_em_lote(mapeamentos)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Agrupa descrições sem mapeamento e sugere um item padrão por grupo.")
+    parser.add_argument("--score", type=int, default=SCORE_MINIMO, help="Similaridade mínima (token_sort_ratio) para unir duas descrições.")
+    parser.add_argument("-o", "--saida", help="Grava os grupos propostos em CSV (um grupo por linha) para revisão.")
+    parser.add_argument("--aplicar", action="store_true", help="Aplica todos os grupos propostos sem revisão.")
+    args = parser.parse_args(argv)
+
+    grupos = propor_agrupamentos(args.score)
+    total_descricoes = sum(len(g['descricoes']) for g in grupos)
+    print(f"{len(grupos)} grupos propostos cobrindo {total_descricoes} descrições.")
+    for grupo in grupos[:20]:
+        print(f"  [{grupo['origem']}] {grupo['item_padrao_sugerido']} <- {len(grupo['descricoes'])} descrições, {grupo['ocorrencias']} ocorrências")
+
+    if args.saida:
+        pd.DataFrame([{**g, 'descricoes': " | ".join(g['descricoes'])} for g in grupos]).to_csv(
+            args.saida, sep=";", index=False, encoding="utf-8-sig"
+        )
+        print(f"Grupos gravados em {args.saida}.")
+    if args.aplicar:
+        print(f"{aplicar_agrupamentos(grupos)} mapeamentos gravados.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# scripts/benchmark.py
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+
+from scripts import processador, dados_sinteticos
+
+# --- Benchmark do Pipeline -------------------------------------------------- #
+# Uso: python -m scripts.benchmark [--obras 200 --linhas 200000 --linhas-planilha 2000
+#                                   --catalogo 1000 --repeticoes 3] [-o resultado.json]
+#                                  [--comparar anterior.json]
+# Tudo roda sobre dados sintéticos determinísticos (scripts/dados_sinteticos.py) em uma
+# pasta temporária; o banco real em data/ nunca é tocado. O JSON gravado com -o pode ser
+# passado em --comparar numa execução futura para ver a variação de cada etapa.
+CONSULTAS_FUZZY = 200
+
+
+def _cronometrar(funcao, repeticoes: int, preparar=None) -> list:
+    """Executa 'funcao' (com o argumento devolvido por 'preparar', se houver) e devolve os tempos."""
+    tempos = []
+    for i in range(repeticoes):
+        argumento = preparar(i) if preparar else None
+        inicio = time.perf_counter()
+        funcao(argumento) if preparar else funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+def _resumo(tempos: list, linhas: int) -> dict:
+    mediana = statistics.median(tempos)
+    return {
+        "tempos_s": tempos, "min_s": min(tempos), "mediana_s": mediana,
+        "media_s": statistics.fmean(tempos), "max_s": max(tempos),
+        "linhas": linhas, "linhas_por_s": linhas / mediana if mediana else None,
+    }
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent.parent, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def executar(obras: int, linhas: int, linhas_planilha: int, catalogo: int, repeticoes: int) -> dict:
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        pasta = Path(pasta)
+        caminho_db = pasta / "benchmark.db"
+        print(f"Gerando banco com {linhas} linhas, {obras} obras e catálogo de {catalogo} itens...")
+        dados_sinteticos.criar_banco_sintetico(caminho_db, linhas, num_obras=obras, num_itens=catalogo, com_custos=True)
+        planilha = dados_sinteticos.gerar_planilha_orcamento(pasta / "orcamento.xlsx", linhas_planilha, num_itens=catalogo)
+        df_custos, grupos = dados_sinteticos.gerar_base_custos(catalogo)
+        itens_padrao = dados_sinteticos.gerar_catalogo(catalogo)
+
+        with dados_sinteticos.usando_banco(caminho_db):
+            processador._garantir_tabelas()
+
+            print("ler_orcamento...")
+            tempos = _cronometrar(lambda: processador.ler_orcamento(planilha), repeticoes)
+            resultados["ler_orcamento"] = _resumo(tempos, linhas_planilha)
+            df_lido = processador.ler_orcamento(planilha)
+
+            print("preparar_dataframe...")
+            tempos = _cronometrar(processador.preparar_dataframe, repeticoes, preparar=lambda i: df_lido.copy())
+            resultados["preparar_dataframe"] = _resumo(tempos, len(df_lido))
+            df_preparado = processador.preparar_dataframe(df_lido.copy())
+
+            print("salvar_na_base...")
+            # Cada repetição grava como um arquivo novo, para a deduplicação não pular as linhas.
+            tempos = _cronometrar(
+                lambda i: processador.salvar_na_base(df_preparado, f"Obra Benchmark {i}", f"benchmark_{i}.xlsx", "Cliente Benchmark"),
+                repeticoes, preparar=lambda i: i
+            )
+            resultados["salvar_na_base"] = _resumo(tempos, len(df_preparado))
+
+            print("encontrar_melhor_correspondencia...")
+            consultas = df_preparado['descricao'].head(CONSULTAS_FUZZY).tolist()
+            tempos = _cronometrar(lambda: [processador.encontrar_melhor_correspondencia(q, itens_padrao) for q in consultas], repeticoes)
+            resultados["encontrar_melhor_correspondencia"] = _resumo(tempos, len(consultas))
+            # Referência: a versão em lote usada pela revisão de mapeamento, com as mesmas consultas.
+            tempos = _cronometrar(lambda: processador.sugerir_correspondencias_em_lote(consultas, itens_padrao), repeticoes)
+            resultados["sugerir_correspondencias_em_lote"] = _resumo(tempos, len(consultas))
+
+            print("salvar_custo_em_lote...")
+            tempos = _cronometrar(lambda: processador.salvar_custo_em_lote(df_custos, grupos), repeticoes)
+            resultados["salvar_custo_em_lote"] = _resumo(tempos, len(df_custos))
+
+            print("consultar_itens_com_mapeamento...")
+            total_historico = len(processador.consultar_itens_com_mapeamento())
+            tempos = _cronometrar(processador.consultar_itens_com_mapeamento, repeticoes)
+            resultados["consultar_itens_com_mapeamento"] = _resumo(tempos, total_historico)
+
+            print("consultar_dados_rentabilidade...")
+            tempos = _cronometrar(processador.consultar_dados_rentabilidade, repeticoes)
+            resultados["consultar_dados_rentabilidade"] = _resumo(tempos, total_historico)
+
+    return {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"), "commit": _commit_atual(),
+            "python": platform.python_version(), "pandas": pd.__version__, "plataforma": platform.platform(),
+            "parametros": {"obras": obras, "linhas": linhas, "linhas_planilha": linhas_planilha,
+                           "catalogo": catalogo, "repeticoes": repeticoes},
+        },
+        "resultados": resultados,
+    }
+
+def imprimir(relatorio: dict, anterior: dict = None) -> None:
+    print(f"\n{'Etapa':<36}{'Mediana':>10}{'Mín':>10}{'Linhas/s':>12}{'vs anterior':>14}")
+    for nome, r in relatorio["resultados"].items():
+        comparacao = ""
+        if anterior and nome in anterior.get("resultados", {}):
+            razao = r["mediana_s"] / max(anterior["resultados"][nome]["mediana_s"], 1e-12)
+            comparacao = f"{razao:.2f}x"
+        linhas_s = f"{r['linhas_por_s']:,.0f}" if r["linhas_por_s"] else "-"
+        print(f"{nome:<36}{r['mediana_s']:>9.3f}s{r['min_s']:>9.3f}s{linhas_s:>12}{comparacao:>14}")
+    if anterior and anterior["meta"].get("parametros") != relatorio["meta"]["parametros"]:
+        print("\nATENÇÃO: a execução anterior usou parâmetros diferentes; a comparação não é direta.")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de importação e consulta com dados sintéticos.")
+    parser.add_argument("--obras", type=int, default=200)
+    parser.add_argument("--linhas", type=int, default=200_000, help="Linhas do histórico no banco sintético.")
+    parser.add_argument("--linhas-planilha", type=int, default=2_000, help="Linhas da planilha de orçamento importada.")
+    parser.add_argument("--catalogo", type=int, default=1_000, help="Nº de itens padrão (base de custos e mapeamentos).")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("-o", "--saida", help="Grava o resultado em JSON.")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação.")
+    args = parser.parse_args(argv)
+
+    relatorio = executar(args.obras, args.linhas, args.linhas_planilha, args.catalogo, args.repeticoes)
+    anterior = json.loads(Path(args.comparar).read_text(encoding="utf-8")) if args.comparar else None
+    imprimir(relatorio, anterior)
+    if args.saida:
+        Path(args.saida).write_text(json.dumps(relatorio, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nResultado gravado em {args.saida}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
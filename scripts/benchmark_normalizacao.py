@@ -0,0 +1,81 @@
+# scripts/benchmark_normalizacao.py
+import random
+import re
+import sys
+import time
+import unicodedata
+import pandas as pd
+
+from scripts import normalizacao
+
+# --- Benchmark da Normalização de Texto ------------------------------------- #
+# Uso: python -m scripts.benchmark_normalizacao [nº de strings]
+# Compara as três implementações antigas (copiadas abaixo, como referência) com o
+# módulo scripts/normalizacao.py, e confere que os resultados são idênticos.
+
+
+def _preprocess_string_antigo(s):
+    if not isinstance(s, str): return ""
+    s = unicodedata.normalize("NFKD", s.lower()).encode("ascii", "ignore").decode("utf-8")
+    s = re.sub(r"[^a-z0-9\s]", "", s)
+    return s
+
+def _normalize_text_antigo(text):
+    if not isinstance(text, str): return ""
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("utf-8")
+    return re.sub(r"[\s-]+", "_", text.strip())
+
+def _limpar_texto_antigo(texto):
+    if not isinstance(texto, str):
+        return ""
+    texto_normalizado = unicodedata.normalize('NFKD', texto.lower())
+    texto_sem_acentos = ''.join(c for c in texto_normalizado if not unicodedata.combining(c))
+    texto_limpo = re.sub(r'[^a-z0-9\s]', ' ', texto_sem_acentos)
+    texto_final = " ".join(texto_limpo.split())
+    return texto_final if texto_final else ""
+
+PALAVRAS = [
+    "Demolição", "de", "alvenaria", "Execução", "PISO", "cerâmico", "PORCELANATO", "60x60", "m²",
+    "Pintura", "acrílica", "2 demãos", "Instalação", "elétrica", "(ponto)", "tubulação", "PVC", "ø50mm",
+    "Impermeabilização", "—", "manta", "asfáltica", "nº", "3", "Forro", "de gesso", "Ç", "ã", "Serviço",
+]
+
+def gerar_textos(quantidade: int, distintos: int, semente: int = 42) -> list:
+    """Gera 'quantidade' descrições sorteadas de um conjunto de 'distintos' textos (muitas repetições, como na prática)."""
+    rnd = random.Random(semente)
+    base = [" ".join(rnd.choice(PALAVRAS) for _ in range(rnd.randint(3, 10))) for _ in range(distintos)]
+    return [rnd.choice(base) for _ in range(quantidade)]
+
+def _cronometrar(funcao, textos) -> tuple[float, list]:
+    inicio = time.perf_counter()
+    resultado = [funcao(t) for t in textos]
+    return time.perf_counter() - inicio, resultado
+
+def executar(quantidade: int = 200_000, distintos: int = 5_000) -> list:
+    textos = gerar_textos(quantidade, distintos)
+    pares = [
+        ("busca", _preprocess_string_antigo, normalizacao.normalizar_para_busca),
+        ("cabecalho", _normalize_text_antigo, normalizacao.normalizar_cabecalho),
+        ("limpeza", _limpar_texto_antigo, normalizacao.limpar_texto),
+    ]
+    resultados = []
+    for nome, antigo, novo in pares:
+        tempo_antigo, saida_antiga = _cronometrar(antigo, textos)
+        tempo_novo, saida_nova = _cronometrar(novo, textos)
+        inicio = time.perf_counter()
+        saida_serie = normalizacao.normalizar_serie(pd.Series(textos), novo).tolist()
+        tempo_serie = time.perf_counter() - inicio
+        if saida_antiga != saida_nova or saida_antiga != saida_serie:
+            raise AssertionError(f"Resultado divergente no modo '{nome}'.")
+        resultados.append({
+            "modo": nome, "antigo_s": tempo_antigo, "escalar_s": tempo_novo, "serie_s": tempo_serie,
+            "ganho_escalar": tempo_antigo / max(tempo_novo, 1e-9), "ganho_serie": tempo_antigo / max(tempo_serie, 1e-9),
+        })
+    return resultados
+
+if __name__ == "__main__":
+    quantidade = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"Normalizando {quantidade} textos (5.000 distintos)...")
+    for r in executar(quantidade):
+        print(f"{r['modo']:<10} antigo: {r['antigo_s']:.3f}s | escalar: {r['escalar_s']:.3f}s ({r['ganho_escalar']:.1f}x) | "
+              f"Series: {r['serie_s']:.3f}s ({r['ganho_serie']:.1f}x)")
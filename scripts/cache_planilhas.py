@@ -0,0 +1,95 @@
+# scripts/cache_planilhas.py
+import hashlib
+import io
+import os
+import uuid
+import pandas as pd
+
+from scripts import processador
+
+# --- Cache de Planilhas Lidas ----------------------------------------------- #
+# A leitura com openpyxl é a etapa mais lenta da importação. O resultado de
+# ler_orcamento + preparar_dataframe é guardado em Parquet, com chave no SHA-256 do
+# arquivo + VERSAO_PARSER, e os arquivos menos usados são removidos quando o
+# tamanho total passa do limite.
+CACHE_DIR = processador.DATA_DIR / "cache"
+LIMITE_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def calcular_hash(conteudo: bytes) -> str:
+    return hashlib.sha256(conteudo).hexdigest()
+
+def _caminho_cache(hash_arquivo: str):
+    return CACHE_DIR / f"{hash_arquivo}_v{processador.VERSAO_PARSER}.parquet"
+
+def _normalizar_para_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Colunas de texto podem vir com tipos misturados da planilha (ex.: 'item' com 1 e '1.1'),
+    o que o Parquet não aceita. Converte tudo que não é texto para str, mantendo os nulos.
+    O mesmo tratamento é aplicado com ou sem cache, para o resultado ser idêntico.
+    """
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        valores = df[col].dropna()
+        if not valores.map(lambda v: isinstance(v, str)).any():
+            # Coluna sem texto (ex.: só números e None): vira numérica.
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        else:
+            df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) else (None if pd.isna(v) else str(v)))
+    return df
+
+def _registrar_uso(caminho) -> None:
+    # O mtime funciona como "último acesso" para a política LRU.
+    try:
+        os.utime(caminho)
+    except OSError:
+        pass
+
+def _aplicar_limite() -> None:
+    """Remove os arquivos menos usados até o cache caber em LIMITE_CACHE_BYTES."""
+    arquivos = [(p.stat().st_mtime, p.stat().st_size, p) for p in CACHE_DIR.glob("*.parquet")]
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= LIMITE_CACHE_BYTES:
+            break
+        caminho.unlink(missing_ok=True)
+        total -= tamanho
+
+def ler_orcamento_com_cache(conteudo: bytes, hash_arquivo: str = None) -> tuple[pd.DataFrame, str]:
+    """
+    Equivalente a preparar_dataframe(ler_orcamento(conteudo)), usando o cache quando o
+    mesmo arquivo já foi lido. Retorna (DataFrame preparado, SHA-256 do arquivo).
+    """
+    hash_arquivo = hash_arquivo or calcular_hash(conteudo)
+    caminho = _caminho_cache(hash_arquivo)
+    if caminho.exists():
+        try:
+            df = pd.read_parquet(caminho)
+            _registrar_uso(caminho)
+            return df, hash_arquivo
+        except Exception as e:
+            print(f"Cache de planilha corrompido ({caminho.name}), lendo novamente: {e}")
+            caminho.unlink(missing_ok=True)
+
+    df = _normalizar_para_parquet(processador.preparar_dataframe(processador.ler_orcamento(io.BytesIO(conteudo))))
+    temporario = CACHE_DIR / f".{uuid.uuid4().hex}.tmp"
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        # Grava em arquivo temporário e renomeia: leitores nunca veem um Parquet pela metade.
+        df.to_parquet(temporario, index=False)
+        os.replace(temporario, caminho)
+        _aplicar_limite()
+    except Exception as e:
+        print(f"Não foi possível gravar o cache da planilha: {e}")
+        temporario.unlink(missing_ok=True)
+    return df, hash_arquivo
+
+def limpar_cache() -> int:
+    """Apaga todo o cache de planilhas. Retorna o nº de arquivos removidos."""
+    removidos = 0
+    for caminho in CACHE_DIR.glob("*.parquet"):
+        caminho.unlink(missing_ok=True)
+        removidos += 1
+    return removidos
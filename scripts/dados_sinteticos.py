@@ -0,0 +1,155 @@
+# scripts/dados_sinteticos.py
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from scripts import processador
+
+# --- Dados Sintéticos ------------------------------------------------------- #
+# Gera históricos de orçamento com o mesmo formato da base real (poucas obras e
+# clientes, muitas linhas, descrições com variações de escrita), sempre a partir de
+# uma semente fixa: a mesma chamada produz sempre os mesmos dados.
+SERVICOS = [
+    "Pintura acrílica em parede", "Alvenaria de vedação bloco cerâmico", "Piso cerâmico 60x60",
+    "Forro de gesso acartonado", "Demolição de alvenaria", "Instalação de ponto elétrico",
+    "Impermeabilização com manta asfáltica", "Contrapiso argamassa e=5cm", "Reboco interno",
+    "Chapisco em parede", "Porta de madeira 80x210", "Janela de alumínio de correr",
+    "Tubulação PVC 50mm", "Revestimento cerâmico parede", "Limpeza final de obra",
+]
+COMPLEMENTOS = ["", " - 2 demãos", " tipo A", " padrão", " reforçado", " (inclusive material)", " c/ rejunte"]
+UNIDADES = ["m²", "m", "un", "m³", "vb", "kg"]
+
+
+def gerar_catalogo(num_itens: int = None) -> list:
+    """
+    Nomes de itens padrão. Até len(SERVICOS) * len(COMPLEMENTOS) são combinações
+    de serviço + complemento; acima disso, as combinações ganham um número de variante.
+    """
+    base = [s + c for s in SERVICOS for c in COMPLEMENTOS]
+    num_itens = num_itens or len(base)
+    return [base[i % len(base)] + (f" v{i // len(base)}" if i >= len(base) else "") for i in range(num_itens)]
+
+def _variacoes(catalogo: list) -> np.ndarray:
+    # Cada item aparece no histórico escrito de três formas: original, em maiúsculas e com ponto final.
+    descricoes = np.array(catalogo)
+    return np.concatenate([descricoes, np.char.upper(descricoes), np.char.add(descricoes, ".")])
+
+def gerar_historico(num_linhas: int, num_obras: int = 200, num_clientes: int = 40, semente: int = 42, num_itens: int = None) -> pd.DataFrame:
+    """DataFrame no formato da tabela itens_orcamento (sem 'id')."""
+    rng = np.random.default_rng(semente)
+    catalogo = gerar_catalogo(num_itens)
+    variacoes = _variacoes(catalogo)
+    obras = np.array([f"Obra {i:04d}" for i in range(num_obras)])
+    clientes = np.array([f"Cliente {i:03d}" for i in range(num_clientes)])
+    cliente_da_obra = rng.integers(0, num_clientes, num_obras)
+    inicio = datetime(2021, 1, 1)
+    data_da_obra = np.array([inicio + timedelta(days=int(d)) for d in rng.integers(0, 4 * 365, num_obras)])
+
+    idx_obra = np.sort(rng.integers(0, num_obras, num_linhas))
+    idx_desc = rng.integers(0, len(variacoes), num_linhas)
+    preco_base = 20 + (idx_desc % len(catalogo) % 100) * 7.5
+    valor_unitario = np.round(preco_base * rng.lognormal(0, 0.15, num_linhas), 2)
+    quantidade = np.round(rng.gamma(2.0, 25.0, num_linhas), 2)
+    return pd.DataFrame({
+        "descricao": variacoes[idx_desc],
+        "unidade": np.array(UNIDADES)[idx_desc % len(catalogo) % len(UNIDADES)],
+        "quantidade": quantidade,
+        "valor_unitario": valor_unitario,
+        "valor_total": np.round(quantidade * valor_unitario, 2),
+        "nome_obra": obras[idx_obra],
+        "arquivo_original": np.char.add(obras[idx_obra], " ORÇAMENTO.xlsx"),
+        "importado_em": data_da_obra[idx_obra],
+        "nome_cliente": clientes[cliente_da_obra[idx_obra]],
+    })
+
+def gerar_mapeamentos(fracao: float = 0.8, semente: int = 42, num_itens: int = None) -> dict:
+    """{descricao_original: item_padrao} para uma fração das variações de descrição."""
+    rng = np.random.default_rng(semente)
+    mapa = {}
+    for descricao in gerar_catalogo(num_itens):
+        for variacao in (descricao, descricao.upper(), descricao + "."):
+            if rng.random() < fracao:
+                mapa[variacao] = descricao
+    return mapa
+
+def gerar_base_custos(num_itens: int = None, semente: int = 42) -> tuple[pd.DataFrame, dict]:
+    """
+    Base de custos já com os nomes internos de coluna (como sai do reconhecedor de
+    planilhas de custo) e o mapeamento {item: grupo}, prontos para salvar_custo_em_lote.
+    """
+    rng = np.random.default_rng(semente)
+    catalogo = gerar_catalogo(num_itens)
+    n = len(catalogo)
+    df = pd.DataFrame({
+        "item_padrao_nome": catalogo,
+        "unidade_de_medida": [UNIDADES[i % len(UNIDADES)] for i in range(n)],
+        "custo_material": np.round(rng.uniform(5, 300, n), 2),
+        "custo_mao_de_obra": np.round(rng.uniform(5, 150, n), 2),
+        "homem_hora_profissional": np.round(rng.uniform(0.1, 3, n), 3),
+        "homem_hora_ajudante": np.round(rng.uniform(0.1, 3, n), 3),
+        "codigo_composicao": [f"C{i:05d}" for i in range(n)],
+        "numero_manual": [f"M{i % 50:02d}" for i in range(n)],
+        "peso_item": np.round(rng.uniform(0.5, 2, n), 2),
+    })
+    # O grupo é o serviço de origem do item (o catálogo percorre os complementos de cada serviço).
+    grupos = {item: f"Grupo {SERVICOS[i // len(COMPLEMENTOS) % len(SERVICOS)]}" for i, item in enumerate(catalogo)}
+    return df, grupos
+
+def gerar_planilha_orcamento(destino: Path, num_linhas: int, semente: int = 42, num_itens: int = None) -> Path:
+    """
+    Planilha .xlsx no formato dos orçamentos recebidos: título, linha em branco,
+    cabeçalho e valores ora numéricos, ora texto no padrão brasileiro ('1.234,56').
+    """
+    rng = np.random.default_rng(semente)
+    variacoes = _variacoes(gerar_catalogo(num_itens))
+    linhas = [["Planilha Orçamentária - Obra Sintética"], [], ["ITEM", "DESCRIÇÃO", "UNIDADE", "QUANTIDADE", "VALOR UNITÁRIO", "VALOR TOTAL"]]
+    for i in range(num_linhas):
+        quantidade = round(float(rng.gamma(2.0, 25.0)), 2)
+        valor = round(float(rng.uniform(10, 500)), 2)
+        if i % 3 == 0:
+            # Parte dos valores vem como texto formatado, como nas planilhas reais.
+            quantidade_celula = f"{quantidade:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+            valor_celula = f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        else:
+            quantidade_celula, valor_celula = quantidade, valor
+        linhas.append([f"{i // 20 + 1}.{i % 20 + 1}", variacoes[rng.integers(0, len(variacoes))], UNIDADES[i % len(UNIDADES)],
+                       quantidade_celula, valor_celula, round(quantidade * valor, 2)])
+    pd.DataFrame(linhas).to_excel(destino, header=False, index=False)
+    return Path(destino)
+
+@contextmanager
+def usando_banco(caminho: Path):
+    """Aponta o processador temporariamente para outro arquivo de banco."""
+    anterior = processador.DB_PATH
+    processador.DB_PATH = Path(caminho)
+    try:
+        yield processador.DB_PATH
+    finally:
+        processador.DB_PATH = anterior
+
+def criar_banco_sintetico(caminho: Path, num_linhas: int, num_obras: int = 200, num_clientes: int = 40, semente: int = 42,
+                          num_itens: int = None, com_custos: bool = False) -> Path:
+    """Cria (ou completa) um banco com o esquema atual, histórico sintético, mapeamentos e, opcionalmente, custos."""
+    df = gerar_historico(num_linhas, num_obras, num_clientes, semente, num_itens)
+    with usando_banco(caminho):
+        processador._garantir_tabelas()
+        conn = sqlite3.connect(caminho)
+        colunas = list(df.columns)
+        conn.executemany(
+            f"INSERT INTO itens_orcamento ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+            # Datas no mesmo texto ISO que o adaptador do sqlite3 grava para datetime.now().
+            df.assign(importado_em=df['importado_em'].dt.strftime('%Y-%m-%d %H:%M:%S')).astype(object).itertuples(index=False, name=None)
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO mapa_itens (descricao_original, item_padrao) VALUES (?, ?)",
+            gerar_mapeamentos(semente=semente, num_itens=num_itens).items()
+        )
+        conn.commit()
+        conn.close()
+        if com_custos:
+            df_custos, grupos = gerar_base_custos(num_itens, semente)
+            processador.salvar_custo_em_lote(df_custos, grupos)
+    return Path(caminho)
@@ -0,0 +1,98 @@
+# scripts/estatistica_precos.py
+import numpy as np
+import pandas as pd
+
+# --- Estatística Robusta de Preços ------------------------------------------ #
+# Funções vetorizadas (sem acesso ao banco) usadas pelo processador. Os erros comuns
+# em planilhas (unidade trocada, separador decimal) multiplicam o preço por 10, 100
+# ou 1000, então a comparação é feita no log10 do preço unitário, com mediana e MAD
+# (desvio absoluto mediano), que não se deixam levar por poucas linhas erradas.
+LIMITE_ESCORE_ROBUSTO = 3.5  # |z robusto| acima disso é atípico (critério de Iglewicz e Hoaglin)
+MIN_AMOSTRAS = 5             # com menos preços no histórico, o item não é avaliado
+MAD_LOG_MINIMO = 0.02        # ~5%: itens de preço quase constante não marcam qualquer variação pequena
+CONSTANTE_MAD = 0.6745
+
+
+def log_precos(valores) -> np.ndarray:
+    """log10 dos preços; NaN para valores ausentes, zero ou negativos."""
+    v = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(v > 0, np.log10(v), np.nan)
+
+def resumo_mediana_mad(chaves, valores) -> pd.DataFrame:
+    """
+    Por chave (item padrão), em uma passada de groupby: mediana e MAD do log10 do
+    preço, a mediana em reais e o nº de preços considerados.
+    """
+    df = pd.DataFrame({'item_padrao': np.asarray(chaves, dtype=object), 'log': log_precos(valores)}).dropna()
+    if df.empty:
+        return pd.DataFrame(columns=['item_padrao', 'mediana', 'mediana_log', 'mad_log', 'amostras'])
+    grupos = df.groupby('item_padrao', sort=False)['log']
+    df['desvio'] = (df['log'] - grupos.transform('median')).abs()
+    resumo = pd.DataFrame({
+        'mediana_log': grupos.median(),
+        'mad_log': df.groupby('item_padrao', sort=False)['desvio'].median(),
+        'amostras': grupos.size(),
+    })
+    resumo['mediana'] = 10 ** resumo['mediana_log']
+    return resumo.reset_index()[['item_padrao', 'mediana', 'mediana_log', 'mad_log', 'amostras']]
+
+def escore_robusto(valores, mediana_log, mad_log) -> np.ndarray:
+    """z robusto do log10 do preço: 0,6745·(x − mediana)/MAD. NaN sem referência ou preço <= 0."""
+    mad = np.maximum(np.asarray(mad_log, dtype=float), MAD_LOG_MINIMO)
+    return CONSTANTE_MAD * (log_precos(valores) - np.asarray(mediana_log, dtype=float)) / mad
+
+def marcar_atipicos(valores, mediana_log, mad_log, amostras, limite: float = LIMITE_ESCORE_ROBUSTO) -> np.ndarray:
+    """Máscara booleana dos preços atípicos. Itens sem histórico suficiente nunca são marcados."""
+    escore = escore_robusto(valores, mediana_log, mad_log)
+    with np.errstate(invalid='ignore'):
+        return (np.abs(escore) > limite) & (np.nan_to_num(np.asarray(amostras, dtype=float)) >= MIN_AMOSTRAS)
+
+
+# --- Estatísticas de Preço por Item ----------------------------------------- #
+PERCENTIS = (10, 25, 50, 75, 90)
+FRACAO_APARADA = 0.10  # a média aparada descarta 10% dos preços em cada ponta
+
+def estatisticas_por_item(chaves, valores, quantidades=None, fracao_aparada: float = FRACAO_APARADA) -> pd.DataFrame:
+    """
+    Média, mediana, percentis (P10/P25/P75/P90), média aparada e média ponderada pela
+    quantidade de cada item, em uma única ordenação: os valores são ordenados por
+    (item, preço) e cada estatística é lida por posição dentro do bloco do item, sem
+    apply por grupo. Percentis com interpolação linear, como no numpy/pandas.
+    """
+    colunas = ['item_padrao', 'amostras', 'media', 'mediana'] + [f'p{p}' for p in PERCENTIS if p != 50] + ['media_aparada', 'media_ponderada']
+    v = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float)
+    q = np.ones_like(v) if quantidades is None else pd.to_numeric(pd.Series(quantidades), errors='coerce').to_numpy(dtype=float)
+    codigos, itens = pd.factorize(pd.Series(chaves, dtype=object))
+    validos = (codigos >= 0) & ~np.isnan(v)
+    if not validos.any():
+        return pd.DataFrame(columns=colunas)
+    codigos, v, q = codigos[validos], v[validos], q[validos]
+
+    ordem = np.lexsort((v, codigos))
+    codigos, v, q = codigos[ordem], v[ordem], q[ordem]
+    presentes, inicio, n = np.unique(codigos, return_index=True, return_counts=True)
+    fim = inicio + n  # exclusivo
+    acumulado = np.concatenate([[0.0], np.cumsum(v)])
+
+    def percentil(p):
+        posicao = inicio + (n - 1) * (p / 100)
+        baixo = np.floor(posicao).astype(np.int64)
+        alto = np.minimum(baixo + 1, fim - 1)
+        return v[baixo] + (v[alto] - v[baixo]) * (posicao - baixo)
+
+    corte = np.floor(n * fracao_aparada).astype(np.int64)
+    q_valida = np.where(np.isnan(q) | (q <= 0), 0.0, q)
+    soma_q = np.bincount(codigos, weights=q_valida, minlength=len(itens))[presentes]
+    soma_vq = np.bincount(codigos, weights=v * q_valida, minlength=len(itens))[presentes]
+
+    resultado = pd.DataFrame({
+        'item_padrao': itens[presentes],
+        'amostras': n,
+        'media': (acumulado[fim] - acumulado[inicio]) / n,
+        'mediana': percentil(50),
+        **{f'p{p}': percentil(p) for p in PERCENTIS if p != 50},
+        'media_aparada': (acumulado[fim - corte] - acumulado[inicio + corte]) / (n - 2 * corte),
+        'media_ponderada': np.divide(soma_vq, soma_q, out=np.full(len(presentes), np.nan), where=soma_q > 0),
+    })
+    return resultado[colunas]
@@ -0,0 +1,132 @@
+# scripts/estresse_escrita.py
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from scripts import processador, dados_sinteticos
+
+# --- Teste de Estresse da Escrita Concorrente ------------------------------- #
+# Uso: python -m scripts.estresse_escrita [--sessoes 8 --operacoes 60 --linhas 20000]
+# Simula várias sessões do Streamlit (uma thread cada) importando lotes, salvando
+# mapeamentos e observações e consultando o cubo e as margens ao mesmo tempo, sobre
+# um banco sintético em pasta temporária. No fim confere se cada escrita confirmada
+# está no banco e se os resumos batem com o histórico. Sai com código 1 se houver
+# erro (ex.: "database is locked") ou divergência.
+PESOS_OPERACOES = {"importar": 3, "mapear": 3, "observar": 2, "ler": 4}
+LINHAS_POR_IMPORTACAO = 25
+
+
+def _sessao(numero: int, operacoes: int, historico, itens_padrao: list, semente: int, registro: dict, lock) -> None:
+    aleatorio = random.Random(semente + numero)
+    nomes, pesos = zip(*PESOS_OPERACOES.items())
+    for i in range(operacoes):
+        operacao = aleatorio.choices(nomes, pesos)[0]
+        inicio = time.perf_counter()
+        try:
+            if operacao == "importar":
+                posicao = aleatorio.randrange(0, len(historico) - LINHAS_POR_IMPORTACAO)
+                lote = historico.iloc[posicao:posicao + LINHAS_POR_IMPORTACAO]
+                obra = f"Obra Estresse {numero}-{i}"
+                salvas = processador.salvar_na_base(lote, obra, f"{obra}.xlsx", f"Cliente {numero}")
+                with lock:
+                    registro["linhas_salvas"] += salvas
+            elif operacao == "mapear":
+                descricao = historico['descricao'].iat[aleatorio.randrange(len(historico))]
+                processador.salvar_mapeamento(descricao, aleatorio.choice(itens_padrao))
+            elif operacao == "observar":
+                processador.salvar_observacao(f"Obra Estresse {numero}", f"Observação {i} da sessão {numero}")
+                with lock:
+                    registro["observacoes"] += 1
+            else:
+                processador.versoes_dados("itens_orcamento", "mapa_itens")
+                processador.consultar_cubo(("nome_grupo", "mes"))
+                processador.consultar_margem_por_obra()
+        except Exception as e:
+            with lock:
+                registro["erros"][f"{operacao}: {e}"] += 1
+        with lock:
+            registro["tempos"][operacao].append(time.perf_counter() - inicio)
+
+def _conferir(linhas_iniciais: int, observacoes_iniciais: int, registro: dict) -> list:
+    """Lista de divergências entre o que as sessões gravaram e o que está no banco."""
+    divergencias = []
+    conn = processador._conectar()
+    linhas = conn.execute("SELECT COUNT(*) FROM itens_orcamento").fetchone()[0]
+    observacoes = conn.execute("SELECT COUNT(*) FROM observacoes_obra").fetchone()[0]
+    validas = conn.execute("SELECT COUNT(*) FROM itens_orcamento WHERE nome_obra IS NOT NULL AND preco_atipico IS NOT 1").fetchone()[0]
+    conn.close()
+    if linhas - linhas_iniciais != registro["linhas_salvas"]:
+        divergencias.append(f"itens_orcamento: {linhas - linhas_iniciais} linhas novas, sessões confirmaram {registro['linhas_salvas']}")
+    if observacoes - observacoes_iniciais != registro["observacoes"]:
+        divergencias.append(f"observacoes_obra: {observacoes - observacoes_iniciais} novas, sessões confirmaram {registro['observacoes']}")
+    total_cubo = processador.consultar_cubo(())['linhas'].iat[0]
+    if total_cubo != validas:
+        divergencias.append(f"cubo_vendas soma {total_cubo} linhas, o histórico tem {validas}")
+    return divergencias
+
+def executar(sessoes: int, operacoes: int, linhas: int, semente: int) -> tuple[dict, list]:
+    registro = {"linhas_salvas": 0, "observacoes": 0, "erros": Counter(), "tempos": defaultdict(list)}
+    lock = threading.Lock()
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = Path(pasta) / "estresse.db"
+        print(f"Gerando banco sintético com {linhas} linhas...")
+        dados_sinteticos.criar_banco_sintetico(caminho, linhas, com_custos=True)
+        historico = dados_sinteticos.gerar_historico(2_000, semente=semente + 1)
+        itens_padrao = dados_sinteticos.gerar_catalogo()
+        with dados_sinteticos.usando_banco(caminho):
+            conn = processador._conectar()
+            linhas_iniciais = conn.execute("SELECT COUNT(*) FROM itens_orcamento").fetchone()[0]
+            observacoes_iniciais = conn.execute("SELECT COUNT(*) FROM observacoes_obra").fetchone()[0]
+            conn.close()
+            estatisticas_antes = dict(processador._fila_escrita.estatisticas)
+
+            print(f"Rodando {sessoes} sessões com {operacoes} operações cada...")
+            threads = [threading.Thread(target=_sessao, args=(n, operacoes, historico, itens_padrao, semente, registro, lock))
+                       for n in range(sessoes)]
+            inicio = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            registro["duracao_s"] = time.perf_counter() - inicio
+            registro["fila"] = {k: v - estatisticas_antes.get(k, 0) if k != "maior_grupo" else v
+                                for k, v in processador._fila_escrita.estatisticas.items()}
+            divergencias = _conferir(linhas_iniciais, observacoes_iniciais, registro)
+    return registro, divergencias
+
+def imprimir(registro: dict, divergencias: list) -> None:
+    print(f"\n{'Operação':<12}{'Qtde':>8}{'Mediana':>12}{'P95':>12}{'Máx':>12}")
+    for operacao, tempos in sorted(registro["tempos"].items()):
+        ordenados = sorted(tempos)
+        p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+        print(f"{operacao:<12}{len(tempos):>8}{statistics.median(tempos) * 1000:>10.1f}ms{p95 * 1000:>10.1f}ms{max(tempos) * 1000:>10.1f}ms")
+    fila = registro["fila"]
+    print(f"\nDuração: {registro['duracao_s']:.2f}s | escritas: {fila['escritas']} em {fila['commits']} commits "
+          f"(maior grupo: {fila['maior_grupo']}) | linhas importadas: {registro['linhas_salvas']}")
+    for erro, quantidade in registro["erros"].most_common():
+        print(f"ERRO ({quantidade}x): {erro}")
+    for divergencia in divergencias:
+        print(f"DIVERGÊNCIA: {divergencia}")
+    if not registro["erros"] and not divergencias:
+        print("OK: nenhuma escrita falhou e o banco confere com o que as sessões gravaram.")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Estresse de escritas e leituras concorrentes sobre um banco sintético.")
+    parser.add_argument("--sessoes", type=int, default=8, help="Nº de sessões (threads) simultâneas.")
+    parser.add_argument("--operacoes", type=int, default=60, help="Operações por sessão.")
+    parser.add_argument("--linhas", type=int, default=20_000, help="Linhas do histórico no banco sintético.")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    registro, divergencias = executar(args.sessoes, args.operacoes, args.linhas, args.semente)
+    imprimir(registro, divergencias)
+    return 1 if registro["erros"] or divergencias else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# scripts/exportador.py
+import argparse
+import csv
+import io
+import re
+import sys
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from scripts import processador
+
+# --- Configuração da Exportação --------------------------------------------- #
+COLUNAS_ITENS = ["Item", "Descrição", "Unidade de Medida", "Quantidade", "Preço Unitário", "Preço Total"]
+FORMATOS_SUPORTADOS = ("xlsx", "csv", "parquet")
+TAMANHO_LOTE_TABULAR = 5000
+
+
+def linhas_do_dataframe(df) -> iter:
+    """Gera (descricao, unidade, quantidade, valor_unitario) a partir do DataFrame do Orçamentador."""
+    for row in df[["descricao", "unidade", "quantidade", "valor_unitario"]].itertuples(index=False, name=None):
+        yield row
+
+def linhas_orcamento_armazenado(nome_obra: str) -> iter:
+    """
+    Percorre os itens de uma obra salva (arquivada ou não) diretamente do cursor
+    do SQLite, sem montar um DataFrame com o orçamento inteiro.
+    """
+    processador._garantir_tabelas()
+    conn, fonte = processador._conectar_historico(True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT descricao, unidade, quantidade, valor_unitario FROM {fonte} WHERE nome_obra = ? ORDER BY id",
+            (nome_obra,)
+        )
+        for row in cursor:
+            yield row
+    finally:
+        conn.close()
+
+def _formato_do_rotulo(rotulo, formatos: dict):
+    """Formato pela unidade no fim do rótulo: '(%)' ou '(R$)'; None se não indicar."""
+    rotulo = str(rotulo).strip()
+    if rotulo.endswith("(%)"):
+        return formatos['percentual']
+    if rotulo.endswith("(R$)"):
+        return formatos['moeda']
+    return None
+
+def _escrever_tabela(workbook, nome_aba: str, df, formatos: dict) -> None:
+    """
+    Escreve um DataFrame pequeno (BDI, simulação) linha a linha em uma nova aba. O
+    formato de cada número vem do rótulo da linha (1ª coluna, como no BDI) ou, se ele
+    não indicar a unidade, do cabeçalho da coluna (como na simulação).
+    """
+    ws = workbook.add_worksheet(nome_aba)
+    ws.write_row(0, 0, list(df.columns), formatos['cabecalho'])
+    ws.set_column(0, 0, 35)
+    ws.set_column(1, len(df.columns), 20)
+    formatos_colunas = [_formato_do_rotulo(coluna, formatos) or formatos['numero'] for coluna in df.columns]
+    for i, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        formato_linha = _formato_do_rotulo(row[0], formatos) if row else None
+        for j, valor in enumerate(row):
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                ws.write_number(i, j, valor, formato_linha or formatos_colunas[j])
+            else:
+                ws.write(i, j, valor)
+
+def exportar_excel(destino, linhas, df_bdi=None, df_simulacao=None, observacoes: list = None) -> int:
+    """
+    Exporta o orçamento em modo 'constant_memory' do xlsxwriter: cada linha é
+    gravada em disco assim que escrita, então o consumo de memória não cresce
+    com o tamanho do orçamento. 'linhas' é qualquer iterável de
+    (descricao, unidade, quantidade, valor_unitario). Retorna o nº de itens.
+    """
+    workbook = xlsxwriter.Workbook(destino, {'constant_memory': True})
+    formatos = {
+        'cabecalho': workbook.add_format({'bold': True, 'bg_color': '#D9E1F2', 'border': 1}),
+        'moeda': workbook.add_format({'num_format': 'R$ #,##0.00'}),
+        'numero': workbook.add_format({'num_format': '#,##0.00'}),
+        # Os percentuais do BDI já vêm em pontos (5 = 5%): o formato só acrescenta o símbolo.
+        'percentual': workbook.add_format({'num_format': '#,##0.00"%"'}),
+        'total': workbook.add_format({'bold': True, 'num_format': 'R$ #,##0.00', 'top': 1}),
+    }
+
+    # Aba de itens: no modo constant_memory as linhas devem ser escritas em ordem.
+    ws = workbook.add_worksheet("Itens")
+    ws.set_column(0, 0, 8)
+    ws.set_column(1, 1, 60)
+    ws.set_column(2, 2, 18)
+    ws.set_column(3, 5, 16)
+    ws.write_row(0, 0, COLUNAS_ITENS, formatos['cabecalho'])
+    num_itens = 0
+    for num_itens, (descricao, unidade, quantidade, valor_unitario) in enumerate(linhas, start=1):
+        quantidade = float(quantidade or 0)
+        valor_unitario = float(valor_unitario or 0)
+        linha_excel = num_itens + 1
+        ws.write_number(num_itens, 0, num_itens)
+        ws.write_string(num_itens, 1, str(descricao or ""))
+        ws.write_string(num_itens, 2, str(unidade or ""))
+        ws.write_number(num_itens, 3, quantidade, formatos['numero'])
+        ws.write_number(num_itens, 4, valor_unitario, formatos['moeda'])
+        ws.write_formula(num_itens, 5, f"=D{linha_excel}*E{linha_excel}", formatos['moeda'], quantidade * valor_unitario)
+    if num_itens:
+        ws.write_string(num_itens + 1, 4, "Total", formatos['cabecalho'])
+        ws.write_formula(num_itens + 1, 5, f"=SUM(F2:F{num_itens + 1})", formatos['total'])
+
+    if df_bdi is not None and not df_bdi.empty:
+        _escrever_tabela(workbook, "BDI", df_bdi, formatos)
+    if df_simulacao is not None and not df_simulacao.empty:
+        _escrever_tabela(workbook, "Simulação", df_simulacao, formatos)
+
+    ws_obs = workbook.add_worksheet("Observações")
+    ws_obs.set_column(0, 0, 20)
+    ws_obs.set_column(1, 1, 100)
+    ws_obs.write_row(0, 0, ["Data", "Observação"], formatos['cabecalho'])
+    for i, obs in enumerate(observacoes or [], start=1):
+        ws_obs.write_string(i, 0, str(obs.get('data_criacao') or ""))
+        ws_obs.write_string(i, 1, str(obs.get('texto_observacao') or ""))
+
+    workbook.close()
+    return num_itens
+
+def exportar_tabular(destino, linhas, formato: str = "csv") -> int:
+    """Exporta apenas a aba de itens em CSV ou Parquet, em lotes de tamanho fixo."""
+    if formato == "csv":
+        return _exportar_csv(destino, linhas)
+    if formato == "parquet":
+        return _exportar_parquet(destino, linhas)
+    raise ValueError(f"Formato '{formato}' não suportado. Use um de: {', '.join(FORMATOS_SUPORTADOS)}.")
+
+def _exportar_csv(destino, linhas) -> int:
+    # Se o destino for um buffer binário (download no Streamlit), escreve texto por cima dele.
+    em_arquivo = isinstance(destino, (str, Path))
+    arquivo = open(destino, "w", newline="", encoding="utf-8-sig") if em_arquivo else io.TextIOWrapper(destino, encoding="utf-8-sig", newline="")
+    num_itens = 0
+    try:
+        writer = csv.writer(arquivo, delimiter=";")
+        writer.writerow(COLUNAS_ITENS)
+        for num_itens, (descricao, unidade, quantidade, valor_unitario) in enumerate(linhas, start=1):
+            quantidade = float(quantidade or 0)
+            valor_unitario = float(valor_unitario or 0)
+            writer.writerow([num_itens, descricao, unidade, quantidade, valor_unitario, quantidade * valor_unitario])
+    finally:
+        if em_arquivo:
+            arquivo.close()
+        else:
+            arquivo.flush()
+            arquivo.detach()  # Mantém o buffer do chamador aberto
+    return num_itens
+
+def _exportar_parquet(destino, linhas) -> int:
+    schema = pa.schema([
+        ("item", pa.int64()), ("descricao", pa.string()), ("unidade", pa.string()),
+        ("quantidade", pa.float64()), ("valor_unitario", pa.float64()), ("valor_total", pa.float64()),
+    ])
+    num_itens = 0
+    lote = []
+    with pq.ParquetWriter(destino, schema) as writer:
+        for num_itens, (descricao, unidade, quantidade, valor_unitario) in enumerate(linhas, start=1):
+            quantidade = float(quantidade or 0)
+            valor_unitario = float(valor_unitario or 0)
+            lote.append((num_itens, descricao, unidade, quantidade, valor_unitario, quantidade * valor_unitario))
+            if len(lote) >= TAMANHO_LOTE_TABULAR:
+                writer.write_table(pa.Table.from_arrays([pa.array(c) for c in zip(*lote)], schema=schema))
+                lote = []
+        if lote:
+            writer.write_table(pa.Table.from_arrays([pa.array(c) for c in zip(*lote)], schema=schema))
+    return num_itens
+
+def exportar_obra(nome_obra: str, destino, formato: str = "xlsx") -> int:
+    """Exporta um orçamento já salvo no banco, lendo as linhas direto do SQLite."""
+    linhas = linhas_orcamento_armazenado(nome_obra)
+    if formato == "xlsx":
+        observacoes = processador.consultar_observacoes_por_obra(nome_obra)
+        return exportar_excel(destino, linhas, observacoes=observacoes)
+    return exportar_tabular(destino, linhas, formato)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Exporta um orçamento salvo no banco para Excel, CSV ou Parquet.")
+    parser.add_argument("obra", help="Nome da obra, exatamente como está no banco.")
+    parser.add_argument("-f", "--formato", choices=FORMATOS_SUPORTADOS, default="xlsx")
+    parser.add_argument("-o", "--saida", help="Arquivo de saída (padrão: <obra>.<formato>).")
+    args = parser.parse_args(argv)
+
+    if args.obra not in processador.consultar_nomes_de_obras_unicas():
+        print(f"Erro: obra '{args.obra}' não encontrada no banco de dados.")
+        return 1
+    nome_padrao = re.sub(r"[^\w\- ]", "_", args.obra).strip() or "orcamento"
+    saida = Path(args.saida) if args.saida else Path(f"{nome_padrao}.{args.formato}")
+    num_itens = exportar_obra(args.obra, str(saida), args.formato)
+    print(f"{num_itens} itens exportados para '{saida}'.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# scripts/fila_escrita.py
+import queue
+import threading
+from concurrent.futures import Future
+
+# --- Fila de Escrita -------------------------------------------------------- #
+# O SQLite aceita um único escritor por vez. Com várias sessões do Streamlit (uma
+# thread cada) abrindo conexões próprias para gravar, as escritas disputavam o lock do
+# arquivo e falhavam com "database is locked". Aqui todas as escritas do processo
+# passam por uma única thread, que as executa em ordem de chegada. As escritas que se
+# acumulam enquanto uma transação está aberta são gravadas juntas no próximo commit
+# (group commit), cada uma dentro de um SAVEPOINT próprio: se uma falhar, só ela é
+# desfeita e o erro volta para quem a submeteu. As leituras continuam em conexões
+# próprias, concorrentes com a escrita no modo WAL. Operações que não podem rodar dentro
+# de uma transação (VACUUM, restauração de backup) usam executar_isolada: rodam
+# sozinhas na thread de escrita, com a conexão em autocommit.
+MAX_ESCRITAS_POR_COMMIT = 64
+
+
+class FilaEscrita:
+    """
+    Executa funções de escrita 'funcao(conn, *args, **kwargs)' em uma thread dedicada.
+    'conectar(chave)' abre a conexão de escrita; escritas com chaves diferentes (ex.:
+    caminhos de banco diferentes) nunca dividem a mesma transação. As funções não
+    devem chamar commit: o commit é feito pela fila.
+    """
+
+    def __init__(self, conectar, nome: str = "sio-escritor", max_por_commit: int = MAX_ESCRITAS_POR_COMMIT):
+        self._conectar = conectar
+        self._nome = nome
+        self._max_por_commit = max_por_commit
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adiada = None  # escrita de outra chave retirada da fila, a primeira da próxima transação
+        self.estatisticas = {"escritas": 0, "commits": 0, "falhas": 0, "maior_grupo": 0}
+
+    def _iniciar(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._laco, name=self._nome, daemon=True)
+                self._thread.start()
+
+    def _enfileirar(self, isolada: bool, chave, funcao, args, kwargs) -> Future:
+        futuro = Future()
+        conexao_atual = getattr(self._local, "conexao", None)
+        if conexao_atual is not None and isolada:
+            futuro.set_exception(RuntimeError("Operação isolada chamada de dentro de uma escrita em andamento."))
+            return futuro
+        if conexao_atual is not None:
+            # Escrita chamada de dentro de outra (ex.: salvar_orcamento_gerado -> salvar_observacao):
+            # roda na hora, na mesma transação, para não esperar por si mesma.
+            try:
+                futuro.set_result(funcao(conexao_atual, *args, **kwargs))
+            except Exception as e:
+                futuro.set_exception(e)
+            return futuro
+        self._iniciar()
+        self._fila.put((chave, funcao, args, kwargs, futuro, isolada))
+        return futuro
+
+    def submeter(self, chave, funcao, *args, **kwargs) -> Future:
+        """Enfileira a escrita e devolve um Future com o retorno da função (ou a exceção)."""
+        return self._enfileirar(False, chave, funcao, args, kwargs)
+
+    def executar(self, chave, funcao, *args, **kwargs):
+        """Como submeter, mas espera a escrita ser gravada e devolve o resultado."""
+        return self.submeter(chave, funcao, *args, **kwargs).result()
+
+    def executar_isolada(self, chave, funcao, *args, **kwargs):
+        """
+        Executa 'funcao(conn, ...)' sozinha na thread de escrita, sem transação aberta
+        (a função controla BEGIN/COMMIT, se precisar). Espera e devolve o resultado.
+        """
+        return self._enfileirar(True, chave, funcao, args, kwargs).result()
+
+    def _proximo_grupo(self) -> list:
+        grupo = [self._adiada or self._fila.get()]
+        self._adiada = None
+        while len(grupo) < self._max_por_commit and not grupo[0][5]:
+            try:
+                escrita = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if escrita[0] != grupo[0][0] or escrita[5]:
+                self._adiada = escrita
+                break
+            grupo.append(escrita)
+        return grupo
+
+    def _laco(self) -> None:
+        while True:
+            grupo = self._proximo_grupo()
+            try:
+                conn = self._conectar(grupo[0][0])
+            except Exception as e:
+                for escrita in grupo:
+                    escrita[4].set_exception(e)
+                continue
+            conn.isolation_level = None  # transação controlada aqui (BEGIN/SAVEPOINT/COMMIT explícitos)
+            if grupo[0][5]:
+                self._executar_isolada(conn, grupo[0])
+                continue
+            resultados = []
+            self._local.conexao = conn
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for _, funcao, args, kwargs, futuro, _ in grupo:
+                    conn.execute("SAVEPOINT escrita")
+                    try:
+                        resultados.append((futuro, True, funcao(conn, *args, **kwargs)))
+                        conn.execute("RELEASE escrita")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO escrita")
+                        conn.execute("RELEASE escrita")
+                        resultados.append((futuro, False, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                # Falha fora das funções (BEGIN ou COMMIT): nada do grupo foi gravado.
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                resultados = [(escrita[4], False, e) for escrita in grupo]
+            finally:
+                self._local.conexao = None
+                conn.close()
+
+            self.estatisticas["escritas"] += len(grupo)
+            self.estatisticas["commits"] += 1
+            self.estatisticas["maior_grupo"] = max(self.estatisticas["maior_grupo"], len(grupo))
+            for futuro, sucesso, valor in resultados:
+                if sucesso:
+                    futuro.set_result(valor)
+                else:
+                    self.estatisticas["falhas"] += 1
+                    futuro.set_exception(valor)
+
+    def _executar_isolada(self, conn, escrita) -> None:
+        _, funcao, args, kwargs, futuro, _ = escrita
+        try:
+            resultado = funcao(conn, *args, **kwargs)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.estatisticas["falhas"] += 1
+            futuro.set_exception(e)
+        else:
+            futuro.set_result(resultado)
+        finally:
+            conn.close()
+            self.estatisticas["escritas"] += 1
+            self.estatisticas["commits"] += 1
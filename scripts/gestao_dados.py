@@ -0,0 +1,231 @@
+# scripts/gestao_dados.py
+import os
+import re
+import sqlite3
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from scripts import processador
+
+# --- Backups, Restauração e Reset do Banco ---------------------------------- #
+# Uso: python -m scripts.gestao_dados [backup [motivo] | listar | restaurar <arquivo>]
+# Os backups são cópias do orcamentos.db feitas com a API de backup do sqlite3, em
+# passos de PAGINAS_POR_PASSO páginas: em WAL, leituras e escritas continuam durante a
+# cópia (se o banco mudar no meio, o SQLite recomeça a cópia sozinho). Ficam em
+# data/backups/ e só os MAX_BACKUPS mais recentes são mantidos. O reset apaga e recria
+# as tabelas de dados em uma transação (tempo constante, ao contrário de DELETE linha a
+# linha), apaga o banco de obras arquivadas (data/archive/) e devolve o espaço ao
+# disco; antes dele, e antes de cada restauração, um backup automático é criado. Com
+# obras arquivadas, cada backup leva ao lado uma cópia do banco de arquivo
+# (arquivo_<data>_<motivo>.db), feita depois da cópia do principal, e os dois são
+# restaurados juntos. Um backup sem essa cópia (feito antes de qualquer arquivamento)
+# mantém o arquivo atual; em ambos os casos a restauração concilia o banco restaurado
+# com o arquivo, tirando da base quente as linhas que já estão nele.
+BACKUP_DIR = processador.DATA_DIR / "backups"
+MAX_BACKUPS = int(os.environ.get("SIO_MAX_BACKUPS", "7"))
+PAGINAS_POR_PASSO = 1024
+PAUSA_ENTRE_PASSOS_S = 0.005
+TABELAS_DO_RESET = ("itens_orcamento", "base_custos", "historico_custos", "mapa_itens", "observacoes_obra")
+AUTO_VACUUM_INCREMENTAL = 2
+
+_RE_BACKUP = re.compile(r"^orcamentos_(\d{8}_\d{6}_\d{6})_([a-z0-9_]+)\.db$")
+
+
+# --- Backups ---------------------------------------------------------------- #
+def _limpar_motivo(motivo: str) -> str:
+    return re.sub(r"[^a-z0-9_]+", "_", motivo.lower()).strip("_") or "manual"
+
+def _copia_do_arquivo(backup: Path) -> Path:
+    """Caminho da cópia do banco de arquivo que acompanha o backup 'backup'."""
+    return backup.with_name("arquivo_" + backup.name.removeprefix("orcamentos_"))
+
+def _copiar(caminho_origem: Path) -> Path:
+    """Copia o banco 'caminho_origem' para um arquivo temporário em data/backups/ e retorna o caminho dele."""
+    temporario = BACKUP_DIR / f".{uuid.uuid4().hex}.tmp"
+    origem = sqlite3.connect(caminho_origem)
+    destino = sqlite3.connect(temporario)
+    try:
+        origem.backup(destino, pages=PAGINAS_POR_PASSO, sleep=PAUSA_ENTRE_PASSOS_S)
+        # A cópia fica em modo rollback (um só arquivo, sem -wal/-shm ao lado).
+        destino.execute("PRAGMA journal_mode=DELETE")
+        destino.close()
+    except Exception:
+        destino.close()
+        temporario.unlink(missing_ok=True)
+        raise
+    finally:
+        origem.close()
+    return temporario
+
+def criar_backup(motivo: str = "manual") -> Path | None:
+    """
+    Copia o banco atual (e o de obras arquivadas, se houver) para data/backups/ e
+    aplica a rotação. Retorna o caminho do backup, ou None se ainda não existe banco
+    para copiar.
+    """
+    if not processador.DB_PATH.exists():
+        return None
+    processador._garantir_tabelas()
+    BACKUP_DIR.mkdir(exist_ok=True)
+    caminho = BACKUP_DIR / f"orcamentos_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{_limpar_motivo(motivo)}.db"
+    # Principal antes do arquivo: uma obra arquivada entre as duas cópias fica nas duas,
+    # e a conciliação da restauração resolve; na ordem inversa ela ficaria em nenhuma.
+    temporario = _copiar(processador.DB_PATH)
+    try:
+        caminho_arquivo = processador._caminho_arquivo()
+        if caminho_arquivo.exists():
+            os.replace(_copiar(caminho_arquivo), _copia_do_arquivo(caminho))
+        os.replace(temporario, caminho)
+    finally:
+        temporario.unlink(missing_ok=True)
+    _rotacionar()
+    print(f"Backup criado: {caminho.name}")
+    return caminho
+
+def listar_backups() -> list:
+    """Backups disponíveis, do mais recente para o mais antigo."""
+    backups = []
+    for caminho in BACKUP_DIR.glob("orcamentos_*.db"):
+        correspondencia = _RE_BACKUP.match(caminho.name)
+        if not correspondencia:
+            continue
+        copia_arquivo = _copia_do_arquivo(caminho)
+        tamanho = caminho.stat().st_size + (copia_arquivo.stat().st_size if copia_arquivo.exists() else 0)
+        backups.append({
+            "arquivo": caminho.name,
+            "criado_em": datetime.strptime(correspondencia.group(1), "%Y%m%d_%H%M%S_%f"),
+            "motivo": correspondencia.group(2),
+            "tamanho_mb": tamanho / (1024 * 1024),
+        })
+    return sorted(backups, key=lambda b: b["criado_em"], reverse=True)
+
+def _rotacionar() -> None:
+    for backup in listar_backups()[MAX_BACKUPS:]:
+        (BACKUP_DIR / backup["arquivo"]).unlink(missing_ok=True)
+        _copia_do_arquivo(BACKUP_DIR / backup["arquivo"]).unlink(missing_ok=True)
+
+def _restaurar_arquivo(conn: sqlite3.Connection, copia: Path) -> None:
+    """Substitui o banco de arquivo pela 'copia' e o anexa de novo a 'conn'."""
+    if processador._arquivo_anexado(conn):
+        conn.execute(f"DETACH DATABASE {processador.ESQUEMA_ARQUIVO}")
+    caminho_arquivo = processador._caminho_arquivo()
+    caminho_arquivo.parent.mkdir(exist_ok=True)
+    origem = sqlite3.connect(copia)
+    destino = sqlite3.connect(caminho_arquivo)
+    try:
+        origem.backup(destino, pages=PAGINAS_POR_PASSO)
+    finally:
+        origem.close()
+        destino.close()
+    processador._anexar_arquivo(conn)
+
+def _restaurar(conn: sqlite3.Connection, caminho: Path) -> None:
+    versoes_atuais = dict(conn.execute("SELECT tabela, versao FROM versoes_dados").fetchall())
+    versao_maxima = max(versoes_atuais.values(), default=0)
+    origem = sqlite3.connect(caminho)
+    try:
+        origem.backup(conn, pages=PAGINAS_POR_PASSO)
+    finally:
+        origem.close()
+    if _copia_do_arquivo(caminho).exists():
+        _restaurar_arquivo(conn, _copia_do_arquivo(caminho))
+    conn.execute("PRAGMA journal_mode=WAL")  # a cópia foi gravada em modo rollback
+    # O banco restaurado traz versões antigas, que podem coincidir com chaves já guardadas nos
+    # caches: as versões passam a valer acima das atuais e os resumos são refeitos na próxima leitura.
+    processador._SCHEMAS_VERIFICADOS.discard(processador.DB_PATH)
+    conn.execute("BEGIN IMMEDIATE")
+    processador._criar_tabelas(conn)
+    processador._conciliar_com_arquivos(conn)
+    derivadas = tuple(processador._fontes_das_derivadas())
+    marcadores = ", ".join("?" * len(derivadas))
+    conn.execute(f"DELETE FROM versoes_dados WHERE tabela IN ({marcadores})", derivadas)
+    conn.executemany("INSERT OR IGNORE INTO versoes_dados (tabela, versao) VALUES (?, 0)",
+                     [(tabela,) for tabela in {*versoes_atuais, *TABELAS_DO_RESET} - set(derivadas)])
+    conn.execute(f"UPDATE versoes_dados SET versao = versao + ? WHERE tabela NOT IN ({marcadores})",
+                 (versao_maxima + 1, *derivadas))
+    processador._incrementar_versao(conn, *TABELAS_DO_RESET)
+    conn.execute("COMMIT")
+
+def restaurar_backup(arquivo: str) -> Path:
+    """
+    Substitui o banco atual pelo backup 'arquivo' (nome em data/backups/), depois de
+    criar um backup do estado atual. Levanta ValueError se o backup não existir ou
+    estiver corrompido. Retorna o caminho do backup do estado anterior.
+    """
+    caminho = BACKUP_DIR / Path(arquivo).name
+    if not caminho.exists():
+        raise ValueError(f"Backup não encontrado: {arquivo}")
+    for banco in (caminho, _copia_do_arquivo(caminho)):
+        if not banco.exists():
+            continue
+        conn = sqlite3.connect(banco)
+        try:
+            verificacao = conn.execute("PRAGMA quick_check").fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            verificacao = str(e)
+        finally:
+            conn.close()
+        if verificacao != "ok":
+            raise ValueError(f"Backup '{banco.name}' corrompido: {verificacao}")
+    anterior = criar_backup("antes_de_restaurar")
+    processador._fila_escrita.executar_isolada(processador.DB_PATH, _restaurar, caminho)
+    print(f"Banco restaurado a partir de {caminho.name}.")
+    return anterior
+
+
+# --- Reset ------------------------------------------------------------------ #
+def _resetar(conn: sqlite3.Connection) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    for tabela in TABELAS_DO_RESET:
+        conn.execute(f"DROP TABLE IF EXISTS {tabela}")
+    arquivo_anexado = processador._arquivo_anexado(conn)
+    if arquivo_anexado:
+        conn.execute(f"DROP TABLE IF EXISTS {processador.ESQUEMA_ARQUIVO}.itens_orcamento")
+    # Recriadas na mesma transação: nenhum leitor vê o banco sem as tabelas.
+    processador._criar_tabelas(conn)
+    processador._incrementar_versao(conn, *TABELAS_DO_RESET, "arquivo_obras")
+    conn.execute("COMMIT")
+    if arquivo_anexado:
+        conn.execute(f"DETACH DATABASE {processador.ESQUEMA_ARQUIVO}")
+    processador._caminho_arquivo().unlink(missing_ok=True)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        # executescript vai até o fim do PRAGMA; o execute liberaria uma página por chamada.
+        conn.executescript("PRAGMA incremental_vacuum;")
+    else:
+        # Só na primeira vez: o VACUUM converte o banco para auto_vacuum incremental.
+        conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def resetar_banco(com_backup: bool = True) -> Path | None:
+    """
+    Apaga orçamentos (inclusive os arquivados), base de custos, mapeamentos e
+    observações (as tabelas são recriadas vazias) e libera o espaço no disco. Retorna o caminho do backup prévio.
+    """
+    processador._garantir_tabelas()
+    backup = criar_backup("antes_do_reset") if com_backup else None
+    processador._fila_escrita.executar_isolada(processador.DB_PATH, _resetar)
+    print("Reset do banco de dados concluído.")
+    return backup
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    comando = argv[0] if argv else "listar"
+    if comando == "backup":
+        caminho = criar_backup(argv[1] if len(argv) > 1 else "manual")
+        print(caminho or "Nenhum banco para copiar.")
+    elif comando == "restaurar" and len(argv) > 1:
+        restaurar_backup(argv[1])
+    elif comando == "listar":
+        for backup in listar_backups():
+            print(f"{backup['arquivo']:<60}{backup['tamanho_mb']:>9.1f} MB  {backup['motivo']}")
+    else:
+        print("Uso: python -m scripts.gestao_dados [backup [motivo] | listar | restaurar <arquivo>]")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# scripts/importar.py
+import argparse
+import glob
+import hashlib
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from scripts import processador, cache_planilhas
+
+# --- Importação em Lote (linha de comando) ---------------------------------- #
+# Uso: python -m scripts.importar <pasta ou glob> [...] --cliente "Nome do Cliente"
+# A leitura/preparação das planilhas (a parte lenta, com openpyxl) roda em um pool
+# de processos; a gravação no SQLite fica em um único escritor, no processo principal.
+
+
+def calcular_hash_arquivo(caminho) -> str:
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def listar_arquivos(entradas: list) -> list:
+    """Expande pastas (recursivamente) e padrões glob em uma lista ordenada de .xlsx, sem repetições."""
+    arquivos = []
+    for entrada in entradas:
+        caminho = Path(entrada)
+        if caminho.is_dir():
+            arquivos.extend(p for p in caminho.rglob("*.xlsx"))
+        else:
+            arquivos.extend(Path(p) for p in glob.glob(entrada, recursive=True) if p.lower().endswith(".xlsx"))
+    # Ignora arquivos temporários do Excel (~$arquivo.xlsx)
+    return sorted({p.resolve() for p in arquivos if not p.name.startswith("~$")})
+
+def processar_arquivo(caminho: str, hash_arquivo: str) -> dict:
+    """Executado nos processos do pool: lê e prepara uma planilha de orçamento (usando o cache de planilhas)."""
+    inicio = time.perf_counter()
+    try:
+        df, _ = cache_planilhas.ler_orcamento_com_cache(Path(caminho).read_bytes(), hash_arquivo)
+        return {
+            "caminho": caminho, "df": df, "erro": None,
+            "nome_obra": processador.sugerir_nome_obra_limpo(Path(caminho).name),
+            "segundos": time.perf_counter() - inicio,
+        }
+    except Exception as e:
+        return {"caminho": caminho, "df": None, "erro": str(e), "segundos": time.perf_counter() - inicio}
+
+def importar_em_lote(arquivos: list, nome_cliente: str = None, workers: int = None) -> dict:
+    """
+    Importa várias planilhas de orçamento. Arquivos cujo conteúdo (SHA-256) já foi
+    importado são pulados antes mesmo da leitura. Retorna as estatísticas da execução.
+    """
+    inicio = time.perf_counter()
+    stats = {"arquivos": len(arquivos), "importados": 0, "pulados": 0, "erros": 0, "linhas": 0, "segundos_gravacao": 0.0}
+    hashes_importados = processador.consultar_hashes_importados()
+
+    pendentes = {}
+    for caminho in arquivos:
+        hash_arquivo = calcular_hash_arquivo(caminho)
+        if hash_arquivo in hashes_importados:
+            print(f"  - Pulando (já importado): {Path(caminho).name}")
+            stats["pulados"] += 1
+            continue
+        hashes_importados.add(hash_arquivo)  # Cópias idênticas dentro do mesmo lote também são puladas
+        pendentes[str(caminho)] = hash_arquivo
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = [pool.submit(processar_arquivo, caminho, hash_arquivo) for caminho, hash_arquivo in pendentes.items()]
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            nome_arquivo = Path(resultado["caminho"]).name
+            if resultado["erro"]:
+                print(f"  ! Erro em {nome_arquivo}: {resultado['erro']}")
+                stats["erros"] += 1
+                continue
+            # Escritor único: as gravações acontecem aqui, uma transação por arquivo.
+            inicio_gravacao = time.perf_counter()
+            linhas = processador.salvar_na_base(
+                df=resultado["df"], nome_obra=resultado["nome_obra"], nome_arquivo_original=nome_arquivo,
+                nome_cliente=nome_cliente, hash_arquivo=pendentes[resultado["caminho"]]
+            )
+            stats["segundos_gravacao"] += time.perf_counter() - inicio_gravacao
+            stats["importados"] += 1
+            stats["linhas"] += linhas
+            print(f"  + {nome_arquivo}: {linhas} linhas (obra '{resultado['nome_obra']}', leitura em {resultado['segundos']:.2f}s)")
+
+    stats["segundos"] = time.perf_counter() - inicio
+    return stats
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Importa em lote planilhas de orçamento (.xlsx) para o banco de dados.")
+    parser.add_argument("entradas", nargs="+", help="Pastas ou padrões glob (ex.: 'arquivo/2019/*.xlsx').")
+    parser.add_argument("--cliente", default=None, help="Nome do cliente gravado em todos os orçamentos importados.")
+    parser.add_argument("--workers", type=int, default=None, help="Nº de processos de leitura (padrão: nº de CPUs).")
+    args = parser.parse_args(argv)
+
+    arquivos = listar_arquivos(args.entradas)
+    if not arquivos:
+        print("Nenhum arquivo .xlsx encontrado.")
+        return 1
+    print(f"Importando {len(arquivos)} arquivo(s)...")
+    stats = importar_em_lote(arquivos, nome_cliente=args.cliente, workers=args.workers)
+
+    segundos = max(stats["segundos"], 1e-9)
+    print("\n--- Resumo da Importação ---")
+    print(f"Arquivos: {stats['importados']} importados, {stats['pulados']} pulados (já importados), {stats['erros']} com erro")
+    print(f"Linhas gravadas: {stats['linhas']}")
+    print(f"Tempo total: {stats['segundos']:.2f}s (gravação: {stats['segundos_gravacao']:.2f}s)")
+    print(f"Vazão: {stats['importados'] / segundos:.2f} arquivos/s, {stats['linhas'] / segundos:.0f} linhas/s")
+    if stats["importados"]:
+        print("Lembrete: descrições novas ficam sem mapeamento até serem padronizadas no Assistente de Importação.")
+    return 0 if stats["erros"] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# scripts/instrumentacao.py
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# --- Instrumentação das Funções do Processador ------------------------------ #
+# Registra, por função, nº de chamadas, erros, histograma de latência e linhas
+# processadas. As métricas ficam na memória do processo (o servidor do Streamlit é
+# um processo só, então valem para todas as sessões) e podem ser exportadas como
+# log, JSON ou texto no formato do Prometheus. SIO_INSTRUMENTACAO=0 desliga a coleta.
+ATIVA = os.environ.get("SIO_INSTRUMENTACAO", "1") != "0"
+LIMITES_HISTOGRAMA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_metricas = {}
+_iniciado_em = datetime.now()
+
+
+class Metrica:
+    """Contadores de uma função (ou trecho) instrumentado."""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.chamadas = 0
+        self.erros = 0
+        self.tentativas = 0
+        self.linhas = 0
+        self.tempo_total = 0.0
+        self.tempo_maximo = 0.0
+        self.ultima_chamada = None
+        # Um contador por faixa de LIMITES_HISTOGRAMA, mais a faixa "acima do último limite".
+        self.histograma = [0] * (len(LIMITES_HISTOGRAMA) + 1)
+
+    def registrar(self, duracao: float, linhas: int = None, erro: bool = False) -> None:
+        self.chamadas += 1
+        self.erros += int(erro)
+        self.linhas += linhas or 0
+        self.tempo_total += duracao
+        self.tempo_maximo = max(self.tempo_maximo, duracao)
+        self.ultima_chamada = datetime.now()
+        self.histograma[bisect.bisect_left(LIMITES_HISTOGRAMA, duracao)] += 1
+
+    def percentil(self, fracao: float) -> float | None:
+        """Estimativa do percentil pelo limite superior da faixa do histograma."""
+        if not self.chamadas:
+            return None
+        alvo = fracao * self.chamadas
+        acumulado = 0
+        for limite, quantidade in zip(LIMITES_HISTOGRAMA + (float("inf"),), self.histograma):
+            acumulado += quantidade
+            if acumulado >= alvo:
+                return limite if limite != float("inf") else self.tempo_maximo
+        return self.tempo_maximo
+
+    def como_dict(self) -> dict:
+        return {
+            "nome": self.nome, "chamadas": self.chamadas, "erros": self.erros, "tentativas": self.tentativas,
+            "linhas": self.linhas, "tempo_total_s": self.tempo_total,
+            "tempo_medio_s": self.tempo_total / self.chamadas if self.chamadas else None,
+            "tempo_maximo_s": self.tempo_maximo, "p50_s": self.percentil(0.5), "p95_s": self.percentil(0.95),
+            "ultima_chamada": self.ultima_chamada.isoformat(timespec="seconds") if self.ultima_chamada else None,
+            "histograma": dict(zip([str(l) for l in LIMITES_HISTOGRAMA] + ["+Inf"], self.histograma)),
+        }
+
+
+def _metrica(nome: str) -> Metrica:
+    metrica = _metricas.get(nome)
+    if metrica is None:
+        metrica = _metricas.setdefault(nome, Metrica(nome))
+    return metrica
+
+def registrar(nome: str, duracao: float, linhas: int = None, erro: bool = False) -> None:
+    if not ATIVA:
+        return
+    with _lock:
+        _metrica(nome).registrar(duracao, linhas, erro)
+
+def registrar_tentativa(nome: str) -> None:
+    """Conta uma nova tentativa (retry) de uma operação, ex.: chamada à IA que falhou."""
+    if not ATIVA:
+        return
+    with _lock:
+        _metrica(nome).tentativas += 1
+
+def contar_linhas(resultado, inteiro_e_contagem: bool = False) -> int | None:
+    """
+    Linhas de um retorno: tamanho de DataFrames/listas/dicts. Um inteiro só conta
+    como linhas quando a função devolve uma contagem (ex.: nº de registros salvos),
+    e não um id.
+    """
+    if resultado is None or isinstance(resultado, (bool, str, bytes)):
+        return None
+    if isinstance(resultado, int):
+        return resultado if inteiro_e_contagem else None
+    if isinstance(resultado, tuple):
+        return contar_linhas(resultado[0]) if resultado else None
+    try:
+        return len(resultado)
+    except TypeError:
+        return None
+
+@contextmanager
+def cronometro(nome: str):
+    """Mede um trecho de código. O 'linhas' do objeto devolvido pode ser preenchido dentro do bloco."""
+    estado = {"linhas": None}
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield estado
+    except BaseException:
+        erro = True
+        raise
+    finally:
+        registrar(nome, time.perf_counter() - inicio, estado["linhas"], erro)
+
+def medir(nome: str = None, retorna_contagem: bool = False):
+    """Decorador: registra cada chamada da função (latência, erros e linhas do retorno)."""
+    def decorador(funcao):
+        rotulo = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            if not ATIVA:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                resultado = funcao(*args, **kwargs)
+            except BaseException:
+                registrar(rotulo, time.perf_counter() - inicio, erro=True)
+                raise
+            registrar(rotulo, time.perf_counter() - inicio, contar_linhas(resultado, retorna_contagem))
+            return resultado
+
+        envolvida.__instrumentada__ = True
+        return envolvida
+    return decorador
+
+def instrumentar_modulo(modulo, ignorar: tuple = (), retornam_contagem: tuple = ()) -> list:
+    """
+    Aplica @medir a todas as funções públicas definidas no próprio módulo (não as
+    importadas). Como as chamadas passam pelo atributo do módulo (processador.x),
+    páginas, tarefas e scripts passam a ser medidos sem nenhuma alteração.
+    """
+    instrumentadas = []
+    for nome, objeto in list(vars(modulo).items()):
+        if (nome.startswith("_") or nome in ignorar or not inspect.isfunction(objeto)
+                or objeto.__module__ != modulo.__name__ or getattr(objeto, "__instrumentada__", False)):
+            continue
+        setattr(modulo, nome, medir(nome, retorna_contagem=nome in retornam_contagem)(objeto))
+        instrumentadas.append(nome)
+    return instrumentadas
+
+
+# --- Consulta e exportação -------------------------------------------------- #
+def obter_metricas() -> list:
+    """Cópia das métricas atuais, da função com mais tempo acumulado para a com menos."""
+    with _lock:
+        dados = [m.como_dict() for m in _metricas.values()]
+    return sorted(dados, key=lambda m: -m["tempo_total_s"])
+
+def zerar_metricas() -> None:
+    global _iniciado_em
+    with _lock:
+        _metricas.clear()
+        _iniciado_em = datetime.now()
+
+def exportar_log(destino=None) -> str:
+    linhas = [f"Métricas desde {_iniciado_em:%d/%m/%Y %H:%M:%S}:"]
+    for m in obter_metricas():
+        linhas.append(
+            f"  {m['nome']:<40} {m['chamadas']:>6} chamadas | {m['erros']} erros | {m['tentativas']} tentativas | "
+            f"média {1000 * (m['tempo_medio_s'] or 0):.1f} ms | p95 {1000 * (m['p95_s'] or 0):.0f} ms | {m['linhas']} linhas"
+        )
+    texto = "\n".join(linhas)
+    print(texto)
+    if destino:
+        with open(destino, "a", encoding="utf-8") as f:
+            f.write(f"{texto}\n")
+    return texto
+
+def exportar_json(destino=None) -> str:
+    texto = json.dumps({"iniciado_em": _iniciado_em.isoformat(timespec="seconds"), "metricas": obter_metricas()},
+                       ensure_ascii=False, indent=2)
+    if destino:
+        Path(destino).write_text(texto, encoding="utf-8")
+    return texto
+
+def _escapar_rotulo(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def exportar_prometheus(destino=None) -> str:
+    """Texto no formato de exposição do Prometheus (métricas com prefixo 'sio_')."""
+    metricas = obter_metricas()
+    linhas = [
+        "# HELP sio_funcao_duracao_segundos Latência das funções instrumentadas.",
+        "# TYPE sio_funcao_duracao_segundos histogram",
+    ]
+    for m in metricas:
+        rotulo = _escapar_rotulo(m["nome"])
+        acumulado = 0
+        for limite, quantidade in m["histograma"].items():
+            acumulado += quantidade
+            linhas.append(f'sio_funcao_duracao_segundos_bucket{{funcao="{rotulo}",le="{limite}"}} {acumulado}')
+        linhas.append(f'sio_funcao_duracao_segundos_sum{{funcao="{rotulo}"}} {m["tempo_total_s"]}')
+        linhas.append(f'sio_funcao_duracao_segundos_count{{funcao="{rotulo}"}} {m["chamadas"]}')
+    for campo, descricao in (("erros", "Chamadas que terminaram em exceção."),
+                             ("tentativas", "Novas tentativas após falha (ex.: chamadas à IA)."),
+                             ("linhas", "Linhas retornadas ou gravadas.")):
+        linhas.append(f"# HELP sio_funcao_{campo}_total {descricao}")
+        linhas.append(f"# TYPE sio_funcao_{campo}_total counter")
+        for m in metricas:
+            linhas.append(f'sio_funcao_{campo}_total{{funcao="{_escapar_rotulo(m["nome"])}"}} {m[campo]}')
+    texto = "\n".join(linhas) + "\n"
+    if destino:
+        Path(destino).write_text(texto, encoding="utf-8")
+    return texto
+
+EXPORTADORES = {"log": exportar_log, "json": exportar_json, "prometheus": exportar_prometheus}
+
+def registrar_exportador(nome: str, funcao) -> None:
+    """Adiciona um exportador: função que recebe o destino (ou None) e devolve o texto exportado."""
+    EXPORTADORES[nome] = funcao
+
+def exportar(formato: str = "log", destino=None) -> str:
+    if formato not in EXPORTADORES:
+        raise ValueError(f"Exportador desconhecido: '{formato}'. Disponíveis: {', '.join(EXPORTADORES)}.")
+    return EXPORTADORES[formato](destino)
@@ -0,0 +1,104 @@
+# scripts/normalizacao.py
+import re
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# --- Normalização de Texto -------------------------------------------------- #
+# Ponto único para remover acentos e pontuação. O caminho rápido usa tabelas de
+# str.translate pré-calculadas (uma passada em C por string); só textos com
+# caracteres fora das tabelas caem no caminho com unicodedata. Os resultados
+# escalares são memorizados (LRU), pois as mesmas strings se repetem muito entre
+# fuzzy matching, cabeçalhos e grupos.
+TAMANHO_CACHE = 65536
+
+_RE_SEPARADORES_CABECALHO = re.compile(r"[\s-]+")
+_RE_NAO_ALFANUMERICO_BUSCA = re.compile(r"[^a-z0-9\s]")
+
+
+def _sem_acentos_unicodedata(texto: str) -> str:
+    """NFKD sem as marcas combinantes (caminho lento, usado para montar as tabelas e como fallback)."""
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+def _montar_tabela(mapear_ascii) -> dict:
+    """
+    Tabela de tradução para ASCII + Latin (até U+036F, incluindo marcas combinantes soltas).
+    Cada caractere vira sua forma NFKD sem acentos, passada por 'mapear_ascii'.
+    Caracteres cuja decomposição não é ASCII ficam fora da tabela (tratados no fallback).
+    """
+    tabela = {}
+    for codigo in range(0x370):
+        caractere = chr(codigo)
+        base = _sem_acentos_unicodedata(caractere)
+        if base.isascii():
+            destino = "".join(mapear_ascii(c) for c in base)
+            if destino != caractere:
+                tabela[codigo] = destino
+    return tabela
+
+# Cada modo tem sua tabela, reproduzindo exatamente as regras que antes estavam espalhadas:
+# - busca: acentos removidos, pontuação apagada (antigo processador._preprocess_string)
+# - cabecalho: apenas acentos removidos (antigo _normalize_text de preparar_dataframe)
+# - limpeza: acentos removidos, pontuação vira espaço (antigo limpar_texto da importação)
+_TABELA_BUSCA = _montar_tabela(lambda c: c if _RE_NAO_ALFANUMERICO_BUSCA.match(c) is None else "")
+_TABELA_ACENTOS = _montar_tabela(lambda c: c)
+_TABELA_LIMPEZA = _montar_tabela(lambda c: c if _RE_NAO_ALFANUMERICO_BUSCA.match(c) is None else " ")
+
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _normalizar_para_busca(texto: str) -> str:
+    resultado = texto.lower().translate(_TABELA_BUSCA)
+    if resultado.isascii():
+        return resultado
+    s = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("utf-8")
+    return _RE_NAO_ALFANUMERICO_BUSCA.sub("", s)
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _normalizar_cabecalho(texto: str) -> str:
+    resultado = texto.lower().translate(_TABELA_ACENTOS)
+    if not resultado.isascii():
+        resultado = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("utf-8")
+    return _RE_SEPARADORES_CABECALHO.sub("_", resultado.strip())
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _limpar_texto(texto: str) -> str:
+    resultado = texto.lower().translate(_TABELA_LIMPEZA)
+    if not resultado.isascii():
+        resultado = _RE_NAO_ALFANUMERICO_BUSCA.sub(" ", _sem_acentos_unicodedata(texto.lower()))
+    return " ".join(resultado.split())
+
+
+def normalizar_para_busca(texto) -> str:
+    """Minúsculas, sem acentos e sem pontuação (espaços preservados). Usado no fuzzy matching."""
+    if not isinstance(texto, str): return ""
+    return _normalizar_para_busca(texto)
+
+def normalizar_cabecalho(texto) -> str:
+    """Minúsculas, sem acentos, com espaços e hífens trocados por '_'. Usado nos cabeçalhos de orçamento."""
+    if not isinstance(texto, str): return ""
+    return _normalizar_cabecalho(texto)
+
+def limpar_texto(texto) -> str:
+    """Remove acentos, caracteres especiais, converte para minúsculas e padroniza espaços."""
+    if not isinstance(texto, str): return ""
+    return _limpar_texto(texto)
+
+def normalizar_serie(serie: pd.Series, funcao=limpar_texto) -> pd.Series:
+    """
+    Aplica uma das funções de normalização a uma Series inteira. Cada valor distinto
+    é normalizado uma única vez (pd.factorize) e o resultado é espalhado de volta.
+    Valores nulos viram "" (como nas funções escalares).
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    normalizados = np.array([funcao(v) for v in unicos] + [""], dtype=object)
+    # O código -1 (nulo) aponta para o "" adicionado no fim do array.
+    return pd.Series(normalizados[codigos], index=serie.index, name=serie.name)
+
+def estatisticas_cache() -> dict:
+    """Acertos/erros dos caches LRU de cada modo (útil para diagnóstico)."""
+    return {
+        "busca": _normalizar_para_busca.cache_info()._asdict(),
+        "cabecalho": _normalizar_cabecalho.cache_info()._asdict(),
+        "limpeza": _limpar_texto.cache_info()._asdict(),
+    }
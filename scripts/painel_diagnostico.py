@@ -0,0 +1,72 @@
+# scripts/painel_diagnostico.py
+import pandas as pd
+import streamlit as st
+
+from scripts import instrumentacao, normalizacao, perfil_sql
+
+# --- Painel de Diagnóstico -------------------------------------------------- #
+# Não aparece no menu: é aberto pelo Dashboard com ?diagnostico=1 na URL.
+# Mostra as métricas coletadas por scripts/instrumentacao.py, ao vivo.
+INTERVALO_ATUALIZACAO = 2  # segundos
+
+
+def _tabela_metricas(metricas: list) -> pd.DataFrame:
+    df = pd.DataFrame(metricas)
+    for coluna in ("tempo_medio_s", "p50_s", "p95_s", "tempo_maximo_s"):
+        df[coluna.replace("_s", "_ms")] = df[coluna].astype(float) * 1000
+    return df[["nome", "chamadas", "erros", "tentativas", "linhas", "tempo_total_s",
+               "tempo_medio_ms", "p50_ms", "p95_ms", "tempo_maximo_ms", "ultima_chamada"]]
+
+def _exibir_metricas() -> None:
+    metricas = instrumentacao.obter_metricas()
+    if not metricas:
+        st.info("Nenhuma chamada registrada ainda. Use as outras páginas e volte aqui.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Chamadas", sum(m["chamadas"] for m in metricas))
+    col2.metric("Erros", sum(m["erros"] for m in metricas))
+    col3.metric("Tempo total", f"{sum(m['tempo_total_s'] for m in metricas):.2f} s")
+
+    df = _tabela_metricas(metricas)
+    st.dataframe(
+        df,
+        column_config={
+            "nome": st.column_config.TextColumn("Função", width="large"),
+            "tempo_total_s": st.column_config.NumberColumn("Tempo total (s)", format="%.3f"),
+            "tempo_medio_ms": st.column_config.NumberColumn("Média (ms)", format="%.1f"),
+            "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.0f", help="Estimado pelo histograma."),
+            "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.0f", help="Estimado pelo histograma."),
+            "tempo_maximo_ms": st.column_config.NumberColumn("Máximo (ms)", format="%.1f"),
+        },
+        hide_index=True, use_container_width=True
+    )
+    st.bar_chart(df.head(15).set_index("nome")["tempo_total_s"], horizontal=True)
+
+    funcao = st.selectbox("Histograma de latência:", options=df["nome"].tolist())
+    histograma = next(m["histograma"] for m in metricas if m["nome"] == funcao)
+    st.bar_chart(pd.Series(histograma, name="chamadas").rename_axis("até (s)"))
+
+def exibir() -> None:
+    st.title("🩺 Diagnóstico")
+    st.caption("Métricas das funções do processador desde o início do servidor (ou da última vez que foram zeradas).")
+
+    ao_vivo = st.toggle("Atualizar automaticamente", value=True)
+    st.fragment(_exibir_metricas, run_every=INTERVALO_ATUALIZACAO if ao_vivo else None)()
+
+    st.subheader("Exportar")
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Métricas (JSON)", instrumentacao.exportar("json"), file_name="metricas_sio.json", mime="application/json")
+    col2.download_button("Métricas (Prometheus)", instrumentacao.exportar("prometheus"), file_name="metricas_sio.prom", mime="text/plain")
+    if col3.button("Zerar métricas"):
+        instrumentacao.zerar_metricas()
+        st.rerun()
+
+    with st.expander("Perfil SQL"):
+        if not perfil_sql.ATIVO:
+            st.caption("Desligado. Inicie o servidor com SIO_PERFIL_SQL=1 (limite do log de lentas em SIO_PERFIL_SQL_LIMITE_MS).")
+        else:
+            st.caption(f"Consultas acima de {perfil_sql.LIMITE_LENTO_MS:.0f} ms vão para {perfil_sql.ARQUIVO_LOG}.")
+            st.dataframe(perfil_sql.relatorio(), hide_index=True, use_container_width=True)
+
+    with st.expander("Cache de normalização de texto"):
+        st.json(normalizacao.estatisticas_cache())
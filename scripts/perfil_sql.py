@@ -0,0 +1,231 @@
+# scripts/perfil_sql.py
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+
+# --- Perfil das Consultas SQL ----------------------------------------------- #
+# Modo opcional (SIO_PERFIL_SQL=1, ou ativar()) em que as conexões abertas pelo
+# processador cronometram cada comando. Comandos acima do limite vão para o log de
+# consultas lentas com parâmetros e EXPLAIN QUERY PLAN, e todos são agregados pelo
+# texto normalizado (literais trocados por '?') para o relatório. O plano de cada
+# comando distinto é capturado uma vez, o que também revela as varreduras completas
+# de tabela ('SCAN tabela' sem índice).
+ATIVO = os.environ.get("SIO_PERFIL_SQL", "0") == "1"
+LIMITE_LENTO_MS = float(os.environ.get("SIO_PERFIL_SQL_LIMITE_MS", "100"))
+ARQUIVO_LOG = Path(__file__).resolve().parent.parent / "data" / "perfil_sql.log"
+
+_lock = threading.Lock()
+_estatisticas = {}
+
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACOS = re.compile(r"\s+")
+_COMANDOS_COM_PLANO = ("select", "insert", "update", "delete", "with", "replace")
+
+
+def normalizar_sql(sql: str) -> str:
+    """Texto do comando sem literais e com espaços padronizados, para agrupar execuções iguais."""
+    sql = _RE_TEXTO.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_LISTA.sub("(?...)", sql)
+    return _RE_ESPACOS.sub(" ", sql).strip()
+
+def ativar(limite_ms: float = None) -> None:
+    global ATIVO, LIMITE_LENTO_MS
+    ATIVO = True
+    if limite_ms is not None:
+        LIMITE_LENTO_MS = limite_ms
+
+def desativar() -> None:
+    global ATIVO
+    ATIVO = False
+
+def zerar() -> None:
+    with _lock:
+        _estatisticas.clear()
+
+def _capturar_plano(conexao: sqlite3.Connection, sql: str, parametros) -> list:
+    if not sql.lstrip().lower().startswith(_COMANDOS_COM_PLANO):
+        return []
+    try:
+        # Cursor comum (não perfilado) na mesma conexão: enxerga a mesma transação.
+        cursor = sqlite3.Cursor(conexao)
+        return [linha[-1] for linha in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros or ()).fetchall()]
+    except sqlite3.Error as e:
+        return [f"(plano indisponível: {e})"]
+
+def _varredura_completa(plano: list) -> bool:
+    return any(p.startswith("SCAN ") and "INDEX" not in p for p in plano)
+
+def _registrar_lenta(estatistica: dict, sql: str, parametros, duracao: float, plano: list) -> None:
+    linhas = [
+        f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Consulta lenta: {duracao * 1000:.1f} ms (limite {LIMITE_LENTO_MS:.0f} ms)",
+        f"  SQL: {_RE_ESPACOS.sub(' ', sql).strip()}",
+        f"  Parâmetros: {parametros!r}"[:2000],
+    ] + [f"  Plano: {p}" for p in plano]
+    texto = "\n".join(linhas)
+    print(texto)
+    try:
+        ARQUIVO_LOG.parent.mkdir(exist_ok=True)
+        with open(ARQUIVO_LOG, "a", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    except OSError as e:
+        print(f"Não foi possível gravar o log de consultas lentas: {e}")
+
+class _Execucao:
+    """Uma execução em andamento: o tempo das leituras (fetch) é somado ao do execute."""
+    __slots__ = ("estatistica", "sql", "parametros", "duracao", "logada", "conexao")
+
+    def __init__(self, estatistica, sql, parametros, conexao):
+        self.estatistica, self.sql, self.parametros, self.conexao = estatistica, sql, parametros, conexao
+        self.duracao = 0.0
+        self.logada = False
+
+    def acrescentar(self, duracao: float, linhas: int = 0) -> None:
+        with _lock:
+            self.duracao += duracao
+            self.estatistica["tempo_total_s"] += duracao
+            self.estatistica["tempo_maximo_s"] = max(self.estatistica["tempo_maximo_s"], self.duracao)
+            self.estatistica["linhas"] += max(linhas, 0)
+            lenta = not self.logada and self.duracao * 1000 >= LIMITE_LENTO_MS
+            if lenta:
+                self.logada = True
+                self.estatistica["lentas"] += 1
+        if lenta:
+            plano = _capturar_plano(self.conexao, self.sql, self.parametros)
+            _registrar_lenta(self.estatistica, self.sql, self.parametros, self.duracao, plano)
+
+def _iniciar_execucao(conexao, sql: str, parametros) -> _Execucao:
+    chave = normalizar_sql(sql)
+    with _lock:
+        estatistica = _estatisticas.get(chave)
+        novo = estatistica is None
+        if novo:
+            estatistica = _estatisticas[chave] = {
+                "sql": chave, "execucoes": 0, "tempo_total_s": 0.0, "tempo_maximo_s": 0.0,
+                "linhas": 0, "lentas": 0, "plano": [], "varredura_completa": False,
+            }
+        estatistica["execucoes"] += 1
+    if novo:
+        plano = _capturar_plano(conexao, sql, parametros)
+        with _lock:
+            estatistica["plano"] = plano
+            estatistica["varredura_completa"] = _varredura_completa(plano)
+    return _Execucao(estatistica, sql, parametros, conexao)
+
+
+class CursorPerfilado(sqlite3.Cursor):
+    _execucao = None
+
+    def execute(self, sql, parametros=()):
+        self._execucao = _iniciar_execucao(self.connection, sql, parametros)
+        inicio = time.perf_counter()
+        super().execute(sql, parametros)
+        self._execucao.acrescentar(time.perf_counter() - inicio, self.rowcount)
+        return self
+
+    def executemany(self, sql, sequencia):
+        sequencia = list(sequencia)
+        self._execucao = _iniciar_execucao(self.connection, sql, sequencia[0] if sequencia else ())
+        self._execucao.parametros = f"{len(sequencia)} conjuntos; primeiro: {sequencia[0]!r}" if sequencia else ()
+        inicio = time.perf_counter()
+        super().executemany(sql, sequencia)
+        self._execucao.acrescentar(time.perf_counter() - inicio, self.rowcount)
+        return self
+
+    def _ler(self, metodo, *args):
+        inicio = time.perf_counter()
+        resultado = metodo(*args)
+        if self._execucao is not None:
+            linhas = len(resultado) if isinstance(resultado, list) else int(resultado is not None)
+            self._execucao.acrescentar(time.perf_counter() - inicio, linhas)
+        return resultado
+
+    def fetchone(self):
+        return self._ler(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._ler(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._ler(super().fetchall)
+
+class ConexaoPerfilada(sqlite3.Connection):
+    def cursor(self, factory=CursorPerfilado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+def conectar(caminho) -> sqlite3.Connection:
+    """Conexão comum, ou perfilada quando o modo de perfil está ativo."""
+    if ATIVO:
+        return sqlite3.connect(caminho, factory=ConexaoPerfilada)
+    return sqlite3.connect(caminho)
+
+
+# --- Relatório -------------------------------------------------------------- #
+def relatorio() -> pd.DataFrame:
+    """Uma linha por comando normalizado, do maior tempo total para o menor."""
+    with _lock:
+        dados = [dict(e, plano=" | ".join(e["plano"])) for e in _estatisticas.values()]
+    colunas = ["sql", "execucoes", "tempo_total_s", "tempo_medio_ms", "tempo_maximo_s", "linhas", "lentas", "varredura_completa", "plano"]
+    if not dados:
+        return pd.DataFrame(columns=colunas)
+    df = pd.DataFrame(dados)
+    df["tempo_medio_ms"] = df["tempo_total_s"] / df["execucoes"] * 1000
+    return df[colunas].sort_values("tempo_total_s", ascending=False).reset_index(drop=True)
+
+def imprimir_relatorio(limite: int = 20) -> None:
+    df = relatorio()
+    if df.empty:
+        print("Nenhum comando SQL registrado.")
+        return
+    print(f"{'Total (s)':>10}{'Execuções':>11}{'Média (ms)':>12}{'Máx (ms)':>10}{'Lentas':>8}  Comando")
+    for _, r in df.head(limite).iterrows():
+        aviso = "  [SCAN]" if r["varredura_completa"] else ""
+        print(f"{r['tempo_total_s']:>10.3f}{r['execucoes']:>11}{r['tempo_medio_ms']:>12.2f}"
+              f"{r['tempo_maximo_s'] * 1000:>10.1f}{r['lentas']:>8}  {r['sql'][:110]}{aviso}")
+    varreduras = df[df["varredura_completa"]]
+    if not varreduras.empty:
+        print("\nComandos com varredura completa de tabela:")
+        for _, r in varreduras.iterrows():
+            print(f"  - {r['sql'][:110]}\n      {r['plano']}")
+
+
+def main(argv=None) -> int:
+    # O perfil roda sobre o mesmo pipeline sintético do benchmark (nunca sobre data/).
+    # Com 'python -m' este arquivo é o __main__; o estado que vale é o do módulo
+    # importado pelo processador.
+    from scripts import benchmark, perfil_sql
+
+    parser = argparse.ArgumentParser(description="Perfil dos comandos SQL do pipeline sobre dados sintéticos.")
+    parser.add_argument("--linhas", type=int, default=50_000, help="Linhas do histórico no banco sintético.")
+    parser.add_argument("--linhas-planilha", type=int, default=1_000)
+    parser.add_argument("--catalogo", type=int, default=500)
+    parser.add_argument("--limite-ms", type=float, default=LIMITE_LENTO_MS, help="Limite para o log de consultas lentas.")
+    parser.add_argument("-o", "--saida", help="Grava o relatório agregado em CSV.")
+    args = parser.parse_args(argv)
+
+    perfil_sql.ativar(args.limite_ms)
+    benchmark.executar(obras=200, linhas=args.linhas, linhas_planilha=args.linhas_planilha, catalogo=args.catalogo, repeticoes=1)
+    print()
+    perfil_sql.imprimir_relatorio()
+    if args.saida:
+        perfil_sql.relatorio().to_csv(args.saida, sep=";", index=False, encoding="utf-8-sig")
+        print(f"\nRelatório gravado em {args.saida}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
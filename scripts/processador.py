@@ -3,19 +3,49 @@ import sqlite3
 from datetime import datetime
 from pathlib import Path
 import pandas as pd
-import unicodedata
 import re
 import time
 import os
+import hashlib
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from fuzzywuzzy import fuzz, process
+from rapidfuzz import fuzz as rf_fuzz, process as rf_process
 import numpy as np
+import sys
+from concurrent.futures import Future
+from scripts import instrumentacao, perfil_sql, estatistica_precos, series_precos, fila_escrita
+from scripts.normalizacao import normalizar_para_busca, normalizar_cabecalho
 
 # --- Configuração de Paths e Banco de Dados --------------------------------- #
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 DB_PATH = DATA_DIR / "orcamentos.db"
 
+def _conectar() -> sqlite3.Connection:
+    """Conexão com o banco; perfilada (scripts/perfil_sql.py) quando SIO_PERFIL_SQL=1."""
+    return perfil_sql.conectar(DB_PATH)
+
+def _conectar_escrita(caminho: Path) -> sqlite3.Connection:
+    conn = perfil_sql.conectar(caminho)
+    # Em WAL, synchronous=NORMAL mantém o banco íntegro e só sincroniza o disco nos checkpoints.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Os resumos por obra cobrem também as obras arquivadas (ver "Arquivo de Obras Antigas").
+    _anexar_arquivo(conn, caminho)
+    return conn
+
+# Todas as escritas do processo passam por uma única thread (ver scripts/fila_escrita.py).
+# As funções "_..." chamadas por ela recebem a conexão de escrita e não fazem commit.
+_fila_escrita = fila_escrita.FilaEscrita(_conectar_escrita)
+
+def executar_escrita(funcao, *args, **kwargs):
+    """Executa 'funcao(conn, *args, **kwargs)' na fila de escrita e devolve o retorno (ou levanta o erro)."""
+    return _fila_escrita.executar(DB_PATH, funcao, *args, **kwargs)
+
+def submeter_escrita(funcao, *args, **kwargs) -> Future:
+    """Como executar_escrita, sem esperar: devolve um Future."""
+    return _fila_escrita.submeter(DB_PATH, funcao, *args, **kwargs)
+
 # --- Configuração da IA (Gemini) ---
 model = None
 try:
@@ -32,26 +62,28 @@ except Exception as e:
 
 # --- FUNÇÃO DE LIMPEZA GERAL (JÁ ESTÁ CORRETA) ---
 def limpar_banco_de_dados_completo():
-    _garantir_tabelas()
+    """Reset geral: backup automático e recriação das tabelas de dados (ver scripts/gestao_dados.py)."""
+    from scripts import gestao_dados  # importado aqui: gestao_dados depende deste módulo
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        tabelas_para_limpar = ["itens_orcamento", "base_custos", "mapa_itens", "observacoes_obra"]
-        for tabela in tabelas_para_limpar:
-            print(f"Limpando tabela: {tabela}...")
-            cursor.execute(f"DELETE FROM {tabela}")
-        conn.commit()
+        gestao_dados.resetar_banco()
         print("Limpeza geral do banco de dados concluída com sucesso.")
         return True
     except Exception as e:
         print(f"Erro ao executar a limpeza geral do banco de dados: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
 
 # --- Funções de IA e Mapeamento Inteligente -------------------- #
+TENTATIVAS_IA = 3
+ESPERA_RETENTATIVA_IA = 2.0  # segundos, dobrando a cada nova tentativa
+# Só falhas passageiras (limite de uso, serviço indisponível, tempo esgotado) são
+# repetidas; argumento inválido, chave ou permissão falham na primeira tentativa.
+ERROS_TRANSITORIOS_IA = (
+    google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded,
+    ConnectionError, TimeoutError,
+)
+
 def sugerir_grupo_para_item(item_nome: str, grupos_e_descricoes: dict) -> str | None:
     if not model:
         print("Modelo de IA não inicializado. Usando sugestão nula.")
@@ -80,8 +112,22 @@ def sugerir_grupo_para_item(item_nome: str, grupos_e_descricoes: dict) -> str |
     {opcoes_formatadas}
     **Categoria Correta:**
     """
+    for tentativa in range(1, TENTATIVAS_IA + 1):
+        try:
+            with instrumentacao.cronometro("ia.generate_content"):
+                response = model.generate_content(prompt)
+            break
+        except ERROS_TRANSITORIOS_IA as e:
+            if tentativa == TENTATIVAS_IA:
+                print(f"Erro ao chamar a IA para sugestão de grupo: {e}")
+                return None
+            instrumentacao.registrar_tentativa("ia.generate_content")
+            print(f"Erro ao chamar a IA (tentativa {tentativa} de {TENTATIVAS_IA}): {e}. Tentando novamente...")
+            time.sleep(ESPERA_RETENTATIVA_IA * 2 ** (tentativa - 1))
+        except Exception as e:
+            print(f"Erro ao chamar a IA para sugestão de grupo: {e}")
+            return None
     try:
-        response = model.generate_content(prompt)
         sugestao = response.text.strip()
         if sugestao in lista_nomes_grupos:
             print(f"Serviço: '{item_nome}' -> Sugestão IA: '{sugestao}'")
@@ -94,24 +140,43 @@ def sugerir_grupo_para_item(item_nome: str, grupos_e_descricoes: dict) -> str |
                 return melhor_match[0]
             return None
     except Exception as e:
-        print(f"Erro ao chamar a IA para sugestão de grupo: {e}")
+        print(f"Erro ao interpretar a resposta da IA para sugestão de grupo: {e}")
         return None
 
-def _preprocess_string(s: str) -> str:
-    if not isinstance(s, str): return ""
-    s = unicodedata.normalize("NFKD", s.lower()).encode("ascii", "ignore").decode("utf-8")
-    s = re.sub(r"[^a-z0-9\s]", "", s)
-    return s
-
 def encontrar_melhor_correspondencia(query: str, choices: list) -> tuple | None:
     if not query or not choices: return None
-    best_wratio = process.extractOne(query, choices, scorer=fuzz.WRatio, processor=_preprocess_string)
-    best_partial = process.extractOne(query, choices, scorer=fuzz.partial_ratio, processor=_preprocess_string)
-    best_token_set = process.extractOne(query, choices, scorer=fuzz.token_set_ratio, processor=_preprocess_string)
+    best_wratio = process.extractOne(query, choices, scorer=fuzz.WRatio, processor=normalizar_para_busca)
+    best_partial = process.extractOne(query, choices, scorer=fuzz.partial_ratio, processor=normalizar_para_busca)
+    best_token_set = process.extractOne(query, choices, scorer=fuzz.token_set_ratio, processor=normalizar_para_busca)
     all_results = [best_wratio, best_partial, best_token_set]
     best_overall = max(all_results, key=lambda item: item[1])
     return best_overall
 
+def sugerir_correspondencias_em_lote(descricoes: list, choices: list, limite: int = 5, tamanho_bloco: int = 256) -> dict:
+    """
+    Versão em lote de encontrar_melhor_correspondencia: calcula de uma vez, com a matriz
+    do RapidFuzz (cdist), os 'limite' melhores itens padrão para cada descrição.
+    Retorna {descricao: [(item_padrao, score), ...]} em ordem decrescente de score.
+    """
+    if not descricoes or not choices:
+        return {d: [] for d in descricoes}
+    opcoes = [normalizar_para_busca(c) for c in choices]
+    k = min(limite, len(choices))
+    resultado = {}
+    # Processa em blocos para limitar a memória da matriz (descrições x itens padrão).
+    for inicio in range(0, len(descricoes), tamanho_bloco):
+        bloco = descricoes[inicio:inicio + tamanho_bloco]
+        consultas = [normalizar_para_busca(d) for d in bloco]
+        scores = None
+        for scorer in (rf_fuzz.WRatio, rf_fuzz.partial_ratio, rf_fuzz.token_set_ratio):
+            matriz = rf_process.cdist(consultas, opcoes, scorer=scorer, workers=-1)
+            scores = matriz if scores is None else np.maximum(scores, matriz)
+        melhores = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for linha, desc in enumerate(bloco):
+            candidatos = sorted(melhores[linha], key=lambda j: -scores[linha, j])
+            resultado[desc] = [(choices[j], int(round(scores[linha, j]))) for j in candidatos]
+    return resultado
+
 def sugerir_nome_obra_limpo(nome_arquivo: str) -> str:
     termos_finais = ['PLANILHA ORÇAMENTÁRIA', 'PLANILHA ORCAMENTARIA', 'ORÇAMENTO', 'ORCAMENTO', 'PROPOSTA', 'REVISAO', 'REVISÃO', 'VERSAO', 'VERSÃO', 'REV']
     nome_obra = Path(nome_arquivo).stem
@@ -125,6 +190,10 @@ def sugerir_nome_obra_limpo(nome_arquivo: str) -> str:
     nome_obra = nome_obra.strip(' -_')
     return nome_obra.strip()
 
+# Versão da lógica de leitura (ler_orcamento + preparar_dataframe). Incremente ao alterar
+# essas funções para invalidar o cache de planilhas já lidas (scripts/cache_planilhas.py).
+VERSAO_PARSER = 1
+
 def ler_orcamento(file_buffer: bytes) -> pd.DataFrame:
     try:
         df = pd.read_excel(file_buffer, engine="openpyxl", header=None)
@@ -144,10 +213,6 @@ def ler_orcamento(file_buffer: bytes) -> pd.DataFrame:
     return df
 
 def preparar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    def _normalize_text(text: str) -> str:
-        if not isinstance(text, str): return ""
-        text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("utf-8")
-        return re.sub(r"[\s-]+", "_", text.strip())
     def _parse_num(value):
         if pd.isna(value): return None
         if isinstance(value, (int, float)): return float(value)
@@ -161,7 +226,7 @@ def preparar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
             return float(s_value)
         except (ValueError, TypeError):
             return None
-    df.columns = [_normalize_text(col) for col in df.columns]
+    df.columns = [normalizar_cabecalho(col) for col in df.columns]
     rename_map = {"item": "item", "descricao": "descricao", "desc": "descricao", "unidade": "unidade", "unid": "unidade", "quantidade": "quantidade", "qtd": "quantidade", "valor_unitario": "valor_unitario", "preco_unitario": "valor_unitario", "valor_unit": "valor_unitario", "valor_total": "valor_total", "preco_total": "valor_total"}
     df = df.rename(columns={c: next((v for k, v in rename_map.items() if c.startswith(k)), c) for c in df.columns})
     for col in ["quantidade", "valor_unitario"]:
@@ -176,8 +241,23 @@ def preparar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     df = df[[c for c in colunas_finais if c in df.columns]]
     return df
 
+# Caminhos de banco cujo schema já foi verificado neste processo.
+_SCHEMAS_VERIFICADOS = set()
+
 def _garantir_tabelas():
-    conn = sqlite3.connect(DB_PATH)
+    # Evita repetir o DDL a cada consulta; refaz se o arquivo do banco sumiu ou o caminho mudou.
+    if DB_PATH in _SCHEMAS_VERIFICADOS and DB_PATH.exists():
+        return
+    conn = _conectar()
+    # WAL: as leituras não esperam pela escrita em andamento (o modo fica gravado no arquivo).
+    conn.execute("PRAGMA journal_mode=WAL")
+    _criar_tabelas(conn)
+    conn.commit()
+    conn.close()
+    _SCHEMAS_VERIFICADOS.add(DB_PATH)
+
+def _criar_tabelas(conn: sqlite3.Connection) -> None:
+    """DDL idempotente do schema (tabelas, colunas novas e índices), sem commit."""
     cursor = conn.cursor()
     try:
         cursor.execute("DROP INDEX IF EXISTS idx_item_padrao")
@@ -188,7 +268,7 @@ def _garantir_tabelas():
         id INTEGER PRIMARY KEY AUTOINCREMENT, descricao TEXT, unidade TEXT,
         quantidade REAL, valor_unitario REAL, valor_total REAL,
         nome_obra TEXT, arquivo_original TEXT, importado_em TIMESTAMP,
-        nome_cliente TEXT
+        nome_cliente TEXT, hash_arquivo TEXT
     )""")
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS mapa_itens (
@@ -223,56 +303,480 @@ def _garantir_tabelas():
         codigo_composicao TEXT,
         numero_manual TEXT
     )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id_job INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        status TEXT NOT NULL,
+        descricao TEXT,
+        parametros TEXT,
+        resultado TEXT,
+        total_lotes INTEGER DEFAULT 0,
+        ultimo_lote INTEGER DEFAULT 0,
+        progresso REAL DEFAULT 0,
+        itens_processados INTEGER DEFAULT 0,
+        itens_salvos INTEGER DEFAULT 0,
+        erro TEXT,
+        pid INTEGER,
+        criado_em TIMESTAMP,
+        atualizado_em TIMESTAMP
+    )""")
     try: cursor.execute("SELECT codigo_composicao FROM base_custos LIMIT 1")
     except sqlite3.OperationalError: cursor.execute("ALTER TABLE base_custos ADD COLUMN codigo_composicao TEXT")
     try: cursor.execute("SELECT numero_manual FROM base_custos LIMIT 1")
     except sqlite3.OperationalError: cursor.execute("ALTER TABLE base_custos ADD COLUMN numero_manual TEXT")
+    try: cursor.execute("SELECT hash_linha FROM base_custos LIMIT 1")
+    except sqlite3.OperationalError: cursor.execute("ALTER TABLE base_custos ADD COLUMN hash_linha TEXT")
     try: cursor.execute("SELECT peso_item FROM mapa_itens LIMIT 1")
     except sqlite3.OperationalError: cursor.execute("ALTER TABLE mapa_itens ADD COLUMN peso_item REAL")
     try: cursor.execute("SELECT id_grupo FROM mapa_itens LIMIT 1")
     except sqlite3.OperationalError: cursor.execute("ALTER TABLE mapa_itens ADD COLUMN id_grupo INTEGER REFERENCES grupos_servico(id_grupo)")
     try: cursor.execute("SELECT nome_cliente FROM itens_orcamento LIMIT 1")
     except sqlite3.OperationalError: cursor.execute("ALTER TABLE itens_orcamento ADD COLUMN nome_cliente TEXT")
-    conn.commit()
+    try: cursor.execute("SELECT hash_arquivo FROM itens_orcamento LIMIT 1")
+    except sqlite3.OperationalError: cursor.execute("ALTER TABLE itens_orcamento ADD COLUMN hash_arquivo TEXT")
+    try: cursor.execute("SELECT preco_atipico FROM itens_orcamento LIMIT 1")
+    except sqlite3.OperationalError: cursor.execute("ALTER TABLE itens_orcamento ADD COLUMN preco_atipico INTEGER DEFAULT 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_itens_nome_obra ON itens_orcamento(nome_obra)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_itens_arquivo ON itens_orcamento(arquivo_original)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_itens_hash_arquivo ON itens_orcamento(hash_arquivo)")
+    # Versões da base de custos (ver "Custos no Tempo"); base_custos guarda só a vigente de cada item.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS historico_custos (
+        id_versao INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_padrao_nome TEXT NOT NULL,
+        unidade_de_medida TEXT,
+        custo_material REAL,
+        custo_mao_de_obra REAL,
+        homem_hora_profissional REAL,
+        homem_hora_ajudante REAL,
+        codigo_composicao TEXT,
+        numero_manual TEXT,
+        valido_de TIMESTAMP,
+        valido_ate TIMESTAMP,
+        registrado_em TIMESTAMP
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historico_custos_vigencia ON historico_custos(item_padrao_nome, valido_de)")
+    # Bancos anteriores ao histórico: a base atual vira a primeira versão de cada item.
+    cursor.execute(f"""
+        INSERT INTO historico_custos ({", ".join(COLUNAS_VERSAO_CUSTO)}, registrado_em)
+        SELECT {", ".join(COLUNAS_VERSAO_CUSTO)}, data_referencia FROM base_custos
+        WHERE NOT EXISTS (SELECT 1 FROM historico_custos)
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS resumo_precos_item (
+        item_padrao TEXT PRIMARY KEY,
+        mediana REAL,
+        mediana_log REAL,
+        mad_log REAL,
+        amostras INTEGER
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS indice_precos (
+        mes TEXT PRIMARY KEY,
+        valor REAL NOT NULL
+    )""")
+    for tabela in TABELAS_PRECOS_ATUAIS.values():
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabela} (
+            item_padrao TEXT NOT NULL,
+            janela_meses INTEGER NOT NULL,
+            preco_atual REAL,
+            preco_atual_corrigido REAL,
+            amostras INTEGER,
+            ultima_data TEXT,
+            tendencia_anual_perc REAL,
+            PRIMARY KEY (item_padrao, janela_meses)
+        )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS fato_margem_obra (
+        nome_obra TEXT NOT NULL,
+        item_padrao TEXT NOT NULL,
+        nome_grupo TEXT,
+        nome_cliente TEXT,
+        linhas INTEGER,
+        quantidade REAL,
+        receita REAL,
+        receita_com_custo REAL,
+        custo REAL,
+        margem REAL,
+        PRIMARY KEY (nome_obra, item_padrao)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cubo_vendas (
+        nome_grupo TEXT NOT NULL,
+        nome_obra TEXT NOT NULL,
+        nome_cliente TEXT NOT NULL,
+        mes TEXT NOT NULL,
+        linhas INTEGER,
+        quantidade REAL,
+        receita REAL,
+        preco_min REAL,
+        preco_max REAL,
+        PRIMARY KEY (nome_grupo, nome_obra, nome_cliente, mes)
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS versoes_dados (
+        tabela TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL DEFAULT 0
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_observacoes_obra ON observacoes_obra(nome_obra, data_criacao)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_itens_preco_atipico ON itens_orcamento(preco_atipico) WHERE preco_atipico = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_itens_descricao ON itens_orcamento(descricao)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mapa_item_padrao ON mapa_itens(item_padrao)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fato_margem_grupo ON fato_margem_obra(nome_grupo)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cubo_vendas_obra ON cubo_vendas(nome_obra)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cubo_vendas_mes ON cubo_vendas(mes)")
+
+# --- Versões dos Dados ------------------------------------------------------ #
+# Cada função que grava incrementa o contador das tabelas que alterou, na mesma
+# transação. Os carregadores com st.cache_data recebem as versões das tabelas que
+# leem como argumento: uma escrita invalida só os caches que dependem dela, inclusive
+# quando vem de outro processo (ex.: python -m scripts.importar).
+def _incrementar_versao(conn: sqlite3.Connection, *tabelas: str) -> None:
+    conn.executemany("""
+        INSERT INTO versoes_dados (tabela, versao) VALUES (?, 1)
+        ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1
+    """, [(tabela,) for tabela in tabelas])
+
+def versoes_dados(*tabelas: str) -> tuple:
+    """Versão atual de cada tabela pedida (0 se nunca foi alterada), na mesma ordem."""
+    _garantir_tabelas()
+    conn = _conectar()
+    versoes = dict(conn.execute("SELECT tabela, versao FROM versoes_dados").fetchall())
     conn.close()
+    return tuple(versoes.get(tabela, 0) for tabela in tabelas)
+
+def _fonte_desatualizada(conn: sqlite3.Connection, tabela_derivada: str, *fontes: str) -> int | None:
+    """
+    Tabelas derivadas (resumos) guardam em versoes_dados a soma das versões das fontes
+    no último cálculo; como as versões só crescem, a soma só se repete se nada mudou.
+    Retorna a soma atual quando a derivada precisa ser recalculada, senão None.
+    """
+    versoes = dict(conn.execute("SELECT tabela, versao FROM versoes_dados").fetchall())
+    fonte = sum(versoes.get(tabela, 0) for tabela in fontes)
+    return None if versoes.get(tabela_derivada) == fonte else fonte
+
+def _atualizar_pela_fila(conn: sqlite3.Connection, tabela_derivada: str, fontes: tuple, atualizar, *args) -> None:
+    """
+    Nas consultas: se o resumo está desatualizado (conferido na conexão de leitura),
+    pede a 'atualizar' que o refaça pela fila de escrita e espera. 'atualizar' confere
+    de novo dentro da fila, então pedidos simultâneos refazem o resumo uma vez só.
+    """
+    if _fonte_desatualizada(conn, tabela_derivada, *fontes) is not None:
+        executar_escrita(atualizar, *args)
+
+def _soma_versoes(conn: sqlite3.Connection, *fontes: str) -> int:
+    versoes = dict(conn.execute("SELECT tabela, versao FROM versoes_dados").fetchall())
+    return sum(versoes.get(tabela, 0) for tabela in fontes)
+
+def _registrar_fonte(conn: sqlite3.Connection, tabela_derivada: str, fonte: int) -> None:
+    conn.execute("""
+        INSERT INTO versoes_dados (tabela, versao) VALUES (?, ?)
+        ON CONFLICT(tabela) DO UPDATE SET versao = excluded.versao
+    """, (tabela_derivada, fonte))
 
-def salvar_na_base(df: pd.DataFrame, nome_obra: str, nome_arquivo_original: str, nome_cliente: str) -> int:
+def _valor_sql(valor):
+    """Converte NaN/NA do pandas em None para o SQLite."""
+    return None if valor is None or (not isinstance(valor, str) and pd.isna(valor)) else valor
+
+def salvar_na_base(df: pd.DataFrame, nome_obra: str, nome_arquivo_original: str, nome_cliente: str, hash_arquivo: str = None) -> int:
     _garantir_tabelas()
-    conn = sqlite3.connect(DB_PATH)
+    return executar_escrita(_salvar_na_base, df, nome_obra, nome_arquivo_original, nome_cliente, hash_arquivo)
+
+def _salvar_na_base(conn: sqlite3.Connection, df: pd.DataFrame, nome_obra: str, nome_arquivo_original: str,
+                    nome_cliente: str, hash_arquivo: str) -> int:
     cursor = conn.cursor()
-    itens_adicionados = 0
-    for _, row in df.iterrows():
-        cursor.execute("SELECT 1 FROM itens_orcamento WHERE descricao = ? AND unidade = ? AND quantidade = ? AND valor_unitario = ? AND arquivo_original = ?",
-                       (row.get("descricao"), row.get("unidade"), row.get("quantidade"), row.get("valor_unitario"), nome_arquivo_original))
-        if cursor.fetchone() is None:
-            cursor.execute("""
-                INSERT INTO itens_orcamento
-                (descricao, unidade, quantidade, valor_unitario, valor_total, nome_obra, arquivo_original, importado_em, nome_cliente)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (row.get("descricao"), row.get("unidade"), row.get("quantidade"), row.get("valor_unitario"),
-                  row.get("valor_total"), nome_obra, nome_arquivo_original, datetime.now(), nome_cliente))
-            itens_adicionados += 1
-    conn.commit()
+    # Carrega de uma vez as linhas já gravadas deste arquivo, em vez de um SELECT por linha.
+    cursor.execute("SELECT descricao, unidade, quantidade, valor_unitario FROM itens_orcamento WHERE arquivo_original = ?",
+                   (nome_arquivo_original,))
+    existentes = set(cursor.fetchall())
+    derivadas_em_dia = _derivadas_em_dia(conn)
+    agora = datetime.now()
+    novos_registros = []
+    for row in df.to_dict("records"):
+        chave = tuple(_valor_sql(row.get(c)) for c in ("descricao", "unidade", "quantidade", "valor_unitario"))
+        # Como no SQL, valores nulos nunca são considerados iguais: a linha é sempre inserida.
+        if None not in chave:
+            if chave in existentes:
+                continue
+            existentes.add(chave)
+        novos_registros.append((*chave, _valor_sql(row.get("valor_total")), nome_obra, nome_arquivo_original, agora, nome_cliente, hash_arquivo))
+    atipicos = _avaliar_precos(conn, [r[0] for r in novos_registros], [r[3] for r in novos_registros])
+    resumo_precos_em_dia = _resumo_precos_em_dia(conn)
+    cursor.executemany("""
+        INSERT INTO itens_orcamento
+        (descricao, unidade, quantidade, valor_unitario, valor_total, nome_obra, arquivo_original, importado_em, nome_cliente, hash_arquivo, preco_atipico)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(*registro, PRECO_ATIPICO if atipico else PRECO_NORMAL) for registro, atipico in zip(novos_registros, atipicos)])
+    if novos_registros:
+        _incrementar_versao(conn, "itens_orcamento")
+        _atualizar_derivadas_das_obras(conn, [nome_obra], derivadas_em_dia)
+        # As linhas marcadas ficam fora do resumo: só os itens das demais mudam.
+        descricoes_normais = [registro[0] for registro, atipico in zip(novos_registros, atipicos) if not atipico]
+        _atualizar_resumo_precos_dos_itens(conn, _itens_das_descricoes(conn, descricoes_normais), resumo_precos_em_dia)
+    if atipicos.any():
+        print(f"{int(atipicos.sum())} linha(s) de '{nome_arquivo_original}' marcadas com preço atípico para revisão.")
+    return len(novos_registros)
+
+# --- Preços Atípicos -------------------------------------------------------- #
+# Cada linha importada é comparada com a mediana/MAD do histórico do seu item padrão
+# (scripts/estatistica_precos.py), base quente e arquivo. O resumo por item fica na
+# tabela resumo_precos_item. Importações, orçamentos gerados, mapeamentos e revisões
+# refazem só os itens que tocaram (leitura indexada por descrição), como as derivadas
+# por obra; qualquer outra mudança nas origens faz o próximo uso recalcular todos os
+# itens de uma vez. Linhas marcadas ficam fora das médias até serem revisadas, e a
+# marcação e a revisão valem também para as linhas arquivadas.
+PRECO_NORMAL, PRECO_ATIPICO, PRECO_CONFIRMADO = 0, 1, 2
+TAMANHO_BLOCO_SQL = 900  # nº de parâmetros por IN (...), abaixo do limite de versões antigas do SQLite
+
+def _consultar_em_blocos(conn: sqlite3.Connection, modelo_sql: str, valores: list) -> list:
+    """Executa 'modelo_sql' (com um {} no lugar da lista do IN) em blocos de valores."""
+    linhas = []
+    for inicio in range(0, len(valores), TAMANHO_BLOCO_SQL):
+        bloco = valores[inicio:inicio + TAMANHO_BLOCO_SQL]
+        linhas.extend(conn.execute(modelo_sql.format(", ".join("?" * len(bloco))), bloco).fetchall())
+    return linhas
+
+FONTES_RESUMO_PRECOS = ("itens_orcamento", "mapa_itens")
+
+def _gravar_resumo_precos(conn: sqlite3.Connection, df: pd.DataFrame) -> None:
+    resumo = estatistica_precos.resumo_mediana_mad(df['item_padrao'], df['valor_unitario'])
+    conn.executemany(
+        "INSERT INTO resumo_precos_item (item_padrao, mediana, mediana_log, mad_log, amostras) VALUES (?, ?, ?, ?, ?)",
+        resumo.astype(object).itertuples(index=False, name=None)
+    )
+
+def _atualizar_resumo_precos(conn: sqlite3.Connection) -> None:
+    """Recalcula resumo_precos_item se o histórico ou os mapeamentos mudaram desde o último cálculo."""
+    fonte = _fonte_desatualizada(conn, "resumo_precos_item", *FONTES_RESUMO_PRECOS)
+    if fonte is None:
+        return
+    df = pd.read_sql_query(f"""
+        SELECT m.item_padrao, io.valor_unitario
+        FROM {_fonte_historico(conn)} io
+        JOIN mapa_itens m ON io.descricao = m.descricao_original
+        WHERE m.item_padrao IS NOT NULL AND io.preco_atipico IS NOT 1
+    """, conn)
+    conn.execute("DELETE FROM resumo_precos_item")
+    _gravar_resumo_precos(conn, df)
+    _registrar_fonte(conn, "resumo_precos_item", fonte)
+
+def _resumo_precos_em_dia(conn: sqlite3.Connection) -> bool:
+    return _fonte_desatualizada(conn, "resumo_precos_item", *FONTES_RESUMO_PRECOS) is None
+
+def _itens_das_descricoes(conn: sqlite3.Connection, descricoes: list) -> list:
+    """Itens padrão mapeados a partir destas descrições."""
+    linhas = _consultar_em_blocos(
+        conn, "SELECT DISTINCT item_padrao FROM mapa_itens WHERE descricao_original IN ({}) AND item_padrao IS NOT NULL",
+        [d for d in set(descricoes) if d is not None])
+    return [item for (item,) in linhas]
+
+def _atualizar_resumo_precos_dos_itens(conn: sqlite3.Connection, itens: list, em_dia: bool) -> None:
+    """Refaz, só para estes itens, o resumo de preços se estava em dia (chamar depois de incrementar as versões)."""
+    if not em_dia:
+        return
+    itens = [i for i in set(itens) if i is not None]
+    descricoes = _consultar_em_blocos(
+        conn, "SELECT descricao_original, item_padrao FROM mapa_itens WHERE item_padrao IN ({})", itens)
+    item_da_descricao = dict(descricoes)
+    # Filtrar pela descrição deixa o SQLite usar o índice de descricao de cada base da união.
+    linhas = _consultar_em_blocos(conn, f"""
+        SELECT descricao, valor_unitario FROM {_fonte_historico(conn)}
+        WHERE descricao IN ({{}}) AND preco_atipico IS NOT 1
+    """, list(item_da_descricao))
+    df = pd.DataFrame(linhas, columns=['descricao', 'valor_unitario'])
+    df['item_padrao'] = df['descricao'].map(item_da_descricao)
+    for inicio in range(0, len(itens), TAMANHO_BLOCO_SQL):
+        bloco = itens[inicio:inicio + TAMANHO_BLOCO_SQL]
+        conn.execute(f"DELETE FROM resumo_precos_item WHERE item_padrao IN ({', '.join('?' * len(bloco))})", bloco)
+    _gravar_resumo_precos(conn, df)
+    _registrar_fonte(conn, "resumo_precos_item", _soma_versoes(conn, *FONTES_RESUMO_PRECOS))
+
+def _bases_do_historico(conn: sqlite3.Connection) -> list:
+    """Esquemas com itens_orcamento nesta conexão: main e, se anexado, o arquivo."""
+    if _arquivo_anexado(conn) and _colunas(conn, ESQUEMA_ARQUIVO):
+        return ["main", ESQUEMA_ARQUIVO]
+    return ["main"]
+
+def _avaliar_precos(conn: sqlite3.Connection, descricoes: list, valores: list) -> np.ndarray:
+    """Máscara dos preços atípicos de linhas novas, pelo resumo do item padrão de cada descrição."""
+    if not descricoes:
+        return np.zeros(0, dtype=bool)
+    _atualizar_resumo_precos(conn)
+    unicas = [d for d in set(descricoes) if d is not None]
+    item_da_descricao = dict(_consultar_em_blocos(
+        conn, "SELECT descricao_original, item_padrao FROM mapa_itens WHERE descricao_original IN ({})", unicas))
+    itens = [i for i in set(item_da_descricao.values()) if i is not None]
+    resumo = pd.DataFrame(
+        _consultar_em_blocos(conn, "SELECT item_padrao, mediana_log, mad_log, amostras FROM resumo_precos_item WHERE item_padrao IN ({})", itens),
+        columns=['item_padrao', 'mediana_log', 'mad_log', 'amostras']
+    ).set_index('item_padrao')
+    referencia = resumo.reindex(pd.Series(descricoes, dtype=object).map(item_da_descricao))
+    return estatistica_precos.marcar_atipicos(valores, referencia['mediana_log'], referencia['mad_log'], referencia['amostras'])
+
+def reavaliar_precos_do_historico() -> int:
+    """
+    Refaz a triagem de todo o histórico (ex.: bases importadas antes dela existir).
+    Linhas já confirmadas na revisão não são marcadas de novo. Retorna o nº de linhas marcadas.
+    """
+    _garantir_tabelas()
+    return executar_escrita(_reavaliar_precos)
+
+def _reavaliar_precos(conn: sqlite3.Connection) -> int:
+    bases = _bases_do_historico(conn)
+    for base in bases:
+        conn.execute(f"UPDATE {base}.itens_orcamento SET preco_atipico = ? WHERE preco_atipico = ?", (PRECO_NORMAL, PRECO_ATIPICO))
+    _incrementar_versao(conn, "itens_orcamento")
+    _atualizar_resumo_precos(conn)
+    df = pd.read_sql_query(f"""
+        SELECT io.id, io.valor_unitario, r.mediana_log, r.mad_log, r.amostras
+        FROM {_fonte_historico(conn)} io
+        JOIN mapa_itens m ON io.descricao = m.descricao_original
+        JOIN resumo_precos_item r ON r.item_padrao = m.item_padrao
+        WHERE io.preco_atipico IS NOT ?
+    """, conn, params=(PRECO_CONFIRMADO,))
+    atipicos = estatistica_precos.marcar_atipicos(df['valor_unitario'], df['mediana_log'], df['mad_log'], df['amostras'])
+    ids = df.loc[atipicos, 'id'].tolist()
+    for base in bases:
+        conn.executemany(f"UPDATE {base}.itens_orcamento SET preco_atipico = ? WHERE id = ?", [(PRECO_ATIPICO, i) for i in ids])
+    _incrementar_versao(conn, "itens_orcamento")
+    return len(ids)
+
+def consultar_precos_atipicos() -> pd.DataFrame:
+    """Linhas marcadas para revisão (inclusive as arquivadas), com a mediana do item e a razão preço/mediana."""
+    _garantir_tabelas()
+    conn, historico = _conectar_historico(completo=True)
+    df = pd.read_sql_query(f"""
+        SELECT io.id, m.item_padrao, io.descricao, io.nome_obra, io.nome_cliente, io.arquivo_original,
+               io.unidade, io.quantidade, io.valor_unitario, r.mediana, r.amostras
+        FROM {historico} io
+        LEFT JOIN mapa_itens m ON io.descricao = m.descricao_original
+        LEFT JOIN resumo_precos_item r ON r.item_padrao = m.item_padrao
+        WHERE io.preco_atipico = ?
+        ORDER BY m.item_padrao, io.nome_obra
+    """, conn, params=(PRECO_ATIPICO,))
     conn.close()
-    return itens_adicionados
+    df['razao'] = df['valor_unitario'] / df['mediana']
+    return df
 
-def consultar_itens_com_mapeamento() -> pd.DataFrame:
+def revisar_precos_atipicos(confirmar: list = (), excluir: list = ()) -> int:
+    """Confirma (mantém nas médias) ou exclui do histórico as linhas revisadas, pelos ids."""
+    if not confirmar and not excluir:
+        return 0
+    _garantir_tabelas()
+    return executar_escrita(_revisar_precos, confirmar, excluir)
+
+def _revisar_precos(conn: sqlite3.Connection, confirmar: list, excluir: list) -> int:
+    resumo_precos_em_dia = _resumo_precos_em_dia(conn)
+    derivadas_em_dia = _derivadas_em_dia(conn)
+    ids = [int(i) for i in (*confirmar, *excluir)]
+    descricoes_e_obras = _consultar_em_blocos(conn, f"SELECT descricao, nome_obra FROM {_fonte_historico(conn)} WHERE id IN ({{}})", ids)
+    # Os ids não se repetem entre a base quente e o arquivo: cada linha muda em uma só.
+    for base in _bases_do_historico(conn):
+        conn.executemany(f"UPDATE {base}.itens_orcamento SET preco_atipico = ? WHERE id = ?", [(PRECO_CONFIRMADO, int(i)) for i in confirmar])
+        conn.executemany(f"DELETE FROM {base}.itens_orcamento WHERE id = ?", [(int(i),) for i in excluir])
+    _incrementar_versao(conn, "itens_orcamento")
+    _atualizar_derivadas_das_obras(conn, [obra for _, obra in descricoes_e_obras], derivadas_em_dia)
+    _atualizar_resumo_precos_dos_itens(conn, _itens_das_descricoes(conn, [d for d, _ in descricoes_e_obras]), resumo_precos_em_dia)
+    return len(confirmar) + len(excluir)
+
+def consultar_importacao_por_hash(hash_arquivo: str) -> dict | None:
+    """Retorna obra, arquivo e data da importação de um arquivo já importado (pelo SHA-256), ou None."""
+    _garantir_tabelas()
+    if not hash_arquivo: return None
+    try:
+        # Inclui as obras arquivadas: um arquivo já importado não deve voltar só porque a obra foi arquivada.
+        conn, historico = _conectar_historico(completo=True)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT nome_obra, nome_cliente, arquivo_original, MIN(importado_em) AS importado_em, COUNT(*) AS num_itens
+            FROM {historico} WHERE hash_arquivo = ?
+            GROUP BY nome_obra, nome_cliente, arquivo_original
+        """, (hash_arquivo,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+    except Exception as e:
+        print(f"Erro ao consultar importação por hash: {e}")
+        return None
+
+def consultar_hashes_importados() -> set:
+    """Hashes SHA-256 dos arquivos de orçamento já importados."""
+    _garantir_tabelas()
+    try:
+        conn, historico = _conectar_historico(completo=True)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT DISTINCT hash_arquivo FROM {historico} WHERE hash_arquivo IS NOT NULL")
+        hashes = {row[0] for row in cursor.fetchall()}
+        conn.close()
+        return hashes
+    except Exception as e:
+        print(f"Erro ao consultar hashes de arquivos importados: {e}")
+        return set()
+
+# Colunas de texto do histórico que se repetem muito (poucas obras, clientes, unidades...).
+COLUNAS_CATEGORICAS_HISTORICO = ['nome_obra', 'nome_cliente', 'unidade', 'arquivo_original', 'hash_arquivo', 'item_padrao']
+
+def _reduzir_numericos(df: pd.DataFrame) -> None:
+    """Inteiros vão para o menor tipo que os comporta; floats só viram float32 se nenhum valor mudar."""
+    for col in df.select_dtypes(include='number').columns:
+        serie = df[col]
+        if pd.api.types.is_integer_dtype(serie):
+            df[col] = pd.to_numeric(serie, downcast='integer')
+        else:
+            reduzida = serie.astype('float32')
+            if reduzida.astype(serie.dtype).equals(serie):
+                df[col] = reduzida
+
+def compactar_historico(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Representação compacta do histórico: categorias para o texto repetitivo, números
+    reduzidos sem perda e 'importado_em' como datetime. Funciona também com frames
+    lidos com dtype_backend="pyarrow" (os tipos Arrow são mantidos).
+    """
+    for col in COLUNAS_CATEGORICAS_HISTORICO:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    if 'importado_em' in df.columns:
+        datas = pd.to_datetime(df['importado_em'].astype(object), format='ISO8601', errors='coerce')
+        df['importado_em'] = datas.astype('timestamp[us][pyarrow]') if isinstance(df['importado_em'].dtype, pd.ArrowDtype) else datas
+    if not any(isinstance(t, pd.ArrowDtype) for t in df.dtypes):
+        _reduzir_numericos(df)
+    return df
+
+def consultar_itens_com_mapeamento(compacto: bool = True, dtype_backend: str = None, historico_completo: bool = False) -> pd.DataFrame:
+    """
+    Histórico de itens com o item padrão mapeado (com historico_completo=True, inclui
+    as obras arquivadas). Por padrão o resultado vem compactado (ver compactar_historico),
+    o que reduz bastante a memória do frame guardado pelo st.cache_data.
+    dtype_backend="pyarrow" devolve colunas Arrow.
+    """
     _garantir_tabelas()
     if not DB_PATH.exists(): return pd.DataFrame()
     try:
-        conn = sqlite3.connect(DB_PATH)
-        query = "SELECT i.*, m.item_padrao FROM itens_orcamento AS i LEFT JOIN mapa_itens AS m ON i.descricao = m.descricao_original"
-        df = pd.read_sql_query(query, conn)
+        conn, historico = _conectar_historico(historico_completo)
+        query = f"SELECT i.*, m.item_padrao FROM {historico} AS i LEFT JOIN mapa_itens AS m ON i.descricao = m.descricao_original"
+        if dtype_backend:
+            df = pd.read_sql_query(query, conn, dtype_backend=dtype_backend)
+        else:
+            df = pd.read_sql_query(query, conn)
         conn.close()
-        return df
+        return compactar_historico(df) if compacto else df
     except Exception as e:
         print(f"Erro ao consultar itens com mapeamento: {e}")
         return pd.DataFrame()
 
 def salvar_mapeamento(descricao_original: str, item_padrao: str, grupo: str = None, peso_item: float = None):
     _garantir_tabelas()
-    conn = sqlite3.connect(DB_PATH)
+    executar_escrita(_salvar_mapeamento, descricao_original, item_padrao, grupo, peso_item)
+
+def _salvar_mapeamento(conn: sqlite3.Connection, descricao_original: str, item_padrao: str, grupo: str, peso_item: float) -> None:
     cursor = conn.cursor()
+    derivadas_em_dia = _derivadas_em_dia(conn)
+    resumo_precos_em_dia = _resumo_precos_em_dia(conn)
+    itens_anteriores = _itens_das_descricoes(conn, [descricao_original])
     id_grupo = None
     if grupo:
         # CORREÇÃO: Passando a conexão existente
@@ -288,14 +792,60 @@ def salvar_mapeamento(descricao_original: str, item_padrao: str, grupo: str = No
         cursor.execute("""
             UPDATE mapa_itens SET peso_item = ? WHERE item_padrao = ?
         """, (peso_item, item_padrao))
-    conn.commit()
-    conn.close()
+    _incrementar_versao(conn, "mapa_itens", "grupos_servico")
+    _atualizar_derivadas_das_obras(conn, _obras_afetadas_por_mapeamento(conn, [descricao_original], [descricao_original]), derivadas_em_dia)
+    # A descrição sai do item anterior e entra no novo: os dois mudam no resumo de preços.
+    _atualizar_resumo_precos_dos_itens(conn, [*itens_anteriores, *_itens_das_descricoes(conn, [descricao_original])], resumo_precos_em_dia)
+
+def salvar_mapeamentos_em_lote(mapeamentos: dict) -> int:
+    """
+    Grava vários mapeamentos {descricao_original: item_padrao} em uma única transação.
+    Descrições já mapeadas têm o item padrão atualizado, preservando grupo e peso.
+    """
+    if not mapeamentos:
+        return 0
+    _garantir_tabelas()
+    return executar_escrita(_salvar_mapeamentos_em_lote, mapeamentos)
+
+def _salvar_mapeamentos_em_lote(conn: sqlite3.Connection, mapeamentos: dict) -> int:
+    derivadas_em_dia = _derivadas_em_dia(conn)
+    resumo_precos_em_dia = _resumo_precos_em_dia(conn)
+    itens_anteriores = _itens_das_descricoes(conn, list(mapeamentos))
+    conn.executemany("""
+        INSERT INTO mapa_itens (descricao_original, item_padrao)
+        VALUES (?, ?)
+        ON CONFLICT(descricao_original) DO UPDATE SET item_padrao=excluded.item_padrao
+    """, list(mapeamentos.items()))
+    _incrementar_versao(conn, "mapa_itens")
+    _atualizar_derivadas_das_obras(conn, _obras_afetadas_por_mapeamento(conn, list(mapeamentos)), derivadas_em_dia)
+    _atualizar_resumo_precos_dos_itens(conn, [*itens_anteriores, *mapeamentos.values()], resumo_precos_em_dia)
+    return len(mapeamentos)
+
+def consultar_descricoes_sem_mapeamento() -> pd.DataFrame:
+    """Descrições distintas do histórico sem item padrão, com o nº de ocorrências de cada uma."""
+    _garantir_tabelas()
+    if not DB_PATH.exists(): return pd.DataFrame(columns=['descricao', 'ocorrencias'])
+    try:
+        conn = _conectar()
+        query = """
+            SELECT i.descricao, COUNT(*) AS ocorrencias
+            FROM itens_orcamento AS i
+            LEFT JOIN mapa_itens AS m ON i.descricao = m.descricao_original
+            WHERE m.item_padrao IS NULL AND i.descricao IS NOT NULL AND TRIM(i.descricao) != ''
+            GROUP BY i.descricao
+        """
+        df = pd.read_sql_query(query, conn)
+        conn.close()
+        return df
+    except Exception as e:
+        print(f"Erro ao consultar descrições sem mapeamento: {e}")
+        return pd.DataFrame(columns=['descricao', 'ocorrencias'])
 
 def consultar_itens_padrao() -> list:
     _garantir_tabelas()
     if not DB_PATH.exists(): return []
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _conectar()
         cursor = conn.cursor()
         cursor.execute("SELECT DISTINCT item_padrao FROM mapa_itens WHERE item_padrao IS NOT NULL ORDER BY item_padrao")
         itens = [item[0] for item in cursor.fetchall()]
@@ -309,7 +859,7 @@ def consultar_descricoes_mapeadas() -> list:
     _garantir_tabelas()
     if not DB_PATH.exists(): return []
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _conectar()
         cursor = conn.cursor()
         cursor.execute("SELECT DISTINCT descricao_original FROM mapa_itens")
         descricoes = [item[0] for item in cursor.fetchall()]
@@ -319,19 +869,19 @@ def consultar_descricoes_mapeadas() -> list:
         print(f"Erro ao consultar descrições mapeadas: {e}")
         return []
 
+def _inserir_observacao(conn: sqlite3.Connection, nome_obra: str, texto_observacao: str) -> None:
+    conn.execute(
+        "INSERT INTO observacoes_obra (nome_obra, texto_observacao, data_criacao) VALUES (?, ?, ?)",
+        (nome_obra, texto_observacao, datetime.now())
+    )
+    _incrementar_versao(conn, "observacoes_obra")
+
 def salvar_observacao(nome_obra: str, texto_observacao: str) -> None:
     _garantir_tabelas()
     if not texto_observacao or not texto_observacao.strip():
         return
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO observacoes_obra (nome_obra, texto_observacao, data_criacao) VALUES (?, ?, ?)",
-            (nome_obra, texto_observacao, datetime.now())
-        )
-        conn.commit()
-        conn.close()
+        executar_escrita(_inserir_observacao, nome_obra, texto_observacao)
     except Exception as e:
         print(f"Erro ao salvar observação: {e}")
 
@@ -339,7 +889,7 @@ def consultar_observacoes_por_obra(nome_obra: str) -> list:
     _garantir_tabelas()
     if not nome_obra: return []
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _conectar()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM observacoes_obra WHERE nome_obra = ? ORDER BY data_criacao DESC", (nome_obra,))
@@ -350,26 +900,65 @@ def consultar_observacoes_por_obra(nome_obra: str) -> list:
         print(f"Erro ao consultar observações: {e}")
         return []
 
-def atualizar_observacao(id_observacao: int, novo_texto: str) -> None:
+def consultar_observacoes_agrupadas(filtro: str = "", limit: int = 20, offset: int = 0) -> tuple[list, int]:
+    """
+    Retorna uma página de obras (filtradas pelo nome no próprio SQL) já com suas
+    observações, em uma única consulta. Resultado: (lista de obras, total de obras no filtro),
+    onde cada obra é {'nome_obra': ..., 'observacoes': [dicts de observacoes_obra]}.
+    Inclui as obras arquivadas.
+    """
     _garantir_tabelas()
+    padrao = "%" + (filtro or "").strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    query = """
+    WITH obras AS (
+        SELECT nome_obra, COUNT(*) OVER () AS total_obras
+        FROM {obras} WHERE nome_obra LIKE ? ESCAPE '\\'
+        ORDER BY nome_obra
+        LIMIT ? OFFSET ?
+    )
+    SELECT o.nome_obra, o.total_obras, ob.id_observacao, ob.texto_observacao, ob.data_criacao
+    FROM obras AS o
+    LEFT JOIN observacoes_obra AS ob ON ob.nome_obra = o.nome_obra
+    ORDER BY o.nome_obra, ob.data_criacao DESC
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn, _ = _conectar_historico(True)
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE observacoes_obra SET texto_observacao = ? WHERE id_observacao = ?",
-            (novo_texto, id_observacao)
-        )
-        conn.commit()
+        cursor.execute(query.format(obras=_obras_do_historico(conn)), (padrao, limit, offset))
+        obras, total = {}, 0
+        for row in cursor.fetchall():
+            total = row['total_obras']
+            obra = obras.setdefault(row['nome_obra'], {'nome_obra': row['nome_obra'], 'observacoes': []})
+            if row['id_observacao'] is not None:
+                obra['observacoes'].append({
+                    'id_observacao': row['id_observacao'], 'nome_obra': row['nome_obra'],
+                    'texto_observacao': row['texto_observacao'], 'data_criacao': row['data_criacao']
+                })
         conn.close()
+        return list(obras.values()), total
+    except Exception as e:
+        print(f"Erro ao consultar observações agrupadas: {e}")
+        return [], 0
+
+def atualizar_observacao(id_observacao: int, novo_texto: str) -> None:
+    _garantir_tabelas()
+    try:
+        executar_escrita(_atualizar_observacao, id_observacao, novo_texto)
     except Exception as e:
         print(f"Erro ao atualizar observação: {e}")
 
+def _atualizar_observacao(conn: sqlite3.Connection, id_observacao: int, novo_texto: str) -> None:
+    conn.execute("UPDATE observacoes_obra SET texto_observacao = ? WHERE id_observacao = ?", (novo_texto, id_observacao))
+    _incrementar_versao(conn, "observacoes_obra")
+
 def consultar_nomes_de_obras_unicas() -> list:
+    """Nomes de todas as obras, inclusive as arquivadas."""
     _garantir_tabelas()
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn, _ = _conectar_historico(True)
         cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT nome_obra FROM itens_orcamento ORDER BY nome_obra")
+        cursor.execute(f"SELECT nome_obra FROM {_obras_do_historico(conn)} ORDER BY nome_obra")
         obras = [row[0] for row in cursor.fetchall()]
         conn.close()
         return obras
@@ -407,59 +996,241 @@ def adicionar_grupo(conn: sqlite3.Connection, nome_grupo: str) -> int:
     resultado = cursor.fetchone()
     return resultado[0] if resultado else None
 
+# --- Custos no Tempo -------------------------------------------------------- #
+# Cada carga da base de custos abre uma nova versão para os itens cujo custo mudou em
+# historico_custos (valido_de/valido_ate; valido_ate NULL = versão vigente) e fecha a
+# anterior; base_custos continua com a versão vigente de cada item. A primeira versão
+# de um item vale desde sempre (valido_de NULL): antes do histórico a base só guardava
+# o custo atual, que é a melhor estimativa para as vendas anteriores a ele. Limpar a
+# base fecha as versões vigentes em vez de apagá-las. As margens custeiam cada linha
+# vendida pela versão vigente na data da importação (importado_em).
+COLUNAS_VERSAO_CUSTO = (
+    "item_padrao_nome", "unidade_de_medida", "custo_material", "custo_mao_de_obra",
+    "homem_hora_profissional", "homem_hora_ajudante", "codigo_composicao", "numero_manual",
+)
+# Condição de vigência da versão 'b' na data {data} (texto ISO; NULL = agora). A data
+# "máxima" tem de ser um texto que não pareça número: as colunas TIMESTAMP têm afinidade
+# NUMERIC e converteriam '9999' em inteiro, menor que qualquer texto.
+_SQL_CUSTO_VIGENTE = """
+    (b.valido_de IS NULL OR b.valido_de <= COALESCE({data}, '9999-12-31'))
+    AND (b.valido_ate IS NULL OR COALESCE({data}, '9999-12-31') < b.valido_ate)
+"""
+
+def _instante(data) -> str | None:
+    # Mesmo formato de importado_em (datetime gravado pelo sqlite3): compara por ordem alfabética.
+    return None if data is None else pd.Timestamp(data).isoformat(sep=" ")
+
+def _versionar_custo(conn: sqlite3.Connection, dados_custo: dict, agora: str) -> None:
+    """Abre uma versão nova para o item se o custo mudou, fechando a vigente."""
+    valores = [dados_custo[coluna] for coluna in COLUNAS_VERSAO_CUSTO]
+    vigente = conn.execute("SELECT id_versao, valido_de FROM historico_custos WHERE item_padrao_nome = ? AND valido_ate IS NULL",
+                           valores[:1]).fetchone()
+    # Comparação feita pelo SQLite, onde NaN e None já viraram NULL.
+    if vigente and conn.execute("SELECT " + " AND ".join(f"? IS {c}" for c in COLUNAS_VERSAO_CUSTO[1:])
+                                + " FROM historico_custos WHERE id_versao = ?", (*valores[1:], vigente[0])).fetchone()[0]:
+        return
+    if vigente and vigente[1] == agora:
+        # Item repetido na mesma carga: a última linha vale, como no INSERT OR REPLACE da base.
+        conn.execute("UPDATE historico_custos SET " + ", ".join(f"{c} = ?" for c in COLUNAS_VERSAO_CUSTO[1:])
+                     + " WHERE id_versao = ?", (*valores[1:], vigente[0]))
+        return
+    if vigente:
+        conn.execute("UPDATE historico_custos SET valido_ate = ? WHERE id_versao = ?", (agora, vigente[0]))
+    primeira = conn.execute("SELECT 1 FROM historico_custos WHERE item_padrao_nome = ?", valores[:1]).fetchone() is None
+    conn.execute(f"""
+        INSERT INTO historico_custos ({", ".join(COLUNAS_VERSAO_CUSTO)}, valido_de, registrado_em)
+        VALUES ({", ".join("?" * len(COLUNAS_VERSAO_CUSTO))}, ?, ?)
+    """, (*valores, None if primeira else agora, agora))
+
+def custos_em(itens: list, data=None) -> pd.DataFrame:
+    """
+    Versão do custo de cada item vigente em 'data' (data, datetime ou texto; None =
+    agora), em uma consulta indexada por item e vigência. Itens sem custo vigente
+    nessa data ficam de fora.
+    """
+    _garantir_tabelas()
+    colunas = ["id_versao", *COLUNAS_VERSAO_CUSTO, "valido_de", "valido_ate"]
+    itens = list(dict.fromkeys(itens))
+    conn = _conectar()
+    linhas = []
+    for inicio in range(0, len(itens), TAMANHO_BLOCO_SQL):
+        bloco = itens[inicio:inicio + TAMANHO_BLOCO_SQL]
+        linhas.extend(conn.execute(f"""
+            SELECT {", ".join(colunas)} FROM historico_custos b
+            WHERE b.item_padrao_nome IN ({", ".join("?" * len(bloco))}) AND {_SQL_CUSTO_VIGENTE.format(data="?")}
+        """, (*bloco, _instante(data), _instante(data))).fetchall())
+    conn.close()
+    return pd.DataFrame(linhas, columns=colunas)
+
+def custo_em(item_padrao_nome: str, data=None) -> dict | None:
+    """Versão do custo do item vigente em 'data' (None = agora), ou None se não havia custo."""
+    df = custos_em([item_padrao_nome], data)
+    return None if df.empty else df.iloc[0].to_dict()
+
+# --- Importação Incremental da Base de Custos ------------------------------- #
+# Cada item gravado guarda em base_custos.hash_linha o hash da linha da planilha de que
+# veio (custos, unidade, códigos, peso e grupo). Na reimportação, os hashes da planilha
+# são comparados com os gravados em uma consulta e só os itens novos ou alterados são
+# regravados; os itens ausentes da planilha podem ser removidos à parte. Mapeamentos
+# manuais de descrições nunca são apagados. Itens gravados antes do hash têm o hash
+# calculado a partir dos valores gravados.
+CAMPOS_HASH_CUSTO = (*COLUNAS_VERSAO_CUSTO[1:], "peso_item", "grupo")
+
+def _valor_canonico(valor) -> str:
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ""
+    if isinstance(valor, (int, float, np.number)) and not isinstance(valor, bool):
+        return repr(float(valor))
+    return str(valor).strip()
+
+def _hashes_linhas_custo(df: pd.DataFrame) -> pd.Series:
+    """Hash de cada linha (colunas de CAMPOS_HASH_CUSTO; as que faltam contam como vazias)."""
+    colunas = [df[c] if c in df.columns else pd.Series(None, index=df.index, dtype=object) for c in CAMPOS_HASH_CUSTO]
+    return pd.Series([hashlib.sha256("\x1f".join(map(_valor_canonico, valores)).encode("utf-8")).hexdigest()
+                      for valores in zip(*colunas)], index=df.index, dtype=object)
+
+def _com_grupo(df_custos: pd.DataFrame, mapeamento_grupos: dict) -> pd.DataFrame:
+    # O grupo que conta é o escolhido no mapeamento (o da planilha pode ter sido corrigido).
+    return df_custos.assign(grupo=df_custos['item_padrao_nome'].map(lambda item: mapeamento_grupos.get(item)))
+
+def _hashes_gravados(conn: sqlite3.Connection, itens: list = None) -> dict:
+    """{item: hash da linha gravada} de todos os itens da base, ou só de 'itens'."""
+    sql = """
+        SELECT b.item_padrao_nome, b.hash_linha, {colunas}, m.peso_item, g.nome_grupo AS grupo
+        FROM base_custos b
+        LEFT JOIN mapa_itens m ON m.descricao_original = b.item_padrao_nome
+        LEFT JOIN grupos_servico g ON g.id_grupo = m.id_grupo
+    """.replace("{colunas}", ", ".join(f"b.{c}" for c in COLUNAS_VERSAO_CUSTO[1:]))
+    colunas = ["item_padrao_nome", "hash_linha", *CAMPOS_HASH_CUSTO]
+    if itens is None:
+        linhas = conn.execute(sql).fetchall()
+    else:
+        linhas = _consultar_em_blocos(conn, sql + " WHERE b.item_padrao_nome IN ({})", list(set(itens)))
+    df = pd.DataFrame(linhas, columns=colunas)
+    sem_hash = df['hash_linha'].isna()
+    if sem_hash.any():
+        df.loc[sem_hash, 'hash_linha'] = _hashes_linhas_custo(df[sem_hash])
+    return dict(zip(df['item_padrao_nome'], df['hash_linha']))
+
+def _classificar_linhas_custo(df: pd.DataFrame, gravados: dict) -> pd.Series:
+    """'novo', 'alterado' ou 'inalterado' para cada linha (com a coluna hash_linha)."""
+    anteriores = df['item_padrao_nome'].map(gravados)
+    return pd.Series(np.select([anteriores.isna(), anteriores != df['hash_linha']], ["novo", "alterado"], "inalterado"),
+                     index=df.index)
+
+def comparar_base_custos(df_custos: pd.DataFrame, mapeamento_grupos: dict) -> dict:
+    """
+    Prévia da reimportação da planilha: listas de itens 'novos', 'alterados',
+    'inalterados' e 'ausentes' (gravados na base e fora da planilha). Não grava nada.
+    """
+    _garantir_tabelas()
+    df = _com_grupo(df_custos, mapeamento_grupos).drop_duplicates('item_padrao_nome', keep='last')
+    df['hash_linha'] = _hashes_linhas_custo(df)
+    conn = _conectar()
+    gravados = _hashes_gravados(conn)
+    conn.close()
+    situacao = _classificar_linhas_custo(df, gravados)
+    resumo = {chave: df.loc[situacao == valor, 'item_padrao_nome'].tolist()
+              for chave, valor in (("novos", "novo"), ("alterados", "alterado"), ("inalterados", "inalterado"))}
+    resumo["ausentes"] = sorted(set(gravados) - set(df['item_padrao_nome']))
+    return resumo
+
+def salvar_custos_incremental(df_custos: pd.DataFrame, mapeamento_grupos: dict) -> dict:
+    """
+    Grava só os itens novos ou alterados da planilha (comparados na própria transação
+    de escrita). Retorna {'novos': n, 'alterados': n, 'inalterados': n}.
+    """
+    _garantir_tabelas()
+    return executar_escrita(_salvar_custos_incremental, df_custos, mapeamento_grupos)
+
+def _salvar_custos_incremental(conn: sqlite3.Connection, df_custos: pd.DataFrame, mapeamento_grupos: dict) -> dict:
+    df = _com_grupo(df_custos, mapeamento_grupos)
+    df['hash_linha'] = _hashes_linhas_custo(df)
+    # Item repetido na planilha: vale a última linha, como na gravação completa.
+    ultimas = df.drop_duplicates('item_padrao_nome', keep='last')
+    situacao = _classificar_linhas_custo(ultimas, _hashes_gravados(conn, ultimas['item_padrao_nome'].tolist()))
+    mudaram = ultimas[situacao != "inalterado"]
+    if not mudaram.empty:
+        _salvar_custo_em_lote(conn, mudaram.drop(columns=['grupo', 'hash_linha']), mapeamento_grupos, False)
+    return {"novos": int((situacao == "novo").sum()), "alterados": int((situacao == "alterado").sum()),
+            "inalterados": int((situacao == "inalterado").sum())}
+
+def remover_custos(itens: list) -> int:
+    """
+    Tira os itens da base de custos (a versão vigente é fechada no histórico, que
+    continua custeando as vendas passadas). Mapeamentos são mantidos. Retorna o nº removido.
+    """
+    _garantir_tabelas()
+    return executar_escrita(_remover_custos, list(itens))
+
+def _remover_custos(conn: sqlite3.Connection, itens: list) -> int:
+    agora = _instante(datetime.now())
+    removidos = 0
+    for inicio in range(0, len(itens), TAMANHO_BLOCO_SQL):
+        bloco = itens[inicio:inicio + TAMANHO_BLOCO_SQL]
+        marcadores = ", ".join("?" * len(bloco))
+        removidos += conn.execute(f"DELETE FROM base_custos WHERE item_padrao_nome IN ({marcadores})", bloco).rowcount
+        conn.execute(f"UPDATE historico_custos SET valido_ate = ? WHERE valido_ate IS NULL AND item_padrao_nome IN ({marcadores})",
+                     (agora, *bloco))
+    if removidos:
+        _incrementar_versao(conn, "base_custos", "historico_custos")
+    return removidos
+
 def salvar_custo_em_lote(df_custos: pd.DataFrame, mapeamento_grupos: dict, limpar_base_existente: bool = False):
     _garantir_tabelas()
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        cursor = conn.cursor()
-        if limpar_base_existente:
-            cursor.execute("DELETE FROM base_custos")
-            cursor.execute("DELETE FROM mapa_itens") # Também limpa os mapeamentos associados
-
-        for _, row in df_custos.iterrows():
-            item_padrao = row['item_padrao_nome']
-            
-            dados_custo = {
-                "item_padrao_nome": item_padrao, "unidade_de_medida": row.get('unidade_de_medida'),
-                "custo_material": row.get('custo_material'), "custo_mao_de_obra": row.get('custo_mao_de_obra'),
-                "homem_hora_profissional": row.get('homem_hora_profissional'), "homem_hora_ajudante": row.get('homem_hora_ajudante'),
-                "data_referencia": datetime.now(), "codigo_composicao": row.get('codigo_composicao'),
-                "numero_manual": row.get('numero_manual')
-            }
-            cursor.execute("""
-                INSERT OR REPLACE INTO base_custos (
-                    item_padrao_nome, unidade_de_medida, custo_material, custo_mao_de_obra, 
-                    homem_hora_profissional, homem_hora_ajudante, data_referencia,
-                    codigo_composicao, numero_manual
-                ) VALUES (
-                    :item_padrao_nome, :unidade_de_medida, :custo_material, :custo_mao_de_obra, 
-                    :homem_hora_profissional, :homem_hora_ajudante, :data_referencia,
-                    :codigo_composicao, :numero_manual
-                )
-            """, dados_custo)
-
-            grupo_nome = mapeamento_grupos.get(item_padrao)
-            # CORREÇÃO 2: Passando a conexão 'conn' para a função adicionar_grupo.
-            id_grupo = adicionar_grupo(conn, grupo_nome) if grupo_nome else None
-            
-            peso_item = row.get('peso_item')
-
-            # Garante que o item_padrao seja mapeado para si mesmo na tabela de mapas
-            cursor.execute("""
-                INSERT OR REPLACE INTO mapa_itens (descricao_original, item_padrao, id_grupo, peso_item)
-                VALUES (?, ?, ?, ?)
-            """, (item_padrao, item_padrao, id_grupo, peso_item))
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e # Relança a exceção para ser tratada pela interface do Streamlit
-    finally:
-        conn.close()
+    # Erros são relançados para serem tratados pela interface do Streamlit; a fila desfaz o lote inteiro.
+    executar_escrita(_salvar_custo_em_lote, df_custos, mapeamento_grupos, limpar_base_existente)
+
+def _salvar_custo_em_lote(conn: sqlite3.Connection, df_custos: pd.DataFrame, mapeamento_grupos: dict, limpar_base_existente: bool) -> None:
+    cursor = conn.cursor()
+    agora = _instante(datetime.now())
+    if limpar_base_existente:
+        cursor.execute("DELETE FROM base_custos")
+        cursor.execute("DELETE FROM mapa_itens") # Também limpa os mapeamentos associados
+        # O histórico fica: os custos deixam de valer daqui em diante, mas continuam custeando as vendas passadas.
+        cursor.execute("UPDATE historico_custos SET valido_ate = ? WHERE valido_ate IS NULL", (agora,))
+
+    hashes = _hashes_linhas_custo(_com_grupo(df_custos, mapeamento_grupos))
+    for hash_linha, (_, row) in zip(hashes, df_custos.iterrows()):
+        item_padrao = row['item_padrao_nome']
+        
+        dados_custo = {
+            "item_padrao_nome": item_padrao, "unidade_de_medida": row.get('unidade_de_medida'),
+            "custo_material": row.get('custo_material'), "custo_mao_de_obra": row.get('custo_mao_de_obra'),
+            "homem_hora_profissional": row.get('homem_hora_profissional'), "homem_hora_ajudante": row.get('homem_hora_ajudante'),
+            "data_referencia": agora, "codigo_composicao": row.get('codigo_composicao'),
+            "numero_manual": row.get('numero_manual'), "hash_linha": hash_linha
+        }
+        cursor.execute("""
+            INSERT OR REPLACE INTO base_custos (
+                item_padrao_nome, unidade_de_medida, custo_material, custo_mao_de_obra, 
+                homem_hora_profissional, homem_hora_ajudante, data_referencia,
+                codigo_composicao, numero_manual, hash_linha
+            ) VALUES (
+                :item_padrao_nome, :unidade_de_medida, :custo_material, :custo_mao_de_obra, 
+                :homem_hora_profissional, :homem_hora_ajudante, :data_referencia,
+                :codigo_composicao, :numero_manual, :hash_linha
+            )
+        """, dados_custo)
+        _versionar_custo(conn, dados_custo, agora)
+
+        grupo_nome = mapeamento_grupos.get(item_padrao)
+        # CORREÇÃO 2: Passando a conexão 'conn' para a função adicionar_grupo.
+        id_grupo = adicionar_grupo(conn, grupo_nome) if grupo_nome else None
+        
+        peso_item = row.get('peso_item')
+
+        # Garante que o item_padrao seja mapeado para si mesmo na tabela de mapas
+        cursor.execute("""
+            INSERT OR REPLACE INTO mapa_itens (descricao_original, item_padrao, id_grupo, peso_item)
+            VALUES (?, ?, ?, ?)
+        """, (item_padrao, item_padrao, id_grupo, peso_item))
+
+    _incrementar_versao(conn, "base_custos", "historico_custos", "mapa_itens", "grupos_servico")
 
 def consultar_custo_por_item(item_padrao_nome: str) -> dict | None:
     _garantir_tabelas()
-    conn = sqlite3.connect(DB_PATH)
+    conn = _conectar()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM base_custos WHERE item_padrao_nome = ? ORDER BY data_referencia DESC LIMIT 1", (item_padrao_nome,))
@@ -471,7 +1242,7 @@ def consultar_itens_de_custo() -> list:
     _garantir_tabelas()
     if not DB_PATH.exists(): return []
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _conectar()
         cursor = conn.cursor()
         cursor.execute("SELECT DISTINCT item_padrao_nome FROM base_custos ORDER BY item_padrao_nome")
         itens = [item[0] for item in cursor.fetchall()]
@@ -493,27 +1264,24 @@ def consultar_itens_por_grupo() -> dict:
     ORDER BY g.nome_grupo, b.item_padrao_nome
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = _conectar()
         df = pd.read_sql_query(query, conn)
         conn.close()
-        
-        itens_por_grupo = {}
-        for _, row in df.iterrows():
-            grupo = row['nome_grupo'] if pd.notna(row['nome_grupo']) else "Sem Grupo"
-            item = row['item_padrao_nome']
-            if grupo not in itens_por_grupo:
-                itens_por_grupo[grupo] = []
-            itens_por_grupo[grupo].append(item)
-            
-        return itens_por_grupo
+        # A ordem do SQL é mantida: grupos na ordem em que aparecem, itens em ordem dentro de cada grupo.
+        df['nome_grupo'] = df['nome_grupo'].fillna("Sem Grupo")
+        return {grupo: itens.tolist() for grupo, itens in df.groupby('nome_grupo', sort=False)['item_padrao_nome']}
     except Exception as e:
         print(f"Erro ao consultar itens por grupo: {e}")
         return {}
 
 def salvar_orcamento_gerado(df_orcamento: pd.DataFrame, nome_obra: str, nome_cliente: str, observacao: str) -> int:
     _garantir_tabelas()
-    conn = sqlite3.connect(DB_PATH)
+    return executar_escrita(_salvar_orcamento_gerado, df_orcamento, nome_obra, nome_cliente, observacao)
+
+def _salvar_orcamento_gerado(conn: sqlite3.Connection, df_orcamento: pd.DataFrame, nome_obra: str, nome_cliente: str, observacao: str) -> int:
     cursor = conn.cursor()
+    derivadas_em_dia = _derivadas_em_dia(conn)
+    resumo_precos_em_dia = _resumo_precos_em_dia(conn)
     itens_adicionados = 0
     
     nome_arquivo_original = f"Gerado_pelo_SIO_{nome_obra}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -529,24 +1297,472 @@ def salvar_orcamento_gerado(df_orcamento: pd.DataFrame, nome_obra: str, nome_cli
         ))
         itens_adicionados += 1
     
-    conn.commit()
-    conn.close()
+    _incrementar_versao(conn, "itens_orcamento")
+    _atualizar_derivadas_das_obras(conn, [nome_obra], derivadas_em_dia)
+    _atualizar_resumo_precos_dos_itens(conn, _itens_das_descricoes(conn, df_orcamento["descricao"].tolist()), resumo_precos_em_dia)
     
     if observacao and observacao.strip():
         salvar_observacao(nome_obra, observacao)
         
     return itens_adicionados
 
-def consultar_dados_rentabilidade() -> pd.DataFrame:
+# --- Preços no Tempo -------------------------------------------------------- #
+# Preços "atuais" (mediana dos últimos 6 e 12 meses de cada item, nominal e corrigida
+# pelo índice de preços) ficam materializados e só são recalculados, para todos os
+# itens de uma vez, quando o histórico, os mapeamentos ou o índice mudam. Como as
+# demais estatísticas de venda, existem sobre o histórico completo (precos_atuais) e
+# só sobre a base quente (precos_atuais_base_quente); esta fica desatualizada a cada
+# arquivamento, que tira linhas dela.
+_RE_MES = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def consultar_indice_precos() -> pd.DataFrame:
+    """Índice de preços mensal (ex.: INCC) cadastrado localmente: colunas 'mes' (AAAA-MM) e 'valor'."""
+    _garantir_tabelas()
+    conn = _conectar()
+    df = pd.read_sql_query("SELECT mes, valor FROM indice_precos ORDER BY mes", conn)
+    conn.close()
+    return df
+
+def salvar_indice_precos(df_indice: pd.DataFrame) -> int:
+    """Substitui o índice de preços. Levanta ValueError se algum mês ou valor for inválido."""
+    df = df_indice[['mes', 'valor']].dropna(how='all')
+    meses = df['mes'].astype(str).str.strip()
+    valores = pd.to_numeric(df['valor'], errors='coerce')
+    invalidos = df[~meses.str.match(_RE_MES) | ~(valores > 0)]
+    if not invalidos.empty:
+        raise ValueError(f"Linhas inválidas no índice (mês deve ser AAAA-MM e valor maior que zero): {invalidos.to_dict('records')}")
+    if meses.duplicated().any():
+        raise ValueError(f"Meses repetidos no índice: {sorted(set(meses[meses.duplicated()]))}")
+    _garantir_tabelas()
+    return executar_escrita(_substituir_indice_precos, list(zip(meses, valores.astype(float))))
+
+def _substituir_indice_precos(conn: sqlite3.Connection, linhas: list) -> int:
+    conn.execute("DELETE FROM indice_precos")
+    conn.executemany("INSERT INTO indice_precos (mes, valor) VALUES (?, ?)", linhas)
+    _incrementar_versao(conn, "indice_precos")
+    return len(linhas)
+
+FONTES_PRECOS_ATUAIS = ("itens_orcamento", "mapa_itens", "indice_precos")
+TABELAS_PRECOS_ATUAIS = {True: "precos_atuais", False: "precos_atuais_base_quente"}  # por historico_completo
+
+def _atualizar_precos_atuais(conn: sqlite3.Connection, historico_completo: bool = True) -> None:
+    tabela = TABELAS_PRECOS_ATUAIS[historico_completo]
+    fonte = _fonte_desatualizada(conn, tabela, *FONTES_PRECOS_ATUAIS)
+    if fonte is None:
+        return
+    historico = _fonte_historico(conn) if historico_completo else "main.itens_orcamento"
+    df = pd.read_sql_query(f"""
+        SELECT m.item_padrao, io.importado_em, io.valor_unitario
+        FROM {historico} io
+        JOIN mapa_itens m ON io.descricao = m.descricao_original
+        WHERE m.item_padrao IS NOT NULL AND io.preco_atipico IS NOT 1
+    """, conn)
+    datas = pd.to_datetime(df['importado_em'], format='ISO8601', errors='coerce')
+    fatores = series_precos.fatores_correcao(datas, pd.read_sql_query("SELECT mes, valor FROM indice_precos", conn))
+    conn.execute(f"DELETE FROM {tabela}")
+    for janela in series_precos.JANELAS_MESES:
+        atuais = series_precos.precos_atuais(df['item_padrao'], datas, df['valor_unitario'], janela, fatores)
+        atuais = atuais.assign(janela_meses=janela, ultima_data=atuais['ultima_data'].astype(str))[
+            ['item_padrao', 'janela_meses', 'preco_atual', 'preco_atual_corrigido', 'amostras', 'ultima_data', 'tendencia_anual_perc']
+        ]
+        conn.executemany(f"""
+            INSERT INTO {tabela} (item_padrao, janela_meses, preco_atual, preco_atual_corrigido, amostras, ultima_data, tendencia_anual_perc)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, atuais.astype(object).where(atuais.notna(), None).itertuples(index=False, name=None))
+    _registrar_fonte(conn, tabela, fonte)
+
+def consultar_precos_atuais(janela_meses: int = 12, historico_completo: bool = False) -> pd.DataFrame:
+    """
+    Preço atual de cada item na janela pedida (uma de series_precos.JANELAS_MESES);
+    com historico_completo=True, calculado também sobre as obras arquivadas.
+    """
+    _garantir_tabelas()
+    tabela = TABELAS_PRECOS_ATUAIS[historico_completo]
+    conn = _conectar()
+    try:
+        _atualizar_pela_fila(conn, tabela, FONTES_PRECOS_ATUAIS, _atualizar_precos_atuais, historico_completo)
+        return pd.read_sql_query(f"SELECT * FROM {tabela} WHERE janela_meses = ? ORDER BY item_padrao", conn, params=(janela_meses,))
+    finally:
+        conn.close()
+
+# --- Arquivo de Obras Antigas ----------------------------------------------- #
+# Obras cuja última importação é anterior a uma data de corte saem de itens_orcamento
+# e vão para um único banco de arquivo, data/archive/orcamentos_arquivo.db, com o ano
+# da última importação da obra em ano_arquivo. Um só banco anexado por conexão, longe
+# do limite de 10 do SQLite, qualquer que seja o número de anos arquivados. O dia a dia
+# (Dashboard, snapshot, Rentabilidade) lê só a base quente; as consultas com
+# historico_completo=True anexam o arquivo (ATTACH) e leem a união. A conexão de
+# escrita também o anexa, e todos os resumos (margens, cubo, preços atuais e resumo de
+# preços) continuam calculados sobre o histórico inteiro.
+PASTA_ARQUIVO = "archive"
+NOME_ARQUIVO_OBRAS = "orcamentos_arquivo.db"
+ESQUEMA_ARQUIVO = "arquivo"
+
+def _caminho_arquivo(caminho_db: Path = None) -> Path:
+    return Path(caminho_db or DB_PATH).parent / PASTA_ARQUIVO / NOME_ARQUIVO_OBRAS
+
+def _arquivo_anexado(conn: sqlite3.Connection) -> bool:
+    return any(nome == ESQUEMA_ARQUIVO for _, nome, _ in conn.execute("PRAGMA database_list").fetchall())
+
+def _anexar_arquivo(conn: sqlite3.Connection, caminho_db: Path = None, criar: bool = False) -> bool:
+    """Anexa (fora de transação) o banco de arquivo, se existir ou se 'criar'. Retorna se está anexado."""
+    caminho = _caminho_arquivo(caminho_db)
+    if not _arquivo_anexado(conn) and (criar or caminho.exists()):
+        conn.execute(f"ATTACH DATABASE ? AS {ESQUEMA_ARQUIVO}", (str(caminho),))
+    return _arquivo_anexado(conn)
+
+def _colunas(conn: sqlite3.Connection, esquema: str) -> list:
+    return [coluna[1] for coluna in conn.execute(f"PRAGMA {esquema}.table_info(itens_orcamento)").fetchall()]
+
+def _fonte_historico(conn: sqlite3.Connection) -> str:
+    """
+    Origem do histórico para o FROM: itens_orcamento, ou a união com o arquivo se ele
+    estiver anexado a esta conexão. Colunas criadas depois do arquivo vêm como NULL.
+    """
+    if not _arquivo_anexado(conn) or not _colunas(conn, ESQUEMA_ARQUIVO):
+        return "itens_orcamento"
+    colunas = _colunas(conn, "main")
+    existentes = set(_colunas(conn, ESQUEMA_ARQUIVO))
+    selecao = ", ".join(c if c in existentes else f"NULL AS {c}" for c in colunas)
+    return (f"(SELECT {', '.join(colunas)} FROM main.itens_orcamento"
+            f" UNION ALL SELECT {selecao} FROM {ESQUEMA_ARQUIVO}.itens_orcamento)")
+
+def _obras_do_historico(conn: sqlite3.Connection) -> str:
+    """
+    Subconsulta com os nomes de obra distintos da base quente e, se anexado, do arquivo.
+    O UNION lê o índice de nome_obra de cada base, sem montar a união das linhas.
+    """
+    if not _arquivo_anexado(conn) or not _colunas(conn, ESQUEMA_ARQUIVO):
+        return "(SELECT DISTINCT nome_obra FROM main.itens_orcamento)"
+    return (f"(SELECT nome_obra FROM main.itens_orcamento"
+            f" UNION SELECT nome_obra FROM {ESQUEMA_ARQUIVO}.itens_orcamento)")
+
+def _conectar_historico(completo: bool) -> tuple:
+    """Conexão de leitura e a origem do histórico (só a base quente, ou com os arquivos)."""
+    conn = _conectar()
+    if completo:
+        _anexar_arquivo(conn)
+    return conn, _fonte_historico(conn)
+
+def _fontes_dos_resumos() -> dict:
+    """
+    Tabelas derivadas do histórico completo e as tabelas de origem de cada uma: o
+    arquivamento não as altera. As da base quente ficam de fora (ver _fontes_das_derivadas).
+    """
+    return {"resumo_precos_item": FONTES_RESUMO_PRECOS, "precos_atuais": FONTES_PRECOS_ATUAIS,
+            **{tabela: fontes for tabela, (fontes, _) in _DERIVADAS_POR_OBRA.items()}}
+
+def _fontes_das_derivadas() -> dict:
+    """Todas as tabelas derivadas, inclusive as calculadas só sobre a base quente."""
+    return {**_fontes_dos_resumos(), TABELAS_PRECOS_ATUAIS[False]: FONTES_PRECOS_ATUAIS}
+
+def _conciliar_com_arquivos(conn: sqlite3.Connection) -> None:
+    """
+    Depois de restaurar um backup anterior a um arquivamento: as linhas que já estão
+    no arquivo saem da base quente (a união não as conta duas vezes) e a sequência
+    de ids passa dos ids arquivados (AUTOINCREMENT; um id nunca se repete entre as bases).
+    """
+    if not _arquivo_anexado(conn) or not _colunas(conn, ESQUEMA_ARQUIVO):
+        return
+    conn.execute(f"DELETE FROM main.itens_orcamento WHERE id IN (SELECT id FROM {ESQUEMA_ARQUIVO}.itens_orcamento)")
+    maior_id = conn.execute(f"SELECT MAX(id) FROM {ESQUEMA_ARQUIVO}.itens_orcamento").fetchone()[0]
+    if maior_id is None:
+        return
+    if conn.execute("SELECT 1 FROM main.sqlite_sequence WHERE name = 'itens_orcamento'").fetchone():
+        conn.execute("UPDATE main.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'itens_orcamento'", (maior_id,))
+    else:
+        conn.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('itens_orcamento', ?)", (maior_id,))
+
+def _data_de_corte(antes_de) -> str:
+    # importado_em é gravado como texto ISO: a comparação com AAAA-MM-DD é por ordem alfabética.
+    return pd.Timestamp(antes_de).strftime("%Y-%m-%d")
+
+_SQL_OBRAS_PARA_ARQUIVAR = """
+    SELECT nome_obra, MAX(nome_cliente) AS nome_cliente, MAX(importado_em) AS ultima_importacao, COUNT(*) AS linhas
+    FROM main.itens_orcamento WHERE nome_obra IS NOT NULL
+    GROUP BY nome_obra HAVING MAX(importado_em) < ?
+    ORDER BY ultima_importacao
+"""
+
+def consultar_obras_para_arquivar(antes_de) -> pd.DataFrame:
+    """Obras da base quente cuja última importação é anterior a 'antes_de' (data ou texto AAAA-MM-DD)."""
+    _garantir_tabelas()
+    conn = _conectar()
+    df = pd.read_sql_query(_SQL_OBRAS_PARA_ARQUIVAR, conn, params=(_data_de_corte(antes_de),))
+    conn.close()
+    return df
+
+def _arquivar_obras(conn: sqlite3.Connection, corte: str, caminho_db: Path) -> dict:
+    obras_por_ano = {}
+    for obra, _, ultima, _ in conn.execute(_SQL_OBRAS_PARA_ARQUIVAR, (corte,)).fetchall():
+        obras_por_ano.setdefault(int(str(ultima)[:4]), []).append(obra)
+    if not obras_por_ano:
+        return {}
+    caminho = _caminho_arquivo(caminho_db)
+    arquivo_novo = not caminho.exists()
+    caminho.parent.mkdir(exist_ok=True)
+    try:
+        _anexar_arquivo(conn, caminho_db, criar=True)
+        conn.execute("BEGIN IMMEDIATE")
+        resumos_em_dia = {tabela: fontes for tabela, fontes in _fontes_dos_resumos().items()
+                          if _fonte_desatualizada(conn, tabela, *fontes) is None}
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {ESQUEMA_ARQUIVO}.itens_orcamento AS SELECT * FROM main.itens_orcamento WHERE 0")
+        if "ano_arquivo" not in _colunas(conn, ESQUEMA_ARQUIVO):
+            conn.execute(f"ALTER TABLE {ESQUEMA_ARQUIVO}.itens_orcamento ADD COLUMN ano_arquivo INTEGER")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {ESQUEMA_ARQUIVO}.idx_arquivo_id ON itens_orcamento(id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {ESQUEMA_ARQUIVO}.idx_arquivo_obra ON itens_orcamento(nome_obra)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {ESQUEMA_ARQUIVO}.idx_arquivo_descricao ON itens_orcamento(descricao)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {ESQUEMA_ARQUIVO}.idx_arquivo_ano ON itens_orcamento(ano_arquivo)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {ESQUEMA_ARQUIVO}.idx_arquivo_preco_atipico ON itens_orcamento(preco_atipico) WHERE preco_atipico = 1")
+        existentes = set(_colunas(conn, ESQUEMA_ARQUIVO))
+        comuns = ", ".join(c for c in _colunas(conn, "main") if c in existentes)
+        for ano, obras in obras_por_ano.items():
+            for inicio in range(0, len(obras), TAMANHO_BLOCO_SQL):
+                bloco = obras[inicio:inicio + TAMANHO_BLOCO_SQL]
+                marcadores = ", ".join("?" * len(bloco))
+                # OR IGNORE pelo id: rearquivar uma obra que ficou nas duas bases não duplica linhas.
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO {ESQUEMA_ARQUIVO}.itens_orcamento ({comuns}, ano_arquivo)
+                    SELECT {comuns}, ? FROM main.itens_orcamento WHERE nome_obra IN ({marcadores})
+                """, (ano, *bloco))
+                conn.execute(f"DELETE FROM main.itens_orcamento WHERE nome_obra IN ({marcadores})", bloco)
+        _incrementar_versao(conn, "itens_orcamento", "arquivo_obras")
+        # A união base quente + arquivo não mudou: os resumos que estavam em dia continuam em dia.
+        for tabela, fontes in resumos_em_dia.items():
+            _registrar_fonte(conn, tabela, _soma_versoes(conn, *fontes))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        # O arquivo só fica no disco se a cópia deu certo.
+        if arquivo_novo:
+            if _arquivo_anexado(conn):
+                conn.execute(f"DETACH DATABASE {ESQUEMA_ARQUIVO}")
+            caminho.unlink(missing_ok=True)
+        raise
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        conn.executescript("PRAGMA incremental_vacuum;")
+    return {ano: len(obras) for ano, obras in obras_por_ano.items()}
+
+def arquivar_obras_antigas(antes_de) -> dict:
+    """
+    Move para o banco de arquivo as obras cuja última importação é anterior a
+    'antes_de'. Retorna {ano: nº de obras arquivadas}.
+    """
+    _garantir_tabelas()
+    arquivadas = _fila_escrita.executar_isolada(DB_PATH, _arquivar_obras, _data_de_corte(antes_de), DB_PATH)
+    if arquivadas:
+        print(f"Obras arquivadas por ano: {arquivadas}")
+    return arquivadas
+
+def consultar_arquivos() -> pd.DataFrame:
+    """Um registro por ano arquivado: ano, nº de obras e de linhas."""
+    colunas = ["ano", "obras", "linhas"]
+    caminho = _caminho_arquivo()
+    if not caminho.exists():
+        return pd.DataFrame(columns=colunas)
+    conn = sqlite3.connect(caminho)
+    try:
+        return pd.read_sql_query("""
+            SELECT ano_arquivo AS ano, COUNT(DISTINCT nome_obra) AS obras, COUNT(*) AS linhas
+            FROM itens_orcamento GROUP BY ano_arquivo ORDER BY ano_arquivo
+        """, conn)
+    except pd.errors.DatabaseError:
+        return pd.DataFrame(columns=colunas)
+    finally:
+        conn.close()
+
+def tamanho_arquivo_mb() -> float:
+    """Tamanho do banco de arquivo em MB (0 se ainda não existe)."""
+    caminho = _caminho_arquivo()
+    return caminho.stat().st_size / (1024 * 1024) if caminho.exists() else 0.0
+
+
+# --- Tabelas Derivadas por Obra -------------------------------------------- #
+# Resumos do histórico particionados por obra (fato_margem_obra, cubo_vendas). Cada um
+# é definido pelas tabelas de origem e por um INSERT ... SELECT com um {filtro}.
+# Importações, orçamentos gerados e novos mapeamentos refazem só as obras que tocaram
+# (leitura indexada por nome_obra); qualquer outra mudança nas origens deixa o resumo
+# desatualizado e ele é refeito por inteiro na próxima consulta. A atualização por
+# obra só acontece se o resumo estava em dia antes da escrita, para não esconder uma
+# reconstrução pendente.
+_DERIVADAS_POR_OBRA = {}
+
+def _derivadas_em_dia(conn: sqlite3.Connection) -> set:
+    return {tabela for tabela, (fontes, _) in _DERIVADAS_POR_OBRA.items()
+            if _fonte_desatualizada(conn, tabela, *fontes) is None}
+
+def _atualizar_derivadas_das_obras(conn: sqlite3.Connection, obras: list, em_dia: set) -> None:
+    """Refaz, só para estas obras, os resumos que estavam em dia (chamar depois de incrementar as versões)."""
+    obras = [o for o in set(obras) if o is not None]
+    for tabela in em_dia:
+        fontes, sql = _DERIVADAS_POR_OBRA[tabela]
+        for inicio in range(0, len(obras), TAMANHO_BLOCO_SQL):
+            bloco = obras[inicio:inicio + TAMANHO_BLOCO_SQL]
+            marcadores = ", ".join("?" * len(bloco))
+            conn.execute(f"DELETE FROM {tabela} WHERE nome_obra IN ({marcadores})", bloco)
+            conn.execute(sql.format(historico=_fonte_historico(conn), filtro=f"AND io.nome_obra IN ({marcadores})"), bloco)
+        _registrar_fonte(conn, tabela, _soma_versoes(conn, *fontes))
+
+def _obras_afetadas_por_mapeamento(conn: sqlite3.Connection, descricoes: list, itens_com_grupo_alterado: list = ()) -> list:
+    """
+    Obras com linhas destas descrições. O grupo de um item vem da linha do mapa em que
+    a descrição é o próprio item; se essa linha mudou de grupo, entram também as obras
+    com linhas mapeadas para o item.
+    """
+    historico = _fonte_historico(conn)
+    obras = _consultar_em_blocos(conn, f"SELECT DISTINCT nome_obra FROM {historico} WHERE descricao IN ({{}})", list(set(descricoes)))
+    obras += _consultar_em_blocos(conn, f"""
+        SELECT DISTINCT io.nome_obra FROM mapa_itens m
+        JOIN {historico} io ON io.descricao = m.descricao_original
+        WHERE m.item_padrao IN ({{}})
+    """, [i for i in set(itens_com_grupo_alterado) if i is not None])
+    return [obra for (obra,) in obras]
+
+def _atualizar_derivada(conn: sqlite3.Connection, tabela: str) -> None:
+    """Refaz o resumo inteiro se alguma origem mudou fora das atualizações por obra."""
+    fontes, sql = _DERIVADAS_POR_OBRA[tabela]
+    fonte = _fonte_desatualizada(conn, tabela, *fontes)
+    if fonte is None:
+        return
+    conn.execute(f"DELETE FROM {tabela}")
+    conn.execute(sql.format(historico=_fonte_historico(conn), filtro=""))
+    _registrar_fonte(conn, tabela, fonte)
+
+
+# --- Margem por Obra -------------------------------------------------------- #
+# fato_margem_obra guarda, por obra e item padrão, receita vendida, custo (quantidade ×
+# custo unitário vigente na data da venda, ver "Custos no Tempo") e margem. A margem
+# compara só a receita das linhas que têm custo cadastrado.
+FONTES_FATO_MARGEM = ("itens_orcamento", "mapa_itens", "historico_custos", "grupos_servico")
+_SQL_FATO_MARGEM = """
+    INSERT INTO fato_margem_obra
+        (nome_obra, item_padrao, nome_grupo, nome_cliente, linhas, quantidade, receita, receita_com_custo, custo, margem)
+    SELECT
+        io.nome_obra, m.item_padrao, COALESCE(g.nome_grupo, 'Sem Grupo'), MAX(io.nome_cliente),
+        COUNT(*), SUM(io.quantidade), SUM(COALESCE(io.valor_total, io.quantidade * io.valor_unitario)),
+        SUM(CASE WHEN b.id_versao IS NOT NULL THEN COALESCE(io.valor_total, io.quantidade * io.valor_unitario) END),
+        SUM(CASE WHEN b.id_versao IS NOT NULL THEN io.quantidade * (COALESCE(b.custo_material, 0) + COALESCE(b.custo_mao_de_obra, 0)) END),
+        SUM(CASE WHEN b.id_versao IS NOT NULL THEN COALESCE(io.valor_total, io.quantidade * io.valor_unitario)
+                 - io.quantidade * (COALESCE(b.custo_material, 0) + COALESCE(b.custo_mao_de_obra, 0)) END)
+    FROM {historico} io
+    JOIN mapa_itens m ON io.descricao = m.descricao_original
+    LEFT JOIN mapa_itens mg ON mg.descricao_original = m.item_padrao
+    LEFT JOIN grupos_servico g ON g.id_grupo = mg.id_grupo
+    LEFT JOIN historico_custos b ON b.item_padrao_nome = m.item_padrao AND """ + _SQL_CUSTO_VIGENTE.format(data="io.importado_em") + """
+    WHERE m.item_padrao IS NOT NULL AND io.nome_obra IS NOT NULL AND io.preco_atipico IS NOT 1 {filtro}
+    GROUP BY io.nome_obra, m.item_padrao
+"""
+_DERIVADAS_POR_OBRA["fato_margem_obra"] = (FONTES_FATO_MARGEM, _SQL_FATO_MARGEM)
+
+def _consultar_fato_margem(sql: str, parametros: tuple = ()) -> pd.DataFrame:
+    _garantir_tabelas()
+    conn = _conectar()
+    try:
+        _atualizar_pela_fila(conn, "fato_margem_obra", FONTES_FATO_MARGEM, _atualizar_derivada, "fato_margem_obra")
+        df = pd.read_sql_query(sql, conn, params=parametros)
+    finally:
+        conn.close()
+    df['margem_perc'] = (df['margem'] / df['receita_com_custo'].replace(0, np.nan) * 100).fillna(0)
+    return df
+
+def consultar_margem_por_obra() -> pd.DataFrame:
+    """Receita, custo e margem de cada obra (orçamento)."""
+    return _consultar_fato_margem("""
+        SELECT nome_obra, MAX(nome_cliente) AS nome_cliente, COUNT(*) AS itens, SUM(linhas) AS linhas,
+               SUM(receita) AS receita, SUM(receita_com_custo) AS receita_com_custo,
+               SUM(custo) AS custo, SUM(margem) AS margem
+        FROM fato_margem_obra GROUP BY nome_obra ORDER BY nome_obra
+    """)
+
+def consultar_margem_por_grupo(nome_obra: str = None) -> pd.DataFrame:
+    """Receita, custo e margem por grupo de serviço, de todas as obras ou de uma só."""
+    filtro, parametros = ("WHERE nome_obra = ?", (nome_obra,)) if nome_obra else ("", ())
+    return _consultar_fato_margem(f"""
+        SELECT nome_grupo, COUNT(DISTINCT nome_obra) AS obras, COUNT(*) AS itens,
+               SUM(receita) AS receita, SUM(receita_com_custo) AS receita_com_custo,
+               SUM(custo) AS custo, SUM(margem) AS margem
+        FROM fato_margem_obra {filtro} GROUP BY nome_grupo ORDER BY nome_grupo
+    """, parametros)
+
+def consultar_margem_itens_da_obra(nome_obra: str) -> pd.DataFrame:
+    """Linhas do fato de uma obra: uma por item padrão."""
+    return _consultar_fato_margem("SELECT * FROM fato_margem_obra WHERE nome_obra = ? ORDER BY nome_grupo, item_padrao", (nome_obra,))
+
+# --- Cubo de Vendas --------------------------------------------------------- #
+# Agregados pré-calculados do histórico nas dimensões grupo × obra × cliente × mês
+# (mês de importado_em). Linhas sem mapeamento entram em 'Sem Grupo'. As consultas
+# fatiam e consolidam só o cubo, sem voltar a itens_orcamento.
+DIMENSOES_CUBO = ("nome_grupo", "nome_obra", "nome_cliente", "mes")
+FONTES_CUBO = ("itens_orcamento", "mapa_itens", "grupos_servico")
+_SQL_CUBO = """
+    INSERT INTO cubo_vendas (nome_grupo, nome_obra, nome_cliente, mes, linhas, quantidade, receita, preco_min, preco_max)
+    SELECT
+        COALESCE(g.nome_grupo, 'Sem Grupo'), io.nome_obra, COALESCE(io.nome_cliente, 'Sem Cliente'),
+        COALESCE(strftime('%Y-%m', io.importado_em), 'Sem Data'),
+        COUNT(*), SUM(io.quantidade), SUM(COALESCE(io.valor_total, io.quantidade * io.valor_unitario)),
+        MIN(io.valor_unitario), MAX(io.valor_unitario)
+    FROM {historico} io
+    LEFT JOIN mapa_itens m ON io.descricao = m.descricao_original
+    LEFT JOIN mapa_itens mg ON mg.descricao_original = m.item_padrao
+    LEFT JOIN grupos_servico g ON g.id_grupo = mg.id_grupo
+    WHERE io.nome_obra IS NOT NULL AND io.preco_atipico IS NOT 1 {filtro}
+    GROUP BY 1, 2, 3, 4
+"""
+_DERIVADAS_POR_OBRA["cubo_vendas"] = (FONTES_CUBO, _SQL_CUBO)
+
+def consultar_cubo(dimensoes: tuple = ("nome_grupo",), filtros: dict = None) -> pd.DataFrame:
+    """
+    Consolida o cubo nas dimensões pedidas (sem dimensões: total geral), depois de
+    fatiar por 'filtros' ({dimensão: valor ou lista de valores}). Medidas: linhas,
+    quantidade e receita somadas, menor e maior preço unitário.
+    """
+    filtros = filtros or {}
+    desconhecidas = [d for d in (*dimensoes, *filtros) if d not in DIMENSOES_CUBO]
+    if desconhecidas:
+        raise ValueError(f"Dimensões desconhecidas: {desconhecidas}. Disponíveis: {', '.join(DIMENSOES_CUBO)}.")
+    condicoes, parametros = [], []
+    for dimensao, valor in filtros.items():
+        valores = list(valor) if isinstance(valor, (list, tuple, set)) else [valor]
+        condicoes.append(f"{dimensao} IN ({', '.join('?' * len(valores))})")
+        parametros.extend(valores)
+    colunas = ", ".join(dimensoes)
+    sql = f"""
+        SELECT {colunas + ',' if colunas else ''}
+               SUM(linhas) AS linhas, SUM(quantidade) AS quantidade, SUM(receita) AS receita,
+               MIN(preco_min) AS preco_min, MAX(preco_max) AS preco_max
+        FROM cubo_vendas
+        {'WHERE ' + ' AND '.join(condicoes) if condicoes else ''}
+        {'GROUP BY ' + colunas + ' ORDER BY ' + colunas if colunas else ''}
+    """
+    _garantir_tabelas()
+    conn = _conectar()
+    try:
+        _atualizar_pela_fila(conn, "cubo_vendas", FONTES_CUBO, _atualizar_derivada, "cubo_vendas")
+        df = pd.read_sql_query(sql, conn, params=parametros)
+    finally:
+        conn.close()
+    return df.dropna(subset=['linhas']) if not colunas else df
+
+# Estatísticas de preço de venda (nome em estatistica_precos -> coluna da rentabilidade).
+COLUNAS_ESTATISTICAS_PRECO = {
+    'media': 'preco_venda_medio', 'mediana': 'preco_venda_mediana', 'p10': 'preco_venda_p10',
+    'p25': 'preco_venda_p25', 'p75': 'preco_venda_p75', 'p90': 'preco_venda_p90',
+    'media_aparada': 'preco_venda_media_aparada', 'media_ponderada': 'preco_venda_media_ponderada',
+}
+
+def consultar_dados_rentabilidade(incluir_atipicos: bool = False, historico_completo: bool = False) -> pd.DataFrame:
     """
     Busca e consolida dados de custos e preços de venda para análise de rentabilidade.
+    Linhas com preço atípico ainda não revisado ficam fora, a menos que incluir_atipicos=True.
+    Com historico_completo=True, as estatísticas de preço incluem as obras arquivadas.
     """
     _garantir_tabelas()
     if not DB_PATH.exists():
         return pd.DataFrame()
 
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn, historico = _conectar_historico(historico_completo)
 
         query_custos = """
         SELECT 
@@ -558,17 +1774,42 @@ def consultar_dados_rentabilidade() -> pd.DataFrame:
         df_custos = pd.read_sql_query(query_custos, conn)
         df_custos = df_custos.rename(columns={'item_padrao_nome': 'item_padrao'})
 
-        query_precos = """
-        SELECT
-            m.item_padrao,
-            AVG(io.valor_unitario) as preco_venda_medio,
-            COUNT(DISTINCT io.nome_obra) as num_orcamentos
-        FROM itens_orcamento io
+        # As linhas de preço vêm sem agregação: mediana, percentis e médias aparada e
+        # ponderada são calculados de uma vez para todos os itens (estatistica_precos).
+        # Cada linha traz a receita (como em fato_margem_obra) e o custo unitário vigente
+        # na data da venda (NULL se não havia).
+        query_precos = f"""
+        SELECT m.item_padrao, io.valor_unitario, io.quantidade, io.nome_obra,
+               COALESCE(io.valor_total, io.quantidade * io.valor_unitario) AS receita,
+               CASE WHEN b.id_versao IS NOT NULL THEN COALESCE(b.custo_material, 0) + COALESCE(b.custo_mao_de_obra, 0) END AS custo_na_venda
+        FROM {historico} io
         JOIN mapa_itens m ON io.descricao = m.descricao_original
-        WHERE m.item_padrao IS NOT NULL
-        GROUP BY m.item_padrao
+        LEFT JOIN historico_custos b ON b.item_padrao_nome = m.item_padrao AND {_SQL_CUSTO_VIGENTE.format(data="io.importado_em")}
+        WHERE m.item_padrao IS NOT NULL AND (? OR io.preco_atipico IS NOT 1)
         """
-        df_precos_agregado = pd.read_sql_query(query_precos, conn)
+        df_precos = pd.read_sql_query(query_precos, conn, params=(int(incluir_atipicos),))
+        estatisticas = estatistica_precos.estatisticas_por_item(df_precos['item_padrao'], df_precos['valor_unitario'], df_precos['quantidade'])
+        df_precos_agregado = estatisticas.drop(columns='amostras').rename(
+            columns={c: COLUNAS_ESTATISTICAS_PRECO[c] for c in estatisticas.columns if c in COLUNAS_ESTATISTICAS_PRECO})
+        df_precos_agregado['num_orcamentos'] = df_precos_agregado['item_padrao'].map(
+            df_precos.dropna(subset=['valor_unitario']).groupby('item_padrao')['nome_obra'].nunique())
+        # Margem ponderada pela quantidade, como em fato_margem_obra: Σ(receita − q × custo) / Σ receita.
+        vendas_com_custo = df_precos.dropna(subset=['valor_unitario', 'custo_na_venda']).assign(
+            margem_linha=lambda d: d['receita'] - d['quantidade'] * d['custo_na_venda']).groupby('item_padrao')
+        df_precos_agregado['custo_medio_na_venda'] = df_precos_agregado['item_padrao'].map(vendas_com_custo['custo_na_venda'].mean())
+        df_precos_agregado['margem_na_venda_perc'] = df_precos_agregado['item_padrao'].map(
+            vendas_com_custo['margem_linha'].sum() / vendas_com_custo['receita'].sum().replace(0, np.nan) * 100)
+
+        # Preços atuais (últimos 6 e 12 meses), do resumo materializado sobre o mesmo histórico
+        tabela_atuais = TABELAS_PRECOS_ATUAIS[historico_completo]
+        _atualizar_pela_fila(conn, tabela_atuais, FONTES_PRECOS_ATUAIS, _atualizar_precos_atuais, historico_completo)
+        atuais = pd.read_sql_query(f"SELECT item_padrao, janela_meses, preco_atual, preco_atual_corrigido, tendencia_anual_perc FROM {tabela_atuais}", conn)
+        for janela in series_precos.JANELAS_MESES:
+            da_janela = atuais[atuais['janela_meses'] == janela].set_index('item_padrao')
+            df_precos_agregado[f'preco_venda_atual_{janela}m'] = df_precos_agregado['item_padrao'].map(da_janela['preco_atual'])
+            df_precos_agregado[f'preco_venda_atual_{janela}m_corrigido'] = df_precos_agregado['item_padrao'].map(da_janela['preco_atual_corrigido'])
+        df_precos_agregado['tendencia_anual_perc'] = df_precos_agregado['item_padrao'].map(
+            atuais[atuais['janela_meses'] == max(series_precos.JANELAS_MESES)].set_index('item_padrao')['tendencia_anual_perc'])
 
         query_grupos = """
         SELECT DISTINCT
@@ -589,8 +1830,11 @@ def consultar_dados_rentabilidade() -> pd.DataFrame:
         df_final['margem_bruta_perc'] = (df_final['margem_bruta_rs'] / df_final['preco_venda_medio'].replace(0, np.nan)).replace([np.inf, -np.inf], 0) * 100
         
         df_final.fillna({
-            'preco_venda_medio': 0,
+            **{coluna: 0 for coluna in COLUNAS_ESTATISTICAS_PRECO.values()},
+            **{f'preco_venda_atual_{janela}m{sufixo}': 0 for janela in series_precos.JANELAS_MESES for sufixo in ('', '_corrigido')},
             'num_orcamentos': 0,
+            'custo_medio_na_venda': 0,
+            'margem_na_venda_perc': 0,
             'margem_bruta_rs': 0,
             'margem_bruta_perc': 0,
             'nome_grupo': 'Sem Grupo'
@@ -598,7 +1842,11 @@ def consultar_dados_rentabilidade() -> pd.DataFrame:
 
         colunas_ordenadas = [
             'item_padrao', 'nome_grupo', 'unidade_de_medida', 'custo_total_unitario', 
-            'preco_venda_medio', 'num_orcamentos', 'margem_bruta_rs', 'margem_bruta_perc'
+            'preco_venda_medio', 'num_orcamentos', 'margem_bruta_rs', 'margem_bruta_perc',
+            'custo_medio_na_venda', 'margem_na_venda_perc',
+            *[coluna for coluna in COLUNAS_ESTATISTICAS_PRECO.values() if coluna != 'preco_venda_medio'],
+            *[f'preco_venda_atual_{janela}m{sufixo}' for janela in series_precos.JANELAS_MESES for sufixo in ('', '_corrigido')],
+            'tendencia_anual_perc'
         ]
         # Garante que todas as colunas existam antes de reordenar
         df_final = df_final.reindex(columns=colunas_ordenadas, fill_value=0)
@@ -608,4 +1856,12 @@ def consultar_dados_rentabilidade() -> pd.DataFrame:
 
     except Exception as e:
         print(f"Erro ao consultar dados de rentabilidade: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+
+# --- Instrumentação ---
+# Todas as funções públicas acima passam a registrar chamadas, latência e linhas (ver scripts/instrumentacao.py).
+instrumentacao.instrumentar_modulo(
+    sys.modules[__name__],
+    retornam_contagem=("salvar_na_base", "salvar_mapeamentos_em_lote", "salvar_orcamento_gerado")
+)
@@ -0,0 +1,68 @@
+# scripts/reconhecedor_custos.py
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from scripts.normalizacao import limpar_texto, normalizar_serie
+
+# --- Reconhecimento do Esquema da Planilha de Custos ------------------------ #
+# Dicionário robusto para reconhecer vários nomes de colunas possíveis
+MAPA_COLUNAS_CUSTOS = {
+    'item': 'item_padrao_nome', 'descricao': 'item_padrao_nome', 'descrição': 'item_padrao_nome',
+    'unidade de medida': 'unidade_de_medida', 'unidade': 'unidade_de_medida', 'unid': 'unidade_de_medida',
+    'custo material': 'custo_material', 'custo m.o.': 'custo_mao_de_obra',
+    'homem hora profissional': 'homem_hora_profissional', 'homem hora ajudante': 'homem_hora_ajudante',
+    'codigo composicao': 'codigo_composicao', 'n manual': 'numero_manual', 'nº manual': 'numero_manual',
+    'peso item': 'peso_item',
+    'grupo': 'grupo', 'grupo de servico': 'grupo', 'grupo composicao': 'grupo', 'grupo composição': 'grupo'
+}
+SCORE_MINIMO_GRUPO = 85
+
+# Aliases normalizados calculados uma única vez; em caso de colisão vale o primeiro, como no laço antigo.
+ALIASES_NORMALIZADOS = {}
+for _chave, _coluna in MAPA_COLUNAS_CUSTOS.items():
+    ALIASES_NORMALIZADOS.setdefault(limpar_texto(_chave), _coluna)
+
+
+def mapear_colunas_custos(colunas) -> dict:
+    """Mapeia cada cabeçalho da planilha para o nome interno (ou mantém o original se não reconhecido)."""
+    return {col: ALIASES_NORMALIZADOS.get(limpar_texto(col), col) for col in colunas}
+
+def _como_texto(serie: pd.Series) -> pd.Series:
+    """Nulos viram None e o restante vira str (a planilha pode trazer grupos numéricos)."""
+    return serie.astype(object).where(serie.notna(), None).map(lambda x: x if x is None or isinstance(x, str) else str(x))
+
+def preparar_base_custos(df_bruto: pd.DataFrame) -> pd.DataFrame:
+    """Renomeia as colunas reconhecidas e limpa a coluna 'grupo' (vazios viram NA)."""
+    df = df_bruto.rename(columns=mapear_colunas_custos(df_bruto.columns))
+    if 'grupo' in df.columns:
+        df['grupo'] = normalizar_serie(_como_texto(df['grupo'])).replace('', pd.NA)
+    return df
+
+def reconhecer_grupos(grupos_planilha: pd.Series, lista_grupos: list, score_minimo: int = SCORE_MINIMO_GRUPO) -> pd.DataFrame:
+    """
+    Reconhece o grupo de serviço de cada linha. Cada valor distinto da coluna é comparado
+    uma única vez com todos os grupos do sistema (matriz RapidFuzz 'cdist' com fuzz.ratio)
+    e o resultado é espalhado de volta para as linhas.
+    Retorna um DataFrame alinhado ao índice da entrada com as colunas
+    'grupo_reconhecido' (None se abaixo de score_minimo) e 'score' (0 sem grupo na planilha).
+    """
+    resultado = pd.DataFrame({'grupo_reconhecido': None, 'score': 0}, index=grupos_planilha.index)
+    if grupos_planilha.empty or not lista_grupos:
+        return resultado
+
+    valores = normalizar_serie(_como_texto(grupos_planilha))
+    codigos, unicos = pd.factorize(valores)
+    grupos_limpos = [limpar_texto(g) for g in lista_grupos]
+    matriz = process.cdist(list(unicos), grupos_limpos, scorer=fuzz.ratio, workers=-1)
+    melhores = matriz.argmax(axis=1)
+    scores = np.rint(matriz[np.arange(len(unicos)), melhores]).astype(int)
+
+    grupo_por_unico = np.array([lista_grupos[j] if s >= score_minimo else None for j, s in zip(melhores, scores)], dtype=object)
+    # Valores vazios (sem grupo na planilha) não são comparados.
+    vazio = np.array([u == "" for u in unicos])
+    grupo_por_unico[vazio] = None
+    scores[vazio] = 0
+    resultado['grupo_reconhecido'] = grupo_por_unico[codigos]
+    resultado['score'] = scores[codigos]
+    return resultado
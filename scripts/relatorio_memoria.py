@@ -0,0 +1,67 @@
+# scripts/relatorio_memoria.py
+import argparse
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from scripts import processador, dados_sinteticos
+
+# --- Relatório de Memória do Histórico -------------------------------------- #
+# Uso: python -m scripts.relatorio_memoria [--linhas 1000000]
+# Cria um banco sintético temporário e compara a memória (e o tamanho do pickle,
+# que é o que o st.cache_data guarda) do histórico carregado de três formas.
+VARIANTES = [
+    ("original (object/float64)", dict(compacto=False)),
+    ("compacto (categorias)", dict(compacto=True)),
+    ("compacto + pyarrow", dict(compacto=True, dtype_backend="pyarrow")),
+]
+
+
+def _megabytes(num_bytes: int) -> float:
+    return num_bytes / (1024 * 1024)
+
+def medir(caminho_db: Path) -> list:
+    resultados = []
+    with dados_sinteticos.usando_banco(caminho_db):
+        for nome, opcoes in VARIANTES:
+            inicio = time.perf_counter()
+            df = processador.consultar_itens_com_mapeamento(**opcoes)
+            tempo = time.perf_counter() - inicio
+            resultados.append({
+                "variante": nome, "linhas": len(df), "tempo_s": tempo,
+                "memoria_mb": _megabytes(df.memory_usage(deep=True).sum()),
+                "pickle_mb": _megabytes(len(pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))),
+                "por_coluna": {col: _megabytes(v) for col, v in df.memory_usage(deep=True, index=False).items()},
+                "tipos": {col: str(t) for col, t in df.dtypes.items()},
+            })
+    return resultados
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compara a memória do histórico original e compactado.")
+    parser.add_argument("--linhas", type=int, default=1_000_000, help="Nº de linhas do histórico sintético.")
+    parser.add_argument("--obras", type=int, default=200)
+    parser.add_argument("--por-coluna", action="store_true", help="Mostra também a memória de cada coluna.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = Path(pasta) / "sintetico.db"
+        print(f"Gerando banco sintético com {args.linhas} linhas...")
+        dados_sinteticos.criar_banco_sintetico(caminho, args.linhas, num_obras=args.obras)
+        resultados = medir(caminho)
+
+    base = resultados[0]
+    print(f"\n{'Variante':<28}{'Memória':>12}{'Pickle':>12}{'Redução':>10}{'Leitura':>10}")
+    for r in resultados:
+        print(f"{r['variante']:<28}{r['memoria_mb']:>9.1f} MB{r['pickle_mb']:>9.1f} MB"
+              f"{base['memoria_mb'] / max(r['memoria_mb'], 1e-9):>9.1f}x{r['tempo_s']:>9.2f}s")
+    if args.por_coluna:
+        for r in resultados:
+            print(f"\n{r['variante']}:")
+            for col, mb in r['por_coluna'].items():
+                print(f"  {col:<18}{r['tipos'][col]:<28}{mb:>9.2f} MB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
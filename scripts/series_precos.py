@@ -0,0 +1,94 @@
+# scripts/series_precos.py
+import numpy as np
+import pandas as pd
+
+from scripts import estatistica_precos
+
+# --- Séries Temporais de Preço ---------------------------------------------- #
+# Funções vetorizadas (sem acesso ao banco) sobre o histórico de preços datado por
+# 'importado_em'. Com um índice de preços mensal (tabela indice_precos), cada preço
+# pode ser corrigido para o nível do mês mais recente do índice antes das estatísticas.
+JANELAS_MESES = (6, 12)
+DIAS_POR_MES = 30.4375
+MIN_PONTOS_TENDENCIA = 3
+
+
+def _dias(janela_meses: int) -> str:
+    return f"{round(janela_meses * DIAS_POR_MES)}D"
+
+def _numero_mes(datas) -> np.ndarray:
+    """Mês como inteiro (ano*12 + mês - 1); NaN para datas ausentes."""
+    datas = pd.to_datetime(pd.Series(datas), errors='coerce')
+    return (datas.dt.year * 12 + datas.dt.month - 1).to_numpy(dtype=float)
+
+def fatores_correcao(datas, indice: pd.DataFrame) -> np.ndarray:
+    """
+    Fator que leva um preço da sua data ao nível do mês mais recente do índice
+    (colunas 'mes' no formato AAAA-MM e 'valor'). Meses sem índice usam o último
+    mês anterior disponível (ou o primeiro, para datas antes do início); sem índice, 1.
+    """
+    meses = _numero_mes(datas)
+    if indice is None or indice.empty:
+        return np.ones(len(meses))
+    indice = indice.assign(numero=_numero_mes(pd.to_datetime(indice['mes'], format='%Y-%m'))).sort_values('numero')
+    numeros, valores = indice['numero'].to_numpy(), indice['valor'].to_numpy(dtype=float)
+    posicao = np.clip(np.searchsorted(numeros, np.nan_to_num(meses, nan=numeros[-1]), side='right') - 1, 0, len(numeros) - 1)
+    return valores[-1] / valores[posicao]
+
+def medianas_moveis(chaves, datas, valores, janela_meses: int = 12) -> pd.DataFrame:
+    """
+    Para cada linha, a mediana dos preços do mesmo item nos 'janela_meses' anteriores
+    (inclusive a própria data). Um único rolling por tempo agrupado, ordenado por (item, data).
+    """
+    df = pd.DataFrame({
+        'item_padrao': np.asarray(chaves, dtype=object),
+        'data': pd.to_datetime(pd.Series(datas), errors='coerce').to_numpy(),
+        'valor': pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float),
+    }).dropna().sort_values(['item_padrao', 'data'], kind='stable')
+    if df.empty:
+        return df.assign(mediana_movel=pd.Series(dtype=float))
+    moveis = df.groupby('item_padrao', sort=False).rolling(_dias(janela_meses), on='data')['valor'].median()
+    df['mediana_movel'] = moveis.to_numpy()
+    return df.reset_index(drop=True)
+
+def precos_atuais(chaves, datas, valores, janela_meses: int = 12, fatores=None) -> pd.DataFrame:
+    """
+    Preço "atual" de cada item: mediana dos preços nos 'janela_meses' que terminam na
+    observação mais recente do item, nominal e corrigida pelos 'fatores' (se houver).
+    A tendência anual (%) é a inclinação da reta do log10 do preço corrigido contra o
+    tempo, dentro da mesma janela, calculada por somas agrupadas.
+    """
+    colunas = ['item_padrao', 'preco_atual', 'preco_atual_corrigido', 'amostras', 'ultima_data', 'tendencia_anual_perc']
+    df = pd.DataFrame({
+        'item_padrao': np.asarray(chaves, dtype=object),
+        'data': pd.to_datetime(pd.Series(datas), errors='coerce').to_numpy(),
+        'valor': pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float),
+        'fator': np.ones(len(chaves)) if fatores is None else np.asarray(fatores, dtype=float),
+    }).dropna()
+    if df.empty:
+        return pd.DataFrame(columns=colunas)
+    ultima = df.groupby('item_padrao', sort=False)['data'].transform('max')
+    df = df[df['data'] > ultima - pd.Timedelta(_dias(janela_meses))]
+    df = df.assign(corrigido=df['valor'] * df['fator'])
+
+    nominal = estatistica_precos.estatisticas_por_item(df['item_padrao'], df['valor'])
+    corrigido = estatistica_precos.estatisticas_por_item(df['item_padrao'], df['corrigido'])
+    resultado = pd.DataFrame({
+        'item_padrao': nominal['item_padrao'],
+        'preco_atual': nominal['mediana'].to_numpy(),
+        'preco_atual_corrigido': corrigido.set_index('item_padrao')['mediana'].reindex(nominal['item_padrao']).to_numpy(),
+        'amostras': nominal['amostras'].to_numpy(),
+    }).set_index('item_padrao')
+    resultado['ultima_data'] = df.groupby('item_padrao', sort=False)['data'].max()
+
+    # Mínimos quadrados por item: inclinação = (n·Σty − Σt·Σy) / (n·Σt² − (Σt)²), t em anos.
+    t = (df['data'] - df['data'].min()).dt.total_seconds().to_numpy() / (365.25 * 86400)
+    y = estatistica_precos.log_precos(df['corrigido'])
+    pontos = pd.DataFrame({'item_padrao': df['item_padrao'].to_numpy(), 't': t, 'y': y}).dropna()
+    pontos = pontos.assign(ty=pontos['t'] * pontos['y'], tt=pontos['t'] ** 2)
+    somas = pontos.groupby('item_padrao', sort=False).agg(n=('t', 'size'), st=('t', 'sum'), sy=('y', 'sum'), sty=('ty', 'sum'), stt=('tt', 'sum'))
+    denominador = somas['n'] * somas['stt'] - somas['st'] ** 2
+    valido = (somas['n'] >= MIN_PONTOS_TENDENCIA) & (denominador > 1e-12)
+    inclinacao = (somas['n'] * somas['sty'] - somas['st'] * somas['sy']) / denominador.where(valido)
+    resultado['tendencia_anual_perc'] = (10 ** inclinacao - 1) * 100
+    return resultado.reset_index()[colunas]
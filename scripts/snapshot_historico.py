@@ -0,0 +1,123 @@
+# scripts/snapshot_historico.py
+import json
+import os
+import threading
+import uuid
+import pandas as pd
+import pyarrow as pa
+
+from scripts import processador
+
+# --- Snapshot Arrow do Histórico -------------------------------------------- #
+# O histórico mapeado (consultar_itens_com_mapeamento) é gravado em um arquivo Arrow
+# IPC em data/snapshots/. Os leitores abrem o arquivo com pyarrow.memory_map, sem
+# copiá-lo para a memória do processo, e o DataFrame resultante fica em um único
+# cache do módulo, compartilhado por todas as sessões do Streamlit (o st.cache_data
+# guardaria e devolveria uma cópia por chamada). Cada snapshot leva no arquivo
+# "ponteiro" as versões de itens_orcamento e mapa_itens de que foi gerado; um novo
+# snapshot é gravado em arquivo próprio e só então o ponteiro é trocado com
+# os.replace, de modo que o leitor sempre vê um snapshot inteiro, o antigo ou o novo.
+SNAPSHOT_DIR = processador.DATA_DIR / "snapshots"
+ARQUIVO_PONTEIRO = "historico_atual.json"
+FONTES_SNAPSHOT = ("itens_orcamento", "mapa_itens")
+SNAPSHOTS_MANTIDOS = 2  # o atual e o anterior, que pode ainda estar aberto por um leitor
+
+_lock = threading.Lock()
+_carregado = {"arquivo": None, "df": None}
+
+
+def _caminho_ponteiro():
+    return SNAPSHOT_DIR / ARQUIVO_PONTEIRO
+
+def _ler_ponteiro() -> dict | None:
+    try:
+        with open(_caminho_ponteiro(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _tipo_pandas(tipo: pa.DataType):
+    # Texto fica em colunas Arrow (sem copiar para objetos Python); as colunas de
+    # dicionário viram categorias e os números, arrays numpy, como no histórico compacto.
+    if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+        return pd.ArrowDtype(tipo)
+    return None
+
+def _remover_antigos(atual: str) -> None:
+    arquivos = sorted(SNAPSHOT_DIR.glob("historico_*.arrow"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for caminho in [p for p in arquivos if p.name != atual][SNAPSHOTS_MANTIDOS - 1:]:
+        try:
+            caminho.unlink()
+        except OSError:
+            pass  # no Windows, um arquivo mapeado por outro leitor não pode ser apagado; fica para a próxima
+
+def gerar_snapshot(forcar: bool = False) -> bool:
+    """
+    Grava um novo snapshot se as versões das tabelas de origem mudaram desde o último
+    (ou se 'forcar'). Retorna True se um snapshot novo foi gravado.
+    """
+    with _lock:
+        versoes = list(processador.versoes_dados(*FONTES_SNAPSHOT))
+        ponteiro = _ler_ponteiro()
+        if not forcar and ponteiro and ponteiro.get("versoes") == versoes and (SNAPSHOT_DIR / ponteiro["arquivo"]).exists():
+            return False
+
+        df = processador.consultar_itens_com_mapeamento()
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        SNAPSHOT_DIR.mkdir(exist_ok=True)
+        # O uuid evita reaproveitar o nome de um snapshot de um banco recriado (versões recomeçam do zero).
+        nome = f"historico_{'_'.join(map(str, versoes))}_{uuid.uuid4().hex[:8]}.arrow"
+        temporario = SNAPSHOT_DIR / f".{nome}.tmp"
+        try:
+            with pa.OSFile(str(temporario), "wb") as arquivo, pa.ipc.new_file(arquivo, tabela.schema) as escritor:
+                escritor.write_table(tabela)
+            os.replace(temporario, SNAPSHOT_DIR / nome)
+            ponteiro_tmp = SNAPSHOT_DIR / f".{ARQUIVO_PONTEIRO}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(ponteiro_tmp, "w", encoding="utf-8") as f:
+                json.dump({"arquivo": nome, "versoes": versoes, "linhas": tabela.num_rows}, f)
+            os.replace(ponteiro_tmp, _caminho_ponteiro())
+        except Exception as e:
+            print(f"Não foi possível gravar o snapshot do histórico: {e}")
+            temporario.unlink(missing_ok=True)
+            return False
+        _remover_antigos(nome)
+        print(f"Snapshot do histórico gravado: {nome} ({tabela.num_rows} linhas).")
+        return True
+
+def _abrir(nome: str) -> pd.DataFrame:
+    with pa.memory_map(str(SNAPSHOT_DIR / nome), "r") as origem:
+        tabela = pa.ipc.open_file(origem).read_all()
+    return tabela.to_pandas(types_mapper=_tipo_pandas, split_blocks=True)
+
+def carregar_historico() -> pd.DataFrame:
+    """
+    Histórico mapeado a partir do snapshot atual, gerando-o antes se estiver
+    desatualizado. O frame é compartilhado entre as sessões: não deve ser alterado
+    no lugar (filtrar e atribuir a uma nova variável é seguro).
+    """
+    try:
+        gerar_snapshot()
+        ponteiro = _ler_ponteiro()
+        if not ponteiro:
+            return processador.consultar_itens_com_mapeamento()
+        with _lock:
+            if _carregado["arquivo"] != ponteiro["arquivo"]:
+                _carregado["df"] = _abrir(ponteiro["arquivo"])
+                _carregado["arquivo"] = ponteiro["arquivo"]
+            return _carregado["df"]
+    except Exception as e:
+        print(f"Erro ao ler o snapshot do histórico, consultando o banco: {e}")
+        return processador.consultar_itens_com_mapeamento()
+
+def limpar_snapshots() -> int:
+    """Apaga os snapshots e o ponteiro. Retorna o nº de arquivos removidos."""
+    removidos = 0
+    with _lock:
+        _carregado.update(arquivo=None, df=None)
+        for caminho in list(SNAPSHOT_DIR.glob("historico_*.arrow")) + [_caminho_ponteiro()]:
+            try:
+                caminho.unlink()
+                removidos += 1
+            except OSError:
+                pass
+    return removidos
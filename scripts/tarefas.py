@@ -0,0 +1,254 @@
+# scripts/tarefas.py
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from scripts import processador, agrupamento_descricoes, snapshot_historico
+
+# --- Configuração das Tarefas em Segundo Plano ------------------------------ #
+# As importações longas rodam em threads do próprio processo do Streamlit, fora do
+# script da página: um refresh ou rerun não interrompe o trabalho. O estado de cada
+# tarefa fica na tabela 'jobs', e o lote de dados de entrada em data/jobs/, o que
+# permite retomar a partir do último lote gravado se o servidor for reiniciado.
+JOBS_DIR = processador.DATA_DIR / "jobs"
+TAMANHO_LOTE = 500
+MAX_TAREFAS_SIMULTANEAS = 2
+
+STATUS_PENDENTE = "pendente"
+STATUS_EXECUTANDO = "executando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_ATIVOS = (STATUS_PENDENTE, STATUS_EXECUTANDO)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_TAREFAS_SIMULTANEAS, thread_name_prefix="sio-tarefa")
+_tarefas_ativas = set()
+_lock = threading.Lock()
+
+
+# --- Persistência do estado ------------------------------------------------- #
+def _caminho_payload(id_job: int):
+    return JOBS_DIR / f"job_{id_job}.pkl"
+
+def _atualizar_tarefa(id_job: int, **campos) -> None:
+    campos['atualizado_em'] = datetime.now()
+    if 'resultado' in campos:
+        campos['resultado'] = json.dumps(campos['resultado'], ensure_ascii=False)
+    atribuicoes = ", ".join(f"{coluna} = ?" for coluna in campos)
+    # O progresso é gravado pela fila de escrita, junto (no mesmo commit) com as demais escritas pendentes.
+    processador.executar_escrita(
+        lambda conn: conn.execute(f"UPDATE jobs SET {atribuicoes} WHERE id_job = ?", (*campos.values(), id_job))
+    )
+
+def consultar_tarefa(id_job: int) -> dict | None:
+    processador._garantir_tabelas()
+    conn = processador._conectar()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM jobs WHERE id_job = ?", (id_job,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    tarefa = dict(row)
+    tarefa['parametros'] = json.loads(tarefa['parametros']) if tarefa['parametros'] else {}
+    tarefa['resultado'] = json.loads(tarefa['resultado']) if tarefa['resultado'] else {}
+    return tarefa
+
+def consultar_tarefas_recentes(limite: int = 10) -> list:
+    """Lista as tarefas mais recentes (sem os parâmetros), para acompanhamento na interface."""
+    processador._garantir_tabelas()
+    conn = processador._conectar()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("""
+        SELECT id_job, tipo, status, descricao, progresso, itens_processados, itens_salvos, erro, criado_em, atualizado_em
+        FROM jobs ORDER BY id_job DESC LIMIT ?
+    """, (limite,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+# --- Tipos de tarefa -------------------------------------------------------- #
+# Cada tipo recebe (parametros, payload, resultado) e devolve a lista de etapas
+# (lotes). Cada etapa é uma função sem argumentos que grava seu lote e retorna
+# (itens_processados, itens_salvos); o progresso é registrado após cada uma.
+def _etapas_importar_orcamento(parametros: dict, df, resultado: dict) -> list:
+    def salvar_mapeamentos():
+        for desc, decisao in parametros.get('decisoes', {}).items():
+            processador.salvar_mapeamento(desc, decisao['valor'])
+        return 0, 0
+
+    def salvar_lote(inicio):
+        def etapa():
+            lote = df.iloc[inicio:inicio + TAMANHO_LOTE]
+            salvos = processador.salvar_na_base(
+                df=lote, nome_obra=parametros['nome_obra'],
+                nome_arquivo_original=parametros['arquivo_original'], nome_cliente=parametros['nome_cliente'],
+                hash_arquivo=parametros.get('hash_arquivo')
+            )
+            return len(lote), salvos
+        return etapa
+
+    def salvar_observacao():
+        observacao = parametros.get('observacao')
+        if observacao and observacao.strip():
+            processador.salvar_observacao(nome_obra=parametros['nome_obra'], texto_observacao=observacao)
+        return 0, 0
+
+    return [salvar_mapeamentos] + [salvar_lote(i) for i in range(0, len(df), TAMANHO_LOTE)] + [salvar_observacao]
+
+def _etapas_classificar_grupos(parametros: dict, itens: list, resultado: dict) -> list:
+    grupos_e_descricoes = processador.obter_grupos_e_descricoes()
+
+    def classificar(item_nome):
+        def etapa():
+            resultado[item_nome] = processador.sugerir_grupo_para_item(item_nome, grupos_e_descricoes)
+            return 1, 1 if resultado[item_nome] else 0
+        return etapa
+
+    return [classificar(item) for item in itens]
+
+def _etapas_salvar_custos(parametros: dict, df_custos, resultado: dict) -> list:
+    mapeamento_grupos = parametros.get('mapeamento_grupos', {})
+
+    def salvar_lote(inicio):
+        def etapa():
+            lote = df_custos.iloc[inicio:inicio + TAMANHO_LOTE]
+            # A limpeza da base só acontece junto com o primeiro lote, na mesma transação.
+            processador.salvar_custo_em_lote(
+                df_custos=lote, mapeamento_grupos=mapeamento_grupos,
+                limpar_base_existente=parametros.get('limpar_base_existente', False) and inicio == 0
+            )
+            return len(lote), len(lote)
+        return etapa
+
+    def salvar_lote_incremental(inicio):
+        def etapa():
+            lote = df_custos.iloc[inicio:inicio + TAMANHO_LOTE]
+            contagem = processador.salvar_custos_incremental(lote, mapeamento_grupos)
+            for chave, quantidade in contagem.items():
+                resultado[chave] = resultado.get(chave, 0) + quantidade
+            return len(lote), contagem['novos'] + contagem['alterados']
+        return etapa
+
+    def remover_ausentes():
+        ausentes = processador.comparar_base_custos(df_custos, mapeamento_grupos)['ausentes']
+        resultado['removidos'] = processador.remover_custos(ausentes) if ausentes else 0
+        return 0, 0
+
+    if not parametros.get('incremental'):
+        return [salvar_lote(i) for i in range(0, len(df_custos), TAMANHO_LOTE)]
+    etapas = [salvar_lote_incremental(i) for i in range(0, len(df_custos), TAMANHO_LOTE)]
+    return etapas + [remover_ausentes] if parametros.get('remover_ausentes') else etapas
+
+def _etapas_agrupar_descricoes(parametros: dict, payload, resultado: dict) -> list:
+    def agrupar():
+        grupos = agrupamento_descricoes.propor_agrupamentos(
+            parametros.get('score_minimo', agrupamento_descricoes.SCORE_MINIMO)
+        )
+        resultado['grupos'] = grupos
+        return sum(len(g['descricoes']) for g in grupos), len(grupos)
+
+    return [agrupar]
+
+TIPOS_DE_TAREFA = {
+    "importar_orcamento": _etapas_importar_orcamento,
+    "classificar_grupos": _etapas_classificar_grupos,
+    "salvar_custos": _etapas_salvar_custos,
+    "agrupar_descricoes": _etapas_agrupar_descricoes,
+}
+
+
+# --- Execução --------------------------------------------------------------- #
+def _executar_tarefa(id_job: int) -> None:
+    try:
+        tarefa = consultar_tarefa(id_job)
+        with open(_caminho_payload(id_job), "rb") as f:
+            payload = pickle.load(f)
+        resultado = tarefa['resultado']
+        etapas = TIPOS_DE_TAREFA[tarefa['tipo']](tarefa['parametros'], payload, resultado)
+        processados, salvos = tarefa['itens_processados'], tarefa['itens_salvos']
+        _atualizar_tarefa(id_job, status=STATUS_EXECUTANDO, total_lotes=len(etapas), pid=os.getpid(), erro=None)
+
+        # Retoma a partir do último lote gravado (0 para tarefas novas).
+        for numero_lote in range(tarefa['ultimo_lote'], len(etapas)):
+            proc_lote, salvos_lote = etapas[numero_lote]()
+            processados += proc_lote
+            salvos += salvos_lote
+            _atualizar_tarefa(
+                id_job, ultimo_lote=numero_lote + 1, progresso=(numero_lote + 1) / len(etapas),
+                itens_processados=processados, itens_salvos=salvos, resultado=resultado
+            )
+
+        _atualizar_tarefa(id_job, status=STATUS_CONCLUIDO, progresso=1.0)
+        _caminho_payload(id_job).unlink(missing_ok=True)
+        # Deixa o snapshot do histórico pronto para a próxima leitura (não faz nada se nada mudou).
+        snapshot_historico.gerar_snapshot()
+        print(f"Tarefa {id_job} ({tarefa['tipo']}) concluída: {processados} itens processados, {salvos} salvos.")
+    except Exception as e:
+        print(f"Erro na tarefa {id_job}: {e}")
+        _atualizar_tarefa(id_job, status=STATUS_ERRO, erro=str(e))
+    finally:
+        with _lock:
+            _tarefas_ativas.discard(id_job)
+
+def _agendar(id_job: int) -> None:
+    with _lock:
+        if id_job in _tarefas_ativas:
+            return
+        _tarefas_ativas.add(id_job)
+    _executor.submit(_executar_tarefa, id_job)
+
+def submeter_tarefa(tipo: str, parametros: dict, payload, descricao: str = "") -> int:
+    """
+    Registra uma nova tarefa na tabela 'jobs', grava o payload (DataFrame ou lista)
+    em disco e a agenda para execução em segundo plano. Retorna o id da tarefa.
+    """
+    if tipo not in TIPOS_DE_TAREFA:
+        raise ValueError(f"Tipo de tarefa desconhecido: '{tipo}'.")
+    processador._garantir_tabelas()
+    JOBS_DIR.mkdir(exist_ok=True)
+    agora = datetime.now()
+    id_job = processador.executar_escrita(lambda conn: conn.execute("""
+        INSERT INTO jobs (tipo, status, descricao, parametros, resultado, criado_em, atualizado_em)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (tipo, STATUS_PENDENTE, descricao, json.dumps(parametros, ensure_ascii=False), json.dumps({}), agora, agora)).lastrowid)
+    with open(_caminho_payload(id_job), "wb") as f:
+        pickle.dump(payload, f)
+    _agendar(id_job)
+    return id_job
+
+def _processo_vivo(pid: int | None) -> bool:
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def retomar_tarefas_interrompidas() -> list:
+    """
+    Reagenda tarefas que ficaram 'pendente'/'executando' porque o processo que as
+    rodava terminou (ex.: servidor reiniciado). Pode ser chamada a cada execução da página.
+    """
+    processador._garantir_tabelas()
+    conn = processador._conectar()
+    rows = conn.execute(
+        f"SELECT id_job, pid FROM jobs WHERE status IN ({', '.join('?' * len(STATUS_ATIVOS))})", STATUS_ATIVOS
+    ).fetchall()
+    conn.close()
+    retomadas = []
+    for id_job, pid in rows:
+        with _lock:
+            ja_ativa = id_job in _tarefas_ativas
+        if ja_ativa or _processo_vivo(pid):
+            continue
+        if not _caminho_payload(id_job).exists():
+            _atualizar_tarefa(id_job, status=STATUS_ERRO, erro="Dados de entrada da tarefa não encontrados para retomada.")
+            continue
+        print(f"Retomando tarefa {id_job} a partir do último lote gravado.")
+        _agendar(id_job)
+        retomadas.append(id_job)
+    return retomadas